@@ -178,6 +178,8 @@ def ChargeDeviceToLevel(device, level):
 
 
 def ProvisionDevice(device, options):
+  # Fetches the properties and state used below in a single call.
+  device.UpdateStateCache()
   if options.reboot_timeout:
     reboot_timeout = options.reboot_timeout
   elif (device.build_version_sdk >=
@@ -218,9 +220,9 @@ def ProvisionDevice(device, options):
     device.RunShellCommand('date -s %s' % time.strftime('%Y%m%d.%H%M%S',
                                                         time.gmtime()),
                            as_root=True)
-    props = device.RunShellCommand('getprop')
-    for prop in props:
-      logging.info('  %s' % prop)
+    props = device.UpdateStateCache()
+    for name, value in sorted(props.iteritems()):
+      logging.info('  [%s]: [%s]' % (name, value))
     if options.auto_reconnect:
       PushAndLaunchAdbReboot(device, options.target)
   except (errors.WaitForResponseTimedOutError,
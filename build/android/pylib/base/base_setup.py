@@ -59,4 +59,5 @@ def PushDataDeps(device, device_dir, test_options):
     device.PushChangedFiles([
         (os.path.join(constants.ISOLATE_DEPS_DIR, p),
          '%s/%s' % (device_dir, p))
-        for p in os.listdir(constants.ISOLATE_DEPS_DIR)])
+        for p in os.listdir(constants.ISOLATE_DEPS_DIR)],
+        use_manifests=True)
@@ -7,7 +7,8 @@
 Performs the following steps:
 * Create a test collection factory, using the given tests
   - If sharding: test collection factory returns the same shared test collection
-    to all test runners
+    to all test runners. When durations of the tests are known from previous
+    runs, the tests are batched by expected duration, longest first.
   - If replciating: test collection factory returns a unique test collection to
     each test runner, with the same set of tests in each.
 * Create a test runner for each device.
@@ -18,7 +19,10 @@ Performs the following steps:
 # TODO(jbudorick) Deprecate and remove this class after any relevant parts have
 # been ported to the new environment / test instance model.
 
+import json
 import logging
+import os
+import tempfile
 import threading
 
 from pylib import android_commands
@@ -32,6 +36,19 @@ from pylib.utils import watchdog_timer
 
 DEFAULT_TIMEOUT = 7 * 60  # seven minutes
 
+# Durations of individual tests in previous runs, in milliseconds.
+_TEST_TIMINGS_JSON = os.path.join(
+    constants.DIR_SOURCE_ROOT,
+    os.environ.get('CHROMIUM_OUT_DIR', 'out'),
+    'test_timings.json')
+
+# When scheduling by duration, each batch is expected to take this fraction
+# of the remaining time per runner. Batches thus get smaller towards the end
+# of the run, which keeps runners from idling while one finishes a long batch.
+_BATCH_FRACTION_OF_REMAINING_TIME = 0.5
+# Starting a batch has some overhead, so batches aren't made shorter than this.
+_MIN_BATCH_DURATION_MS = 2000
+
 
 class _ThreadSafeCounter(object):
   """A threadsafe counter."""
@@ -279,6 +296,99 @@ def ApplyMaxPerRun(tests, max_per_run):
   return tests_expanded
 
 
+def _LoadTestTimings():
+  """Returns a dict of test durations in milliseconds from previous runs."""
+  try:
+    with open(_TEST_TIMINGS_JSON, 'r') as f:
+      return json.load(f)
+  except (IOError, ValueError):
+    return {}
+
+
+def _SaveTestTimings(test_run_results):
+  """Records the durations of the tests in |test_run_results|.
+
+  Args:
+    test_run_results: A TestRunResults object.
+  """
+  durations = dict((r.GetName(), r.GetDuration())
+                   for r in test_run_results.GetAll() if r.GetDuration() > 0)
+  if not durations:
+    return
+  timings = _LoadTestTimings()
+  timings.update(durations)
+  try:
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(_TEST_TIMINGS_JSON))
+    with os.fdopen(fd, 'w') as f:
+      json.dump(timings, f)
+    os.rename(temp_path, _TEST_TIMINGS_JSON)
+  except (IOError, OSError) as e:
+    logging.warning('Could not save test timings: %s', e)
+
+
+def ScheduleByDuration(tests, max_per_run, timings, num_runners):
+  """Groups the tests into batches of similar expected duration.
+
+  Batches are ordered longest first and shrink as the expected remaining time
+  does, so that all runners finish at about the same time.
+
+  Args:
+    tests: A list of tests. Strings are treated as ':' separated lists of
+        gtest names and may be split up. Other tests are kept intact.
+    max_per_run: Maximum number of tests to put in any batch.
+    timings: A dict of test durations in milliseconds.
+    num_runners: The number of test runners the batches will be shared by.
+
+  Returns:
+    A list of tests with no more than max_per_run per run, or None if none
+    of the tests have a known duration.
+  """
+  names = []
+  for test_group in tests:
+    if type(test_group) != str:
+      names.append(test_group)
+    else:
+      names.extend(test_group.split(':'))
+
+  known = sorted(timings[n] for n in names
+                 if isinstance(n, basestring) and n in timings)
+  if not known:
+    return None
+  # Assume that tests without a known duration take a typical amount of time.
+  default_duration = known[len(known) / 2]
+
+  def Duration(test):
+    if isinstance(test, basestring):
+      return timings.get(test, default_duration)
+    return default_duration
+
+  tests_with_durations = sorted(((Duration(t), t) for t in names),
+                                key=lambda d: d[0], reverse=True)
+  remaining = sum(d for d, _ in tests_with_durations)
+  batches = []
+  batch = []
+  batch_duration = 0
+  batch_target = 0
+  for duration, test in tests_with_durations:
+    if batch and (type(test) != str or type(batch[0]) != str
+                  or len(batch) >= max_per_run
+                  or batch_duration + duration > batch_target):
+      batches.append(batch)
+      remaining -= batch_duration
+      batch = []
+    if not batch:
+      batch_duration = 0
+      batch_target = max(
+          _MIN_BATCH_DURATION_MS,
+          _BATCH_FRACTION_OF_REMAINING_TIME * remaining / max(1, num_runners))
+    batch.append(test)
+    batch_duration += duration
+  if batch:
+    batches.append(batch)
+
+  return [':'.join(b) if type(b[0]) == str else b[0] for b in batches]
+
+
 def RunTests(tests, runner_factory, devices, shard=True,
              test_timeout=DEFAULT_TIMEOUT, setup_timeout=DEFAULT_TIMEOUT,
              num_retries=2, max_per_run=256):
@@ -307,7 +417,12 @@ def RunTests(tests, runner_factory, devices, shard=True,
     logging.critical('No tests to run.')
     return (base_test_result.TestRunResults(), constants.ERROR_EXIT_CODE)
 
-  tests_expanded = ApplyMaxPerRun(tests, max_per_run)
+  tests_expanded = None
+  if shard:
+    tests_expanded = ScheduleByDuration(
+        tests, max_per_run, _LoadTestTimings(), len(devices))
+  if tests_expanded is None:
+    tests_expanded = ApplyMaxPerRun(tests, max_per_run)
   if shard:
     # Generate a shared TestCollection object for all test runners, so they
     # draw from a common pool of tests.
@@ -328,8 +443,12 @@ def RunTests(tests, runner_factory, devices, shard=True,
                len(tests_expanded), log_string, str(tests_expanded))
   runners = _CreateRunners(runner_factory, devices, setup_timeout)
   try:
-    return _RunAllTests(runners, test_collection_factory,
-                        num_retries, test_timeout, tag_results_with_device)
+    run_results, exit_code = _RunAllTests(
+        runners, test_collection_factory, num_retries, test_timeout,
+        tag_results_with_device)
+    if shard:
+      _SaveTestTimings(run_results)
+    return run_results, exit_code
   finally:
     try:
       _TearDownRunners(runners, setup_timeout)
@@ -7,7 +7,9 @@
 # pylint: disable=W0212
 
 import os
+import shutil
 import sys
+import tempfile
 import unittest
 
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
@@ -74,6 +76,16 @@ class MockRunnerFailTwice(MockRunner):
       return (results, None)
 
 
+class MockRunnerWithDuration(MockRunner):
+  """Reports a duration of 10ms per character of the test name."""
+  def RunTest(self, test):
+    results = base_test_result.TestRunResults()
+    for name in test.split(':'):
+      results.AddResult(base_test_result.BaseTestResult(
+          name, base_test_result.ResultType.PASS, duration=10 * len(name)))
+    return (results, None)
+
+
 class MockRunnerException(MockRunner):
   def RunTest(self, test):
     raise TestException
@@ -125,6 +137,29 @@ class TestFunctions(unittest.TestCase):
         ['A:B', 'C:D', 'E', 'F:G', 'H:I'],
         test_dispatcher.ApplyMaxPerRun(['A:B', 'C:D:E', 'F:G:H:I'], 2))
 
+  def testScheduleByDuration(self):
+    timings = {'A': 100000, 'B': 1000, 'C': 50000, 'D': 1000, 'E': 1000,
+               'F': 50000}
+    self.assertEqual(
+        ['A', 'C', 'F', 'B:D', 'E'],
+        test_dispatcher.ScheduleByDuration(
+            ['A:B:C', 'D:E:F'], 256, timings, 2))
+
+  def testScheduleByDurationMaxPerRun(self):
+    timings = dict((t, 10) for t in 'ABCDEFGH')
+    self.assertEqual(
+        ['A:B', 'C:D', 'E:F', 'G:H'],
+        test_dispatcher.ScheduleByDuration(['A:B:C:D:E:F:G:H'], 2, timings, 1))
+
+  def testScheduleByDurationUnknownTests(self):
+    self.assertEqual(
+        None, test_dispatcher.ScheduleByDuration(['A:B', 'C'], 256, {}, 2))
+    # Unknown tests are assumed to take the median known duration.
+    self.assertEqual(
+        ['A', 'B', 'D', 'C'],
+        test_dispatcher.ScheduleByDuration(
+            ['A:B', 'C:D'], 256, {'A': 100000, 'C': 10000, 'D': 50000}, 4))
+
 
 class TestThreadGroupFunctions(unittest.TestCase):
   """Tests test_dispatcher._RunAllTests and test_dispatcher._CreateRunners."""
@@ -194,6 +229,32 @@ class TestShard(unittest.TestCase):
     self.assertEqual(exit_code, constants.ERROR_EXIT_CODE)
 
 
+class TestShardByDuration(unittest.TestCase):
+  """Tests that test_dispatcher.RunTests records and uses test durations."""
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._test_timings_json = test_dispatcher._TEST_TIMINGS_JSON
+    test_dispatcher._TEST_TIMINGS_JSON = os.path.join(
+        self._temp_dir, 'test_timings.json')
+
+  def tearDown(self):
+    test_dispatcher._TEST_TIMINGS_JSON = self._test_timings_json
+    shutil.rmtree(self._temp_dir)
+
+  def testRecordsTimings(self):
+    results, exit_code = test_dispatcher.RunTests(
+        ['a:bbb', 'cc'], MockRunnerWithDuration, ['0', '1'], shard=True)
+    self.assertEqual(len(results.GetPass()), 3)
+    self.assertEqual(exit_code, 0)
+    self.assertEqual({'a': 10, 'bbb': 30, 'cc': 20},
+                     test_dispatcher._LoadTestTimings())
+    # The whole run is shorter than a single batch.
+    self.assertEqual(
+        ['bbb:cc:a'],
+        test_dispatcher.ScheduleByDuration(
+            ['a:bbb', 'cc'], 256, test_dispatcher._LoadTestTimings(), 2))
+
+
 class TestReplicate(unittest.TestCase):
   """Tests test_dispatcher.RunTests with replication."""
   @staticmethod
@@ -17,12 +17,17 @@ from pylib import cmd_helper
 from pylib import constants
 from pylib.device import decorators
 from pylib.device import device_errors
+from pylib.device import shell_session
 from pylib.utils import timeout_retry
 
 
 _DEFAULT_TIMEOUT = 30
 _DEFAULT_RETRIES = 2
 
+# Longer commands are run with a separate adb shell, since interactive shells
+# may truncate long input lines.
+_MAX_SHELL_SESSION_COMMAND_LENGTH = 1024
+
 
 def _VerifyLocalFileExists(path):
   """Verifies a local file exists.
@@ -104,6 +109,32 @@ class AdbWrapper(object):
                            device_serial=self._device_serial,
                            check_error=check_error)
 
+  # pylint: disable=unused-argument
+  @decorators.WithTimeoutAndRetries
+  def _RunDeviceShellSessionCmd(self, command, timeout=None, retries=None):
+    """Runs a shell command in a long-lived shell session on the device.
+
+    Args:
+      command: A string with the shell command to run.
+      timeout: Timeout in seconds.
+      retries: Number of retries.
+
+    Returns:
+      A (status, output) tuple.
+    """
+    try:
+      return shell_session.RunCommand(
+          self._BuildAdbCmd(['shell'], self._device_serial), command,
+          timeout=timeout_retry.CurrentTimeoutThread().GetRemainingTime())
+    except shell_session.SessionClosedError as e:
+      raise device_errors.AdbCommandFailedError(
+          ['shell', command], e.output, device_serial=self._device_serial)
+  # pylint: enable=unused-argument
+
+  def _CloseShellSessions(self):
+    shell_session.CloseSessions(
+        self._BuildAdbCmd(['shell'], self._device_serial))
+
   def _IterRunDeviceAdbCmd(self, args, timeout):
     """Runs an adb command and returns an iterator over its output lines.
 
@@ -151,6 +182,7 @@ class AdbWrapper(object):
   @classmethod
   def KillServer(cls, timeout=_DEFAULT_TIMEOUT, retries=_DEFAULT_RETRIES):
     cls._RunAdbCmd(['kill-server'], timeout=timeout, retries=retries)
+    shell_session.CloseSessions()
 
   @classmethod
   def StartServer(cls, timeout=_DEFAULT_TIMEOUT, retries=_DEFAULT_RETRIES):
@@ -223,6 +255,9 @@ class AdbWrapper(object):
       timeout: (optional) Timeout per try in seconds.
       retries: (optional) Number of retries to attempt.
 
+    Commands whose exit status is checked run in a shell session that is kept
+    alive between calls, see shell_session.
+
     Returns:
       The output of the shell command as a string.
 
@@ -230,6 +265,15 @@ class AdbWrapper(object):
       device_errors.AdbCommandFailedError: If the exit status doesn't match
         |expect_status|.
     """
+    if (expect_status is not None
+        and len(command) < _MAX_SHELL_SESSION_COMMAND_LENGTH):
+      status, output = self._RunDeviceShellSessionCmd(
+          command, timeout=timeout, retries=retries)
+      if status != expect_status:
+        raise device_errors.AdbShellCommandFailedError(
+            command, output, status=status, device_serial=self._device_serial)
+      return output
+
     if expect_status is None:
       args = ['shell', command]
     else:
@@ -518,6 +562,7 @@ class AdbWrapper(object):
     else:
       cmd = ['reboot']
     self._RunDeviceAdbCmd(cmd, timeout, retries)
+    self._CloseShellSessions()
 
   def Root(self, timeout=_DEFAULT_TIMEOUT, retries=_DEFAULT_RETRIES):
     """Restarts the adbd daemon with root permissions, if possible.
@@ -527,6 +572,8 @@ class AdbWrapper(object):
       retries: (optional) Number of retries to attempt.
     """
     output = self._RunDeviceAdbCmd(['root'], timeout, retries)
+    # Restarting adbd ends the sessions started before.
+    self._CloseShellSessions()
     if 'cannot' in output:
       raise device_errors.AdbCommandFailedError(
           ['root'], output, device_serial=self._device_serial)
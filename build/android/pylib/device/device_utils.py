@@ -13,6 +13,7 @@ import contextlib
 import itertools
 import logging
 import multiprocessing
+import multiprocessing.pool
 import os
 import posixpath
 import re
@@ -30,6 +31,7 @@ from pylib.device import decorators
 from pylib.device import device_errors
 from pylib.device import intent
 from pylib.device import logcat_monitor
+from pylib.device import transfer_stats
 from pylib.device.commands import install_commands
 from pylib.utils import apk_helper
 from pylib.utils import base_error
@@ -42,6 +44,20 @@ from pylib.utils import zip_utils
 
 _DEFAULT_TIMEOUT = 30
 _DEFAULT_RETRIES = 3
+# Changed files larger than this in total are zipped and pushed in chunks of
+# this size, so that the next chunk is zipped while the current one is pushed.
+_ZIP_STREAMING_CHUNK_SIZE = 32 * 1024 * 1024
+
+# Matches a, possibly multi-line, property in the output of getprop.
+_GETPROP_LINE_RE = re.compile(r'^\[(?P<name>[^\]]*)\]: \[(?P<value>.*)\]$',
+                              re.DOTALL)
+
+# Prints, in a single shell call, the state cached by UpdateStateCache: the
+# external storage path, whether adbd has root privileges and all properties.
+_STATE_CACHE_SCRIPT = (
+    'echo $EXTERNAL_STORAGE; '
+    'if ls /root >/dev/null 2>&1; then echo 1; else echo 0; fi; '
+    'getprop')
 
 # A sentinel object for default values
 # TODO(jbudorick,perezju): revisit how default values are handled by
@@ -121,6 +137,21 @@ def _GetTimeStamp():
   return time.strftime('%Y%m%dT%H%M%S', time.localtime())
 
 
+def _ParseGetPropOutput(lines):
+  """Parses the '[name]: [value]' lines printed by getprop into a dict."""
+  props = {}
+  pending = None
+  for line in lines:
+    pending = line if pending is None else '%s\n%s' % (pending, line)
+    match = _GETPROP_LINE_RE.match(pending)
+    if match:
+      props[match.group('name')] = match.group('value')
+      pending = None
+    elif not pending.startswith('['):
+      pending = None
+  return props
+
+
 def _JoinLines(lines):
   # makes sure that the last line is also terminated, and is more memory
   # efficient than first appending an end-line to each line and then joining
@@ -211,6 +242,8 @@ class DeviceUtils(object):
       CommandTimeoutError on timeout.
       DeviceUnreachableError on missing device.
     """
+    if 'has_root' in self._cache:
+      return self._cache['has_root']
     try:
       self.RunShellCommand('ls /root', check_return=True)
       return True
@@ -261,8 +294,8 @@ class DeviceUtils(object):
     if self.IsUserBuild():
       raise device_errors.CommandFailedError(
           'Cannot enable root in user builds.', str(self))
-    if 'needs_su' in self._cache:
-      del self._cache['needs_su']
+    self._cache.pop('needs_su', None)
+    self._cache.pop('has_root', None)
     self.adb.Root()
     self.adb.WaitForDevice()
 
@@ -725,8 +758,8 @@ class DeviceUtils(object):
   @decorators.WithTimeoutAndRetriesDefaults(
       PUSH_CHANGED_FILES_DEFAULT_TIMEOUT,
       PUSH_CHANGED_FILES_DEFAULT_RETRIES)
-  def PushChangedFiles(self, host_device_tuples, timeout=None,
-                       retries=None):
+  def PushChangedFiles(self, host_device_tuples, use_manifests=False,
+                       timeout=None, retries=None):
     """Push files to the device, skipping files that don't need updating.
 
     Args:
@@ -734,6 +767,13 @@ class DeviceUtils(object):
         |host_path| is an absolute path of a file or directory on the host
         that should be minimially pushed to the device, and |device_path| is
         an absolute path of the destination on the device.
+      use_manifests: Whether to record the md5 sums of pushed directories on
+        the device, so that later calls only need to hash the files on the
+        device that were deleted or modified since. Any push through this
+        method invalidates the manifests, but files pushed to these
+        directories by other means while keeping an old modification time
+        (e.g. with adb push) go unnoticed. Only use this for directories
+        that are exclusively managed by this method.
       timeout: timeout in seconds
       retries: number of retries
 
@@ -744,45 +784,85 @@ class DeviceUtils(object):
     """
 
     files = []
+    host_files = []
+    manifests = []
     for h, d in host_device_tuples:
       if os.path.isdir(h):
         self.RunShellCommand(['mkdir', '-p', d], check_return=True)
-      files += self._GetChangedFilesImpl(h, d)
-
-    if not files:
-      return
-
+      changed_files, tuple_host_files, manifest = (
+          self._GetChangedFilesAndManifest(h, d, use_manifest=use_manifests))
+      files += changed_files
+      host_files += tuple_host_files
+      if manifest:
+        manifests.append(manifest)
+
+    if files:
+      md5sum.RemoveDeviceMd5Manifests(self)
+      self._PushChangedFilesWithCheapestStrategy(
+          host_device_tuples, files, host_files)
+
+    for device_dir, hash_tuples in manifests:
+      md5sum.WriteDeviceMd5Manifest(device_dir, hash_tuples, self)
+
+  def _PushChangedFilesWithCheapestStrategy(
+      self, host_device_tuples, files, host_files):
     size = sum(host_utils.GetRecursiveDiskUsage(h) for h, _ in files)
     file_count = len(files)
-    dir_size = sum(host_utils.GetRecursiveDiskUsage(h)
-                   for h, _ in host_device_tuples)
-    dir_file_count = 0
-    for h, _ in host_device_tuples:
-      if os.path.isdir(h):
-        dir_file_count += sum(len(f) for _r, _d, f in os.walk(h))
-      else:
-        dir_file_count += 1
+    dir_size = sum(host_utils.GetRecursiveDiskUsage(h) for h in host_files)
+    dir_file_count = len(host_files)
+    zip_chunk_count = max(1, -(-size // _ZIP_STREAMING_CHUNK_SIZE))
+    stats = transfer_stats.GetStats(str(self))
 
     push_duration = self._ApproximateDuration(
-        file_count, file_count, size, False)
+        file_count, file_count, size, False, stats)
     dir_push_duration = self._ApproximateDuration(
-        len(host_device_tuples), dir_file_count, dir_size, False)
-    zip_duration = self._ApproximateDuration(1, 1, size, True)
+        len(host_device_tuples), dir_file_count, dir_size, False, stats)
+    zip_duration = self._ApproximateDuration(
+        zip_chunk_count, 1, size, True, stats,
+        is_streaming=zip_chunk_count > 1)
 
     self._InstallCommands()
 
+    start_time = time.time()
     if dir_push_duration < push_duration and (
         dir_push_duration < zip_duration or not self._commands_installed):
       self._PushChangedFilesIndividually(host_device_tuples)
+      transfer_stats.RecordPush(
+          str(self), len(host_device_tuples), dir_file_count, dir_size,
+          time.time() - start_time)
     elif push_duration < zip_duration or not self._commands_installed:
       self._PushChangedFilesIndividually(files)
+      transfer_stats.RecordPush(
+          str(self), file_count, file_count, size, time.time() - start_time)
     else:
-      self._PushChangedFilesZipped(files)
+      if zip_chunk_count > 1:
+        self._PushChangedFilesZippedStreaming(files)
+      else:
+        self._PushChangedFilesZipped(files, byte_count=size)
       self.RunShellCommand(
           ['chmod', '-R', '777'] + [d for _, d in host_device_tuples],
           as_root=True, check_return=True)
 
   def _GetChangedFilesImpl(self, host_path, device_path):
+    changed_files, _, _ = self._GetChangedFilesAndManifest(
+        host_path, device_path)
+    return changed_files
+
+  def _GetChangedFilesAndManifest(self, host_path, device_path,
+                                  use_manifest=False):
+    """Finds the files under |host_path| that differ from the device.
+
+    When |host_path| is a directory and |use_manifest| is set, the md5 sums
+    recorded on the device by an earlier push are used, for the files that
+    haven't changed on the device since, instead of hashing them there.
+
+    Returns:
+      A (changed_files, host_files, manifest) tuple. |changed_files| is a list
+      of (host_path, device_path) tuples to push, and |host_files| lists all
+      host files that were compared. |manifest| is a (device_dir, hash_tuples)
+      tuple to record on the device once the changed files are pushed, or
+      None if there is nothing new to record.
+    """
     real_host_path = os.path.realpath(host_path)
     try:
       real_device_path = self.RunShellCommand(
@@ -790,33 +870,51 @@ class DeviceUtils(object):
     except device_errors.CommandFailedError:
       real_device_path = None
     if not real_device_path:
-      return [(host_path, device_path)]
+      if os.path.isdir(host_path):
+        host_files = [os.path.join(root, f)
+                      for root, _, files in os.walk(host_path) for f in files]
+      else:
+        host_files = [host_path]
+      return [(host_path, device_path)], host_files, None
 
     host_hash_tuples = md5sum.CalculateHostMd5Sums([real_host_path])
-    device_paths_to_md5 = (
-        real_device_path if os.path.isfile(real_host_path)
-        else ('%s/%s' % (real_device_path, os.path.relpath(p, real_host_path))
-              for _, p in host_hash_tuples))
-    device_hash_tuples = md5sum.CalculateDeviceMd5Sums(
-        device_paths_to_md5, self)
+    host_files = [h.path for h in host_hash_tuples]
 
     if os.path.isfile(host_path):
+      device_hash_tuples = md5sum.CalculateDeviceMd5Sums(
+          real_device_path, self)
       if (not device_hash_tuples
           or device_hash_tuples[0].hash != host_hash_tuples[0].hash):
-        return [(host_path, device_path)]
+        return [(host_path, device_path)], host_files, None
       else:
-        return []
-    else:
-      device_tuple_dict = dict((d.path, d.hash) for d in device_hash_tuples)
-      to_push = []
-      for host_hash, host_abs_path in (
-          (h.hash, h.path) for h in host_hash_tuples):
-        device_abs_path = '%s/%s' % (
-            real_device_path, os.path.relpath(host_abs_path, real_host_path))
-        if (device_abs_path not in device_tuple_dict
-            or device_tuple_dict[device_abs_path] != host_hash):
-          to_push.append((host_abs_path, device_abs_path))
-      return to_push
+        return [], host_files, None
+
+    def GetDevicePath(host_abs_path):
+      return '%s/%s' % (
+          real_device_path, os.path.relpath(host_abs_path, real_host_path))
+
+    device_tuple_dict = {}
+    if use_manifest:
+      device_tuple_dict = md5sum.ReadDeviceMd5Manifest(real_device_path, self)
+    unverified_paths = [GetDevicePath(p) for p in host_files
+                        if GetDevicePath(p) not in device_tuple_dict]
+    if unverified_paths:
+      device_tuple_dict.update(
+          (d.path, d.hash)
+          for d in md5sum.CalculateDeviceMd5Sums(unverified_paths, self))
+
+    to_push = []
+    device_manifest = []
+    for host_hash, host_abs_path in host_hash_tuples:
+      device_abs_path = GetDevicePath(host_abs_path)
+      device_manifest.append(md5sum.HashAndPath(host_hash, device_abs_path))
+      if (device_abs_path not in device_tuple_dict
+          or device_tuple_dict[device_abs_path] != host_hash):
+        to_push.append((host_abs_path, device_abs_path))
+
+    if not use_manifest or not (to_push or unverified_paths):
+      return to_push, host_files, None
+    return to_push, host_files, (real_device_path, device_manifest)
 
   def _InstallCommands(self):
     if self._commands_installed is None:
@@ -829,7 +927,8 @@ class DeviceUtils(object):
         self._commands_installed = False
 
   @staticmethod
-  def _ApproximateDuration(adb_calls, file_count, byte_count, is_zipping):
+  def _ApproximateDuration(adb_calls, file_count, byte_count, is_zipping,
+                           stats=None, is_streaming=False):
     # We approximate the time to push a set of files to a device as:
     #   t = c1 * a + c2 * f + c3 + b / c4 + b / (c5 * c6), where
     #     t: total time (sec)
@@ -842,43 +941,60 @@ class DeviceUtils(object):
     #     b: total number of bytes (bytes)
     #     c5: transfer rate (bytes/sec)
     #     c6: compression ratio (unitless)
-
+    # When streaming, zipping overlaps with the transfer, so only the slower
+    # of the two counts.
+    #
+    # c1, c4, c5 and c6 are measured for each device (see transfer_stats).
     # All of these are approximations.
-    ADB_CALL_PENALTY = 0.1 # seconds
-    ADB_PUSH_PENALTY = 0.01 # seconds
+    stats = stats or transfer_stats.DEFAULT_STATS
     ZIP_PENALTY = 2.0 # seconds
-    ZIP_RATE = 10000000.0 # bytes / second
-    TRANSFER_RATE = 2000000.0 # bytes / second
-    COMPRESSION_RATIO = 2.0 # unitless
 
-    adb_call_time = ADB_CALL_PENALTY * adb_calls
-    adb_push_setup_time = ADB_PUSH_PENALTY * file_count
+    adb_call_time = stats['adb_call_penalty'] * adb_calls
+    adb_push_setup_time = transfer_stats.ADB_PUSH_PENALTY * file_count
     if is_zipping:
-      zip_time = ZIP_PENALTY + byte_count / ZIP_RATE
-      transfer_time = byte_count / (TRANSFER_RATE * COMPRESSION_RATIO)
+      zip_time = byte_count / stats['zip_rate']
+      transfer_time = byte_count / (
+          stats['transfer_rate'] * stats['compression_ratio'])
+      if is_streaming:
+        transfer_time = max(zip_time, transfer_time)
+        zip_time = 0
+      zip_time += ZIP_PENALTY
     else:
       zip_time = 0
-      transfer_time = byte_count / TRANSFER_RATE
+      transfer_time = byte_count / stats['transfer_rate']
     return adb_call_time + adb_push_setup_time + zip_time + transfer_time
 
   def _PushChangedFilesIndividually(self, files):
     for h, d in files:
       self.adb.Push(h, d)
 
-  def _PushChangedFilesZipped(self, files):
+  def _PushChangedFilesZipped(self, files, byte_count=None):
+    """Pushes |files| to the device in a single zip file.
+
+    Args:
+      files: A list of (host_path, device_path) tuples.
+      byte_count: The total size of |files|. If given, the zip and transfer
+        performance is recorded in transfer_stats.
+    """
     if not files:
       return
 
     with tempfile.NamedTemporaryFile(suffix='.zip') as zip_file:
+      zip_start_time = time.time()
       zip_proc = multiprocessing.Process(
           target=DeviceUtils._CreateDeviceZip,
           args=(zip_file.name, files))
       zip_proc.start()
       zip_proc.join()
+      zip_duration = time.time() - zip_start_time
 
       zip_on_device = '%s/tmp.zip' % self.GetExternalStoragePath()
       try:
+        push_start_time = time.time()
         self.adb.Push(zip_file.name, zip_on_device)
+        if byte_count is not None:
+          self._RecordZippedPush(byte_count, os.path.getsize(zip_file.name),
+                                 zip_duration, time.time() - push_start_time)
         self.RunShellCommand(
             ['unzip', zip_on_device],
             as_root=True,
@@ -890,6 +1006,61 @@ class DeviceUtils(object):
         if self.IsOnline():
           self.RunShellCommand(['rm', zip_on_device], check_return=True)
 
+  def _PushChangedFilesZippedStreaming(self, files):
+    """Pushes |files| to the device in a series of zip files.
+
+    Each zip file holds about _ZIP_STREAMING_CHUNK_SIZE bytes. The next one is
+    created on a background thread while the current one is being pushed and
+    unzipped, and at most two of them exist on the host at any time.
+
+    Args:
+      files: A list of (host_path, device_path) tuples.
+    """
+    chunks = [[]]
+    chunk_sizes = [0]
+    for host_path, device_path in files:
+      if chunk_sizes[-1] >= _ZIP_STREAMING_CHUNK_SIZE:
+        chunks.append([])
+        chunk_sizes.append(0)
+      chunks[-1].append((host_path, device_path))
+      chunk_sizes[-1] += host_utils.GetRecursiveDiskUsage(host_path)
+
+    def CreateZip(index):
+      zip_path = os.path.join(zip_dir, '%d.zip' % index)
+      start_time = time.time()
+      DeviceUtils._CreateDeviceZip(zip_path, chunks[index])
+      return zip_path, time.time() - start_time
+
+    zip_dir = tempfile.mkdtemp()
+    zip_pool = multiprocessing.pool.ThreadPool(1)
+    zip_on_device = '%s/tmp.zip' % self.GetExternalStoragePath()
+    try:
+      pending_zip = zip_pool.apply_async(CreateZip, (0,))
+      for index in xrange(len(chunks)):
+        zip_path, zip_duration = pending_zip.get()
+        if index + 1 < len(chunks):
+          pending_zip = zip_pool.apply_async(CreateZip, (index + 1,))
+        push_start_time = time.time()
+        self.adb.Push(zip_path, zip_on_device)
+        self._RecordZippedPush(chunk_sizes[index], os.path.getsize(zip_path),
+                               zip_duration, time.time() - push_start_time)
+        os.remove(zip_path)
+        self.RunShellCommand(
+            ['unzip', zip_on_device],
+            as_root=True,
+            env={'PATH': '%s:$PATH' % install_commands.BIN_DIR},
+            check_return=True)
+    finally:
+      zip_pool.terminate()
+      shutil.rmtree(zip_dir, ignore_errors=True)
+      if self.IsOnline():
+        self.RunShellCommand(['rm', '-f', zip_on_device], check_return=True)
+
+  def _RecordZippedPush(self, byte_count, zip_size, zip_duration,
+                        push_duration):
+    transfer_stats.RecordZip(str(self), byte_count, zip_size, zip_duration)
+    transfer_stats.RecordPush(str(self), 1, 1, zip_size, push_duration)
+
   @staticmethod
   def _CreateDeviceZip(zip_path, host_device_tuples):
     with zipfile.ZipFile(zip_path, 'w') as zip_file:
@@ -1245,7 +1416,10 @@ class DeviceUtils(object):
         "property_name is not a string: %r" % property_name)
 
     cache_key = '_prop:' + property_name
-    if cache and cache_key in self._cache:
+    # Read-only properties can't change until the next reboot, which clears
+    # the cache.
+    if ((cache or property_name.startswith('ro.'))
+        and cache_key in self._cache):
       return self._cache[cache_key]
     else:
       # timeout and retries are handled down at run shell, because we don't
@@ -1283,8 +1457,7 @@ class DeviceUtils(object):
     assert isinstance(value, basestring), "value is not a string: %r" % value
 
     self.RunShellCommand(['setprop', property_name, value], check_return=True)
-    if property_name in self._cache:
-      del self._cache[property_name]
+    self._cache.pop('_prop:' + property_name, None)
     # TODO(perezju) remove the option and make the check mandatory, but using a
     # single shell script to both set- and getprop.
     if check and value != self.GetProp(property_name):
@@ -1292,6 +1465,40 @@ class DeviceUtils(object):
           'Unable to set property %r on the device to %r'
           % (property_name, value), str(self))
 
+  @decorators.WithTimeoutAndRetriesFromInstance()
+  def UpdateStateCache(self, timeout=None, retries=None):
+    """Reads all properties and some common state of the device at once.
+
+    This takes a single shell call, after which GetProp for cached or
+    read-only properties, the build_* and product_* properties, GetABI,
+    IsUserBuild, GetExternalStoragePath and HasRoot are answered from the
+    cache. The cache is cleared on Reboot; SetProp and EnableRoot drop the
+    values they change.
+
+    Args:
+      timeout: timeout in seconds
+      retries: number of retries
+
+    Returns:
+      A dict with the name and value of all the device's properties.
+
+    Raises:
+      CommandTimeoutError on timeout.
+      DeviceUnreachableError on missing device.
+    """
+    output = self.RunShellCommand(_STATE_CACHE_SCRIPT, check_return=True)
+    if len(output) < 2:
+      raise device_errors.CommandFailedError(
+          'Unexpected device state output: %r' % output, str(self))
+    external_storage, has_root = output[:2]
+    props = _ParseGetPropOutput(output[2:])
+    if external_storage:
+      self._cache['external_storage'] = external_storage
+    self._cache['has_root'] = has_root == '1'
+    for name, value in props.iteritems():
+      self._cache['_prop:' + name] = value
+    return props
+
   @decorators.WithTimeoutAndRetriesFromInstance()
   def GetABI(self, timeout=None, retries=None):
     """Gets the device main ABI.
@@ -16,8 +16,10 @@ import datetime
 import logging
 import os
 import re
+import shutil
 import signal
 import sys
+import tempfile
 import unittest
 
 from pylib import android_commands
@@ -27,6 +29,8 @@ from pylib.device import adb_wrapper
 from pylib.device import device_errors
 from pylib.device import device_utils
 from pylib.device import intent
+from pylib.device import transfer_stats
+from pylib.utils import md5sum
 from pylib.utils import mock_calls
 
 # RunCommand from third_party/android_testrunner/run_command.py is mocked
@@ -946,6 +950,161 @@ class DeviceUtilsSendKeyEventTest(DeviceUtilsTest):
       self.device.SendKeyEvent(66)
 
 
+class DeviceUtilsPushChangedFilesTest(DeviceUtilsTest):
+
+  def testPushChangedFiles_upToDate(self):
+    with self.assertCalls(
+        (self.call.device._GetChangedFilesAndManifest(
+            '/test/host/file', '/test/device/file', use_manifest=False),
+         ([], ['/test/host/file'], None))):
+      self.device.PushChangedFiles([('/test/host/file', '/test/device/file')])
+
+  def testPushChangedFiles_recordsManifest(self):
+    test_files = [('/test/host/dir/file1', '/test/device/dir/file1')]
+    test_manifest = ('/test/device/dir', [
+        md5sum.HashAndPath('0123456789abcdeffedcba9876543210',
+                           '/test/device/dir/file1')])
+    with self.assertCalls(
+        (mock.call.os.path.isdir('/test/host/dir'), True),
+        self.call.device.RunShellCommand(
+            ['mkdir', '-p', '/test/device/dir'], check_return=True),
+        (self.call.device._GetChangedFilesAndManifest(
+            '/test/host/dir', '/test/device/dir', use_manifest=True),
+         (test_files, ['/test/host/dir/file1'], test_manifest)),
+        mock.call.pylib.utils.md5sum.RemoveDeviceMd5Manifests(self.device),
+        self.call.device._PushChangedFilesWithCheapestStrategy(
+            [('/test/host/dir', '/test/device/dir')], test_files,
+            ['/test/host/dir/file1']),
+        mock.call.pylib.utils.md5sum.WriteDeviceMd5Manifest(
+            '/test/device/dir', test_manifest[1], self.device)):
+      self.device.PushChangedFiles([('/test/host/dir', '/test/device/dir')],
+                                   use_manifests=True)
+
+
+class DeviceUtilsGetChangedFilesAndManifestTest(DeviceUtilsTest):
+
+  HOST_HASHES = [
+      md5sum.HashAndPath('0123456789abcdeffedcba9876543210',
+                         '/test/host/dir/file0'),
+      md5sum.HashAndPath('123456789abcdef00fedcba987654321',
+                         '/test/host/dir/file1'),
+  ]
+  HOST_FILES = ['/test/host/dir/file0', '/test/host/dir/file1']
+  DEVICE_HASHES = [
+      md5sum.HashAndPath('0123456789abcdeffedcba9876543210',
+                         '/test/device/dir/file0'),
+      md5sum.HashAndPath('123456789abcdef00fedcba987654321',
+                         '/test/device/dir/file1'),
+  ]
+
+  def _ExpectedCalls(self, device_manifest=None):
+    calls = (
+        (self.call.device.RunShellCommand(
+            ['realpath', '/test/device/dir'], single_line=True,
+            check_return=True),
+         '/test/device/dir'),
+        (mock.call.pylib.utils.md5sum.CalculateHostMd5Sums(
+            ['/test/host/dir']),
+         self.HOST_HASHES))
+    if device_manifest is not None:
+      calls += (
+          (mock.call.pylib.utils.md5sum.ReadDeviceMd5Manifest(
+              '/test/device/dir', self.device),
+           device_manifest),)
+    return calls
+
+  def testGetChangedFilesAndManifest_withoutManifests(self):
+    with self.assertCalls(
+        *(self._ExpectedCalls() + (
+            (mock.call.pylib.utils.md5sum.CalculateDeviceMd5Sums(
+                ['/test/device/dir/file0', '/test/device/dir/file1'],
+                self.device),
+             self.DEVICE_HASHES[:1]),))):
+      self.assertEquals(
+          ([('/test/host/dir/file1', '/test/device/dir/file1')],
+           self.HOST_FILES, None),
+          self.device._GetChangedFilesAndManifest(
+              '/test/host/dir', '/test/device/dir'))
+
+  def testGetChangedFilesAndManifest_noManifest(self):
+    with self.assertCalls(
+        *(self._ExpectedCalls({}) + (
+            (mock.call.pylib.utils.md5sum.CalculateDeviceMd5Sums(
+                ['/test/device/dir/file0', '/test/device/dir/file1'],
+                self.device),
+             self.DEVICE_HASHES[:1]),))):
+      self.assertEquals(
+          ([('/test/host/dir/file1', '/test/device/dir/file1')],
+           self.HOST_FILES, ('/test/device/dir', self.DEVICE_HASHES)),
+          self.device._GetChangedFilesAndManifest(
+              '/test/host/dir', '/test/device/dir', use_manifest=True))
+
+  def testGetChangedFilesAndManifest_upToDateManifest(self):
+    with self.assertCalls(
+        *self._ExpectedCalls(dict((h.path, h.hash)
+                                  for h in self.DEVICE_HASHES))):
+      self.assertEquals(
+          ([], self.HOST_FILES, None),
+          self.device._GetChangedFilesAndManifest(
+              '/test/host/dir', '/test/device/dir', use_manifest=True))
+
+  def testGetChangedFilesAndManifest_modifiedOnDevice(self):
+    # The manifest entry of file1 was left out since the file is newer.
+    with self.assertCalls(
+        *(self._ExpectedCalls({'/test/device/dir/file0':
+                                   '0123456789abcdeffedcba9876543210'}) + (
+            (mock.call.pylib.utils.md5sum.CalculateDeviceMd5Sums(
+                ['/test/device/dir/file1'], self.device),
+             [md5sum.HashAndPath('00000000000000000000000000000000',
+                                 '/test/device/dir/file1')]),))):
+      self.assertEquals(
+          ([('/test/host/dir/file1', '/test/device/dir/file1')],
+           self.HOST_FILES, ('/test/device/dir', self.DEVICE_HASHES)),
+          self.device._GetChangedFilesAndManifest(
+              '/test/host/dir', '/test/device/dir', use_manifest=True))
+
+  def testGetChangedFilesAndManifest_noRealpath(self):
+    test_dir = tempfile.mkdtemp()
+    try:
+      for f in ('file0', 'file1'):
+        open(os.path.join(test_dir, f), 'w').close()
+      with self.assertCall(
+          self.call.device.RunShellCommand(
+              ['realpath', '/test/device/dir'], single_line=True,
+              check_return=True),
+          self.ShellError()):
+        changed_files, host_files, manifest = (
+            self.device._GetChangedFilesAndManifest(
+                test_dir, '/test/device/dir'))
+      self.assertEquals([(test_dir, '/test/device/dir')], changed_files)
+      self.assertEquals(
+          sorted(os.path.join(test_dir, f) for f in ('file0', 'file1')),
+          sorted(host_files))
+      self.assertIsNone(manifest)
+    finally:
+      shutil.rmtree(test_dir)
+
+
+class DeviceUtilsApproximateDurationTest(unittest.TestCase):
+
+  def testApproximateDuration_usesDeviceStats(self):
+    fast_device_stats = dict(transfer_stats.DEFAULT_STATS,
+                             transfer_rate=100000000.0)
+    self.assertLess(
+        device_utils.DeviceUtils._ApproximateDuration(
+            1, 1, 100000000, False, fast_device_stats),
+        device_utils.DeviceUtils._ApproximateDuration(
+            1, 1, 100000000, False))
+
+  def testApproximateDuration_streamingOverlapsZipAndTransfer(self):
+    streaming = device_utils.DeviceUtils._ApproximateDuration(
+        4, 1, 100000000, True, is_streaming=True)
+    not_streaming = device_utils.DeviceUtils._ApproximateDuration(
+        1, 1, 100000000, True)
+    # Zipping 100MB takes 10s by default, which the transfer hides.
+    self.assertAlmostEqual(not_streaming - 10.0 + 0.3, streaming)
+
+
 class DeviceUtilsPushChangedFilesIndividuallyTest(DeviceUtilsTest):
 
   def testPushChangedFilesIndividually_empty(self):
@@ -1346,6 +1505,71 @@ class DeviceUtilsSetPropTest(DeviceUtilsTest):
       with self.assertRaises(device_errors.CommandFailedError):
         self.device.SetProp('test.property', 'new_value', check=True)
 
+  def testSetProp_clearsCache(self):
+    with self.assertCalls(
+        (self.call.adb.Shell('getprop test.property'), 'old_value\n'),
+        (self.call.adb.Shell('setprop test.property new_value'), ''),
+        (self.call.adb.Shell('getprop test.property'), 'new_value\n')):
+      self.assertEqual('old_value',
+                       self.device.GetProp('test.property', cache=True))
+      self.device.SetProp('test.property', 'new_value')
+      self.assertEqual('new_value',
+                       self.device.GetProp('test.property', cache=True))
+
+
+class DeviceUtilsUpdateStateCacheTest(DeviceUtilsTest):
+
+  _STATE_OUTPUT = (
+      '/fake/storage/path\n'
+      '1\n'
+      '[ro.build.type]: [userdebug]\n'
+      '[ro.build.version.sdk]: [19]\n'
+      '[ro.product.cpu.abi]: [armeabi-v7a]\n'
+      '[test.multiline]: [first\n'
+      'second]\n'
+      '[test.property]: [old_value]\n')
+
+  def testUpdateStateCache(self):
+    with self.assertCall(
+        self.call.adb.Shell(device_utils._STATE_CACHE_SCRIPT),
+        self._STATE_OUTPUT):
+      self.assertEqual({'ro.build.type': 'userdebug',
+                        'ro.build.version.sdk': '19',
+                        'ro.product.cpu.abi': 'armeabi-v7a',
+                        'test.multiline': 'first\nsecond',
+                        'test.property': 'old_value'},
+                       self.device.UpdateStateCache())
+    with self.assertCalls():
+      self.assertFalse(self.device.IsUserBuild())
+      self.assertEqual(19, self.device.build_version_sdk)
+      self.assertEqual('armeabi-v7a', self.device.GetABI())
+      self.assertEqual('/fake/storage/path',
+                       self.device.GetExternalStoragePath())
+      self.assertTrue(self.device.HasRoot())
+
+  def testUpdateStateCache_mutableProp(self):
+    with self.assertCalls(
+        (self.call.adb.Shell(device_utils._STATE_CACHE_SCRIPT),
+         self._STATE_OUTPUT),
+        (self.call.adb.Shell('getprop test.property'), 'new_value\n')):
+      self.device.UpdateStateCache()
+      self.assertEqual('old_value',
+                       self.device.GetProp('test.property', cache=True))
+      self.assertEqual('new_value', self.device.GetProp('test.property'))
+      self.assertEqual('new_value',
+                       self.device.GetProp('test.property', cache=True))
+
+  def testUpdateStateCache_noRoot(self):
+    with self.assertCall(
+        self.call.adb.Shell(device_utils._STATE_CACHE_SCRIPT),
+        '\n0\n[ro.build.type]: [user]\n'):
+      self.device.UpdateStateCache()
+    with self.assertCall(self.call.adb.Shell('echo $EXTERNAL_STORAGE'), '\n'):
+      self.assertFalse(self.device.HasRoot())
+      self.assertTrue(self.device.IsUserBuild())
+      with self.assertRaises(device_errors.CommandFailedError):
+        self.device.GetExternalStoragePath()
+
 
 class DeviceUtilsGetPidsTest(DeviceUtilsTest):
 
@@ -0,0 +1,238 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Long-lived shell sessions that run many commands on a device.
+
+Spawning a new 'adb shell' process for every command costs a fork and an adb
+handshake. Instead, commands are written to an interactive shell that stays
+around between calls. The output of each command is framed by sentinels that
+also carry its exit status.
+"""
+
+import atexit
+import collections
+import errno
+import fcntl
+import logging
+import os
+import select
+import subprocess
+import threading
+import time
+import uuid
+
+from pylib.utils import reraiser_thread
+
+# The number of idle sessions kept around per device. Concurrent commands on
+# the same device use separate sessions.
+MAX_IDLE_SESSIONS = 4
+
+_BUFFER_SIZE = 4096
+
+
+class SessionClosedError(Exception):
+  """Raised when a session ends before the command it was running finished."""
+
+  def __init__(self, output, command_started):
+    super(SessionClosedError, self).__init__(
+        'shell session closed unexpectedly')
+    self.output = output
+    self.command_started = command_started
+
+
+class ShellSession(object):
+  """An interactive shell that runs commands one at a time."""
+
+  def __init__(self, shell_cmd):
+    """Starts the shell.
+
+    Args:
+      shell_cmd: The command line that starts an interactive shell, e.g.
+        ['adb', '-s', serial, 'shell'].
+    """
+    self._process = subprocess.Popen(
+        shell_cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT, close_fds=True)
+    fd = self._process.stdout.fileno()
+    fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) |
+                os.O_NONBLOCK)
+    # Interactive shells may echo their input back, so the sentinels are
+    # split by quotes in the command and only appear joined in its output.
+    token = uuid.uuid4().hex
+    self._begin = token + '_B'
+    self._end = token + '_E'
+    self._begin_cmd = 'echo "%s""_B"' % token
+    self._end_cmd = 'echo "%s""_E$?"' % token
+    self._buffer = ''
+    self.reused = False
+
+  def IsAlive(self):
+    return self._process.poll() is None
+
+  def Run(self, command, timeout=None):
+    """Runs a shell command in the session.
+
+    The command runs in a subshell with stdin from /dev/null, so that it can
+    neither change the state of the session nor consume the commands that
+    follow it.
+
+    Args:
+      command: A string with the shell command to run.
+      timeout: (optional) Timeout in seconds.
+
+    Returns:
+      A (status, output) tuple. Like with 'adb shell', the output includes
+      whatever the command wrote to stderr.
+
+    Raises:
+      SessionClosedError: If the shell exited before the command finished.
+      reraiser_thread.TimeoutError: If the command didn't finish in time. The
+        session is not usable anymore afterwards.
+    """
+    end_time = (time.time() + timeout) if timeout is not None else None
+    self._buffer = ''
+    framed = '{ %s; (\n%s\n) </dev/null 2>&1; %s; }\n' % (
+        self._begin_cmd, command, self._end_cmd)
+    try:
+      self._process.stdin.write(framed)
+      self._process.stdin.flush()
+    except (IOError, OSError) as e:
+      if e.errno != errno.EPIPE:
+        raise
+      # Keep whatever the shell said before it went away, e.g. an adb error.
+      while self._ReadChunk(end_time):
+        pass
+      raise SessionClosedError(self._buffer, command_started=False)
+
+    # Drop the echoed command and any prompts along with the sentinel's line.
+    begin = self._ReadUntil(self._begin, end_time, command_started=False)
+    self._buffer = self._buffer[begin:]
+    self._ReadLine(end_time)
+    end = self._ReadUntil(self._end, end_time, command_started=True)
+    output = self._buffer[:end]
+    self._buffer = self._buffer[end + len(self._end):]
+    status = int(self._ReadLine(end_time).strip())
+    return status, output
+
+  def _ReadUntil(self, text, end_time, command_started):
+    """Reads output until |text| shows up and returns where it starts."""
+    while True:
+      index = self._buffer.find(text)
+      if index >= 0:
+        return index
+      if not self._ReadChunk(end_time):
+        raise SessionClosedError(self._buffer, command_started)
+
+  def _ReadLine(self, end_time):
+    """Consumes the buffered output up to the next newline and returns it."""
+    index = self._ReadUntil('\n', end_time, command_started=True)
+    line = self._buffer[:index]
+    self._buffer = self._buffer[index + 1:]
+    return line
+
+  def _ReadChunk(self, end_time):
+    fd = self._process.stdout.fileno()
+    remaining = None
+    if end_time is not None:
+      remaining = end_time - time.time()
+      if remaining <= 0:
+        raise reraiser_thread.TimeoutError('Timed out waiting for the shell')
+    read_fds, _, _ = select.select([fd], [], [], remaining)
+    if not read_fds:
+      raise reraiser_thread.TimeoutError('Timed out waiting for the shell')
+    data = os.read(fd, _BUFFER_SIZE)
+    self._buffer += data
+    return bool(data)
+
+  def Close(self):
+    """Terminates the shell."""
+    try:
+      self._process.stdin.close()
+      self._process.kill()
+    except (IOError, OSError):
+      pass
+    self._process.wait()
+
+
+_idle_sessions = collections.defaultdict(list)
+_pool_lock = threading.Lock()
+
+
+def _AcquireSession(shell_cmd):
+  key = tuple(shell_cmd)
+  with _pool_lock:
+    while _idle_sessions[key]:
+      session = _idle_sessions[key].pop()
+      if session.IsAlive():
+        session.reused = True
+        return session
+      session.Close()
+  return ShellSession(shell_cmd)
+
+
+def _ReleaseSession(shell_cmd, session):
+  key = tuple(shell_cmd)
+  with _pool_lock:
+    if session.IsAlive() and len(_idle_sessions[key]) < MAX_IDLE_SESSIONS:
+      _idle_sessions[key].append(session)
+      return
+  session.Close()
+
+
+def RunCommand(shell_cmd, command, timeout=None):
+  """Runs a shell command in a pooled session.
+
+  Sessions that went away while idle, e.g. because adbd was restarted, are
+  replaced transparently. A session that fails while running a command is
+  discarded and the failure is reported to the caller.
+
+  Args:
+    shell_cmd: The command line that starts an interactive shell.
+    command: A string with the shell command to run.
+    timeout: (optional) Timeout in seconds.
+
+  Returns:
+    A (status, output) tuple.
+
+  Raises:
+    SessionClosedError: If the session ended before the command finished.
+    reraiser_thread.TimeoutError: If the command didn't finish in time.
+  """
+  while True:
+    session = _AcquireSession(shell_cmd)
+    try:
+      result = session.Run(command, timeout=timeout)
+    except SessionClosedError as e:
+      session.Close()
+      if e.command_started or not session.reused:
+        raise
+      logging.info('Shell session went away, starting a new one.')
+      continue
+    except:
+      session.Close()
+      raise
+    _ReleaseSession(shell_cmd, session)
+    return result
+
+
+def CloseSessions(shell_cmd=None):
+  """Closes idle sessions.
+
+  Args:
+    shell_cmd: (optional) Only close the sessions started with this command
+      line. By default all sessions are closed.
+  """
+  with _pool_lock:
+    if shell_cmd is None:
+      keys = _idle_sessions.keys()
+    else:
+      keys = [tuple(shell_cmd)]
+    sessions = []
+    for key in keys:
+      sessions.extend(_idle_sessions.pop(key, []))
+  for session in sessions:
+    session.Close()
+
+
+atexit.register(CloseSessions)
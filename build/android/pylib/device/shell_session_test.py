@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Unit tests for shell_session.py.
+
+A local shell stands in for 'adb shell'.
+"""
+
+# pylint: disable=W0212
+
+import unittest
+
+from pylib.device import shell_session
+from pylib.utils import reraiser_thread
+
+_SHELL_CMD = ['sh']
+
+
+class ShellSessionTest(unittest.TestCase):
+
+  def setUp(self):
+    self.session = shell_session.ShellSession(_SHELL_CMD)
+
+  def tearDown(self):
+    self.session.Close()
+
+  def testRun_output(self):
+    self.assertEquals((0, 'foo\nbar\n'),
+                      self.session.Run('echo foo; echo bar'))
+
+  def testRun_noTrailingNewline(self):
+    self.assertEquals((0, 'foo'), self.session.Run('printf foo'))
+
+  def testRun_status(self):
+    self.assertEquals((3, ''), self.session.Run('exit 3'))
+    self.assertEquals((0, 'still here\n'), self.session.Run('echo still here'))
+
+  def testRun_stderr(self):
+    self.assertEquals((0, 'oops\n'), self.session.Run('echo oops >&2'))
+
+  def testRun_doesNotChangeSessionState(self):
+    self.session.Run('cd /; FOO=bar; export FOO')
+    self.assertEquals((0, '\n'), self.session.Run('echo $FOO'))
+
+  def testRun_doesNotConsumeFollowingCommands(self):
+    self.assertEquals((0, ''), self.session.Run('cat'))
+    self.assertEquals((0, 'next\n'), self.session.Run('echo next'))
+
+  def testRun_commentAndMultipleLines(self):
+    self.assertEquals((0, 'a\nb\n'),
+                      self.session.Run('echo a\necho b # comment'))
+
+  def testRun_timeout(self):
+    with self.assertRaises(reraiser_thread.TimeoutError):
+      self.session.Run('sleep 5', timeout=0.1)
+
+  def testRun_sessionClosed(self):
+    with self.assertRaises(shell_session.SessionClosedError) as cm:
+      self.session.Run('echo bye; kill -9 $$')
+    self.assertTrue(cm.exception.command_started)
+    self.assertEquals('bye\n', cm.exception.output)
+
+
+class RunCommandTest(unittest.TestCase):
+
+  def tearDown(self):
+    shell_session.CloseSessions()
+
+  def testRunCommand_reusesSession(self):
+    shell_session.RunCommand(_SHELL_CMD, 'true')
+    self.assertEquals(1, len(shell_session._idle_sessions[tuple(_SHELL_CMD)]))
+    shell_session.RunCommand(_SHELL_CMD, 'true')
+    self.assertEquals(1, len(shell_session._idle_sessions[tuple(_SHELL_CMD)]))
+
+  def testRunCommand_respawnsIdleSession(self):
+    shell_session.RunCommand(_SHELL_CMD, 'true')
+    session = shell_session._idle_sessions[tuple(_SHELL_CMD)][0]
+    session._process.kill()
+    session._process.wait()
+    self.assertEquals((0, 'foo\n'),
+                      shell_session.RunCommand(_SHELL_CMD, 'echo foo'))
+
+  def testRunCommand_failingShell(self):
+    with self.assertRaises(shell_session.SessionClosedError) as cm:
+      shell_session.RunCommand(['sh', '-c', 'echo error: no device'], 'true')
+    self.assertFalse(cm.exception.command_started)
+    self.assertEquals('error: no device\n', cm.exception.output)
+
+  def testRunCommand_discardsTimedOutSession(self):
+    with self.assertRaises(reraiser_thread.TimeoutError):
+      shell_session.RunCommand(_SHELL_CMD, 'sleep 5', timeout=0.1)
+    self.assertEquals([], shell_session._idle_sessions[tuple(_SHELL_CMD)])
+
+  def testCloseSessions(self):
+    shell_session.RunCommand(_SHELL_CMD, 'true')
+    session = shell_session._idle_sessions[tuple(_SHELL_CMD)][0]
+    shell_session.CloseSessions(_SHELL_CMD)
+    self.assertFalse(session.IsAlive())
+
+
+if __name__ == '__main__':
+  unittest.main(verbosity=2)
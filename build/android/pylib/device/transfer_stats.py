@@ -0,0 +1,122 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Measured file transfer performance of devices, persisted across runs."""
+
+import json
+import logging
+import os
+import threading
+
+from pylib import constants
+
+_TRANSFER_STATS_JSON = os.path.join(
+    constants.DIR_SOURCE_ROOT,
+    os.environ.get('CHROMIUM_OUT_DIR', 'out'),
+    'device_transfer_stats.json')
+
+# Used for devices that haven't been measured yet.
+DEFAULT_STATS = {
+    'adb_call_penalty': 0.1, # seconds
+    'transfer_rate': 2000000.0, # bytes / second
+    'zip_rate': 10000000.0, # bytes / second
+    'compression_ratio': 2.0, # unitless
+}
+
+# Per file overhead of adb push. Too small to be measured reliably.
+ADB_PUSH_PENALTY = 0.01 # seconds
+
+# The weight of a new measurement relative to the previous estimate.
+_SMOOTHING = 0.3
+
+# Note that this only protects against concurrent accesses to the stats
+# within a process.
+_stats_lock = threading.RLock()
+
+
+def _ReadAllStats():
+  try:
+    with open(_TRANSFER_STATS_JSON, 'r') as f:
+      return json.load(f)
+  except (IOError, ValueError):
+    return {}
+
+
+def _UpdateStats(serial, **measurements):
+  with _stats_lock:
+    all_stats = _ReadAllStats()
+    stats = all_stats.setdefault(serial, {})
+    for key, value in measurements.iteritems():
+      previous = stats.get(key, DEFAULT_STATS[key])
+      stats[key] = previous + _SMOOTHING * (value - previous)
+    try:
+      with open(_TRANSFER_STATS_JSON, 'w') as f:
+        json.dump(all_stats, f)
+    except IOError as e:
+      logging.warning('Could not write transfer stats: %s', e)
+
+
+def GetStats(serial):
+  """Gets the estimated transfer performance of a device.
+
+  Args:
+    serial: The serial of the device.
+  Returns:
+    A dict with the same keys as DEFAULT_STATS.
+  """
+  with _stats_lock:
+    stats = dict(DEFAULT_STATS)
+    stats.update(_ReadAllStats().get(serial, {}))
+    return stats
+
+
+def RecordPush(serial, adb_calls, file_count, byte_count, duration):
+  """Records how long pushing files to a device took.
+
+  Depending on whether the duration is dominated by the number of adb calls
+  or by the number of bytes pushed, the measurement refines the estimate of
+  the adb call penalty or of the transfer rate, respectively.
+
+  Args:
+    serial: The serial of the device.
+    adb_calls: The number of times adb push was called.
+    file_count: The number of files pushed.
+    byte_count: The number of bytes pushed.
+    duration: The time the pushes took, in seconds.
+  """
+  if duration <= 0 or not adb_calls:
+    return
+  stats = GetStats(serial)
+  file_time = ADB_PUSH_PENALTY * file_count
+  call_time = stats['adb_call_penalty'] * adb_calls
+  transfer_time = byte_count / stats['transfer_rate']
+  if transfer_time > call_time:
+    # Never attribute less than half of the duration to the transfer.
+    transfer_time = max(duration - call_time - file_time, duration / 2.0)
+    _UpdateStats(serial, transfer_rate=byte_count / transfer_time)
+  else:
+    call_time = max(duration - transfer_time - file_time, 0.0)
+    _UpdateStats(serial, adb_call_penalty=call_time / adb_calls)
+
+
+def RecordZip(serial, byte_count, zipped_byte_count, duration):
+  """Records how long zipping files for a device took and how well it did.
+
+  Args:
+    serial: The serial of the device.
+    byte_count: The number of bytes that were zipped.
+    zipped_byte_count: The size of the resulting zip file.
+    duration: The time zipping took, in seconds.
+  """
+  if duration <= 0 or not byte_count or not zipped_byte_count:
+    return
+  _UpdateStats(serial, zip_rate=byte_count / duration,
+               compression_ratio=float(byte_count) / zipped_byte_count)
+
+
+def ResetStats():
+  """Erases the _TRANSFER_STATS_JSON file if it exists."""
+  with _stats_lock:
+    if os.path.exists(_TRANSFER_STATS_JSON):
+      os.remove(_TRANSFER_STATS_JSON)
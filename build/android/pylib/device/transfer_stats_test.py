@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Unit tests for transfer_stats.py.
+"""
+
+# pylint: disable=W0212
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pylib.device import transfer_stats
+
+
+class TransferStatsTest(unittest.TestCase):
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._stats_json = transfer_stats._TRANSFER_STATS_JSON
+    transfer_stats._TRANSFER_STATS_JSON = os.path.join(
+        self._temp_dir, 'device_transfer_stats.json')
+
+  def tearDown(self):
+    transfer_stats._TRANSFER_STATS_JSON = self._stats_json
+    shutil.rmtree(self._temp_dir)
+
+  def testGetStats_unknownDevice(self):
+    self.assertEquals(transfer_stats.DEFAULT_STATS,
+                      transfer_stats.GetStats('0123456789abcdef'))
+
+  def testRecordPush_largeTransfer(self):
+    # 100MB in 5 seconds, after the call and push penalties, is much faster
+    # than the default rate.
+    for _ in xrange(20):
+      transfer_stats.RecordPush('0123456789abcdef', 1, 1, 100000000, 5.11)
+    stats = transfer_stats.GetStats('0123456789abcdef')
+    self.assertAlmostEquals(20000000, stats['transfer_rate'], delta=100000)
+    self.assertEquals(transfer_stats.DEFAULT_STATS['adb_call_penalty'],
+                      stats['adb_call_penalty'])
+    self.assertEquals(transfer_stats.DEFAULT_STATS,
+                      transfer_stats.GetStats('fedcba9876543210'))
+
+  def testRecordPush_manySmallFiles(self):
+    for _ in xrange(20):
+      transfer_stats.RecordPush('0123456789abcdef', 100, 100, 1000, 3.0)
+    stats = transfer_stats.GetStats('0123456789abcdef')
+    self.assertAlmostEquals(0.02, stats['adb_call_penalty'], delta=0.001)
+    self.assertEquals(transfer_stats.DEFAULT_STATS['transfer_rate'],
+                      stats['transfer_rate'])
+
+  def testRecordZip(self):
+    transfer_stats.RecordZip('0123456789abcdef', 4000000, 1000000, 0.1)
+    stats = transfer_stats.GetStats('0123456789abcdef')
+    self.assertAlmostEquals(
+        transfer_stats.DEFAULT_STATS['compression_ratio'] * 0.7 + 4.0 * 0.3,
+        stats['compression_ratio'])
+    self.assertAlmostEquals(
+        transfer_stats.DEFAULT_STATS['zip_rate'] * 0.7 + 40000000 * 0.3,
+        stats['zip_rate'])
+
+
+if __name__ == '__main__':
+  unittest.main(verbosity=2)
@@ -3,9 +3,12 @@
 # found in the LICENSE file.
 
 import collections
+import hashlib
+import json
 import logging
 import os
 import tempfile
+import threading
 import types
 
 from pylib import cmd_helper
@@ -17,14 +20,85 @@ HashAndPath = collections.namedtuple('HashAndPath', ['hash', 'path'])
 MD5SUM_DEVICE_LIB_PATH = '/data/local/tmp/md5sum/'
 MD5SUM_DEVICE_BIN_PATH = MD5SUM_DEVICE_LIB_PATH + 'md5sum_bin'
 
+MD5SUM_DEVICE_MANIFEST_FORMAT = MD5SUM_DEVICE_LIB_PATH + 'manifest_{key}'
+
+# Prints the entries of the manifest at {manifest} whose file still exists and
+# hasn't been modified since the manifest was written.
+MD5SUM_DEVICE_MANIFEST_SCRIPT_FORMAT = (
+    'test -d {device_dir} -a -f {manifest} && '
+    'while read -r h p; do '
+    'test -f "$p" -a ! "$p" -nt {manifest} && echo "$h  $p"; '
+    'done < {manifest}')
+
+# Hashes the existing files among {paths} with a single md5sum_bin process.
 MD5SUM_DEVICE_SCRIPT_FORMAT = (
-    'test -f {path} -o -d {path} '
-    '&& LD_LIBRARY_PATH={md5sum_lib} {device_pie_wrapper} {md5sum_bin} {path}')
+    'set --; for p in {paths}; do test -f "$p" -o -d "$p" && set -- "$@" "$p"; '
+    'done; test $# -gt 0 '
+    '&& LD_LIBRARY_PATH={md5sum_lib} {device_pie_wrapper} {md5sum_bin} "$@"')
+
+# The number of paths passed to a single md5sum process.
+_MD5SUM_BATCH_SIZE = 500
+
+# MD5 sums of host files from previous runs, as {path: [size, mtime, md5]}.
+# A sum is only used while the size and mtime of its file are unchanged.
+_HOST_MD5_CACHE_JSON = os.path.join(
+    constants.DIR_SOURCE_ROOT,
+    os.environ.get('CHROMIUM_OUT_DIR', 'out'),
+    'host_md5_cache.json')
+
+# Note that this only protects against concurrent updates of the cache within
+# a process.
+_host_md5_cache_lock = threading.Lock()
+
+
+def _LoadHostMd5Cache():
+  try:
+    with open(_HOST_MD5_CACHE_JSON, 'r') as f:
+      return json.load(f)
+  except (IOError, ValueError):
+    return {}
+
+
+def _UpdateHostMd5Cache(new_entries):
+  """Adds |new_entries|, a dict like the cache, to the cache file."""
+  with _host_md5_cache_lock:
+    cache = _LoadHostMd5Cache()
+    cache.update(new_entries)
+    try:
+      fd, temp_path = tempfile.mkstemp(
+          dir=os.path.dirname(_HOST_MD5_CACHE_JSON))
+      with os.fdopen(fd, 'w') as f:
+        json.dump(cache, f)
+      os.rename(temp_path, _HOST_MD5_CACHE_JSON)
+    except (IOError, OSError) as e:
+      logging.warning('Could not save host md5 cache: %s', e)
+
+
+def _IterHostFiles(path):
+  """Yields |path| or, if it is a directory, the files under it.
+
+  Like md5sum_bin_host, this follows symlinks and skips .svn directories.
+  """
+  if not os.path.isdir(path):
+    yield path
+    return
+  for root, dirs, files in os.walk(path, followlinks=True):
+    dirs[:] = sorted(d for d in dirs if d != '.svn')
+    for f in sorted(files):
+      yield os.path.join(root, f)
+
+
+def _Batches(items):
+  for i in xrange(0, len(items), _MD5SUM_BATCH_SIZE):
+    yield items[i:i + _MD5SUM_BATCH_SIZE]
 
 
 def CalculateHostMd5Sums(paths):
   """Calculates the MD5 sum value for all items in |paths|.
 
+  Sums of files that are unchanged since they were last hashed, in this or
+  an earlier run, are looked up rather than calculated.
+
   Args:
     paths: A list of host paths to md5sum.
   Returns:
@@ -33,10 +107,40 @@ def CalculateHostMd5Sums(paths):
   if isinstance(paths, basestring):
     paths = [paths]
 
-  out = cmd_helper.GetCmdOutput(
-      [os.path.join(constants.GetOutDirectory(), 'md5sum_bin_host')] +
-          [p for p in paths])
-  return [HashAndPath(*l.split(None, 1)) for l in out.splitlines()]
+  cache = _LoadHostMd5Cache()
+  hash_tuples = []
+  uncached_paths = []
+  uncached_stats = {}
+  for path in paths:
+    for file_path in _IterHostFiles(path):
+      try:
+        stat = os.stat(file_path)
+      except OSError:
+        # Let md5sum_bin_host report missing files as it always has.
+        uncached_paths.append(file_path)
+        continue
+      entry = cache.get(file_path)
+      if entry and entry[:2] == [stat.st_size, stat.st_mtime]:
+        hash_tuples.append(HashAndPath(entry[2], file_path))
+      else:
+        uncached_paths.append(file_path)
+        uncached_stats[file_path] = stat
+
+  new_entries = {}
+  for batch in _Batches(uncached_paths):
+    out = cmd_helper.GetCmdOutput(
+        [os.path.join(constants.GetOutDirectory(), 'md5sum_bin_host')] + batch)
+    for l in out.splitlines():
+      hash_tuple = HashAndPath(*l.split(None, 1))
+      hash_tuples.append(hash_tuple)
+      stat = uncached_stats.get(hash_tuple.path)
+      if stat:
+        new_entries[hash_tuple.path] = [
+            stat.st_size, stat.st_mtime, hash_tuple.hash]
+  if new_entries:
+    _UpdateHostMd5Cache(new_entries)
+
+  return sorted(hash_tuples, key=lambda h: h.path)
 
 
 def CalculateDeviceMd5Sums(paths, device):
@@ -63,10 +167,11 @@ def CalculateDeviceMd5Sums(paths, device):
       device_pie_wrapper = device.GetDevicePieWrapper()
       md5sum_script = (
           MD5SUM_DEVICE_SCRIPT_FORMAT.format(
-              path=p, md5sum_lib=MD5SUM_DEVICE_LIB_PATH,
+              paths=' '.join(cmd_helper.SingleQuote(p) for p in batch),
+              md5sum_lib=MD5SUM_DEVICE_LIB_PATH,
               device_pie_wrapper=device_pie_wrapper,
               md5sum_bin=MD5SUM_DEVICE_BIN_PATH)
-          for p in paths)
+          for batch in _Batches(list(paths)))
       md5sum_script_file.write('; '.join(md5sum_script))
       md5sum_script_file.flush()
       device.adb.Push(md5sum_script_file.name, md5sum_device_script_file.name)
@@ -74,3 +179,60 @@ def CalculateDeviceMd5Sums(paths, device):
 
   return [HashAndPath(*l.split(None, 1)) for l in out if l]
 
+
+def _GetDeviceManifestPath(device_dir):
+  return MD5SUM_DEVICE_MANIFEST_FORMAT.format(
+      key=hashlib.md5(device_dir).hexdigest())
+
+
+def ReadDeviceMd5Manifest(device_dir, device):
+  """Reads the MD5 sums last recorded for the files in |device_dir|.
+
+  Entries of files that were deleted, or modified on the device after the
+  manifest was written, are left out.
+
+  Args:
+    device_dir: The absolute path of a directory on the device.
+  Returns:
+    A dict mapping device paths to MD5 sums. It is empty if there is no
+    manifest for |device_dir|, or the directory no longer exists.
+  """
+  out = device.RunShellCommand(MD5SUM_DEVICE_MANIFEST_SCRIPT_FORMAT.format(
+      device_dir=cmd_helper.SingleQuote(device_dir),
+      manifest=_GetDeviceManifestPath(device_dir)))
+  return dict((h.path, h.hash)
+              for h in (HashAndPath(*l.split(None, 1)) for l in out if l))
+
+
+def WriteDeviceMd5Manifest(device_dir, hash_tuples, device):
+  """Records the MD5 sums of the files in |device_dir|.
+
+  The manifest is trusted by later calls to ReadDeviceMd5Manifest, so it must
+  only be written once the files are known to have these sums on the device.
+  Its modification time is set by the device's clock, so that files modified
+  on the device afterwards are newer than the manifest.
+
+  Args:
+    device_dir: The absolute path of a directory on the device.
+    hash_tuples: A list of named tuples with the 'hash' and device 'path' of
+      each file in |device_dir|.
+  """
+  with tempfile.NamedTemporaryFile() as manifest_file:
+    manifest_file.write(''.join('%s  %s\n' % h for h in hash_tuples))
+    manifest_file.flush()
+    manifest_path = _GetDeviceManifestPath(device_dir)
+    device.adb.Push(manifest_file.name, manifest_path)
+    device.RunShellCommand(['touch', manifest_path], check_return=True)
+
+
+def RemoveDeviceMd5Manifests(device):
+  """Removes all manifests before files on the device are pushed.
+
+  Pushed files keep the modification time they had on the host, so they may
+  not be newer than the manifests of the directories they end up in. Since
+  these may be parents or subdirectories of the ones pushed to, all
+  manifests are removed.
+  """
+  device.RunShellCommand(
+      'rm -f %s' % MD5SUM_DEVICE_MANIFEST_FORMAT.format(key='*'),
+      check_return=True)
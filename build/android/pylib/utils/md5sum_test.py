@@ -4,7 +4,9 @@
 # found in the LICENSE file.
 
 import os
+import shutil
 import sys
+import tempfile
 import unittest
 
 from pylib import cmd_helper
@@ -75,6 +77,49 @@ class Md5SumTest(unittest.TestCase):
       mock_get_cmd_output.assert_called_once_with(
           [HOST_MD5_EXECUTABLE, '/test/host/file0.dat', '/test/host/file1.dat'])
 
+  def testCalculateHostMd5Sums_cachesUnchangedFiles(self):
+    test_dir = tempfile.mkdtemp()
+    cache_dir = tempfile.mkdtemp()
+    try:
+      test_paths = [os.path.join(test_dir, f)
+                    for f in ('file0.dat', 'file1.dat')]
+      for p in test_paths:
+        with open(p, 'w') as f:
+          f.write(p)
+      mock_get_cmd_output = mock.Mock(
+          return_value='0123456789abcdeffedcba9876543210 %s\n'
+                       '123456789abcdef00fedcba987654321 %s\n' % tuple(
+                           test_paths))
+      with mock.patch('pylib.cmd_helper.GetCmdOutput',
+                      new=mock_get_cmd_output), (
+           mock.patch('pylib.utils.md5sum._HOST_MD5_CACHE_JSON',
+                      new=os.path.join(cache_dir, 'cache.json'))):
+        out = md5sum.CalculateHostMd5Sums(test_dir)
+        self.assertEquals(out, md5sum.CalculateHostMd5Sums(test_dir))
+        self.assertEquals(1, mock_get_cmd_output.call_count)
+        self.assertEquals(2, len(out))
+        self.assertEquals('0123456789abcdeffedcba9876543210', out[0].hash)
+        self.assertEquals(test_paths[0], out[0].path)
+        self.assertEquals('123456789abcdef00fedcba987654321', out[1].hash)
+        self.assertEquals(test_paths[1], out[1].path)
+        mock_get_cmd_output.assert_called_once_with(
+            [HOST_MD5_EXECUTABLE] + test_paths)
+
+        # Only the changed file is hashed again.
+        with open(test_paths[1], 'a') as f:
+          f.write('changed')
+        mock_get_cmd_output.reset_mock()
+        mock_get_cmd_output.return_value = (
+            'fedcba98765432100123456789abcdef %s\n' % test_paths[1])
+        out = md5sum.CalculateHostMd5Sums(test_dir)
+        self.assertEquals('fedcba98765432100123456789abcdef', out[1].hash)
+        self.assertEquals(1, mock_get_cmd_output.call_count)
+        mock_get_cmd_output.assert_called_once_with(
+            [HOST_MD5_EXECUTABLE, test_paths[1]])
+    finally:
+      shutil.rmtree(test_dir)
+      shutil.rmtree(cache_dir)
+
   def testCalculateDeviceMd5Sums_singlePath(self):
     test_path = '/storage/emulated/legacy/test/file.dat'
 
@@ -178,6 +223,18 @@ class Md5SumTest(unittest.TestCase):
           ['sh', '/data/local/tmp/test/script/file.sh'])
 
 
+  def testReadDeviceMd5Manifest(self):
+    device = mock.NonCallableMock()
+    device.RunShellCommand = mock.Mock(return_value=[
+        '0123456789abcdeffedcba9876543210  /test/device/dir/file0.dat',
+        '123456789abcdef00fedcba987654321  /test/device/dir/file1.dat',
+    ])
+    self.assertEquals(
+        {'/test/device/dir/file0.dat': '0123456789abcdeffedcba9876543210',
+         '/test/device/dir/file1.dat': '123456789abcdef00fedcba987654321'},
+        md5sum.ReadDeviceMd5Manifest('/test/device/dir', device))
+
+
 if __name__ == '__main__':
   unittest.main(verbosity=2)
 
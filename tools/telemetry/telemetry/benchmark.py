@@ -313,6 +313,10 @@ class Benchmark(command_line.Command):
 
     opts = self.CreateTimelineBasedMeasurementOptions()
     self.SetupTraceRerunOptions(options, opts)
+    if getattr(options, 'background_metric_processes', None):
+      opts.background_metric_processes = options.background_metric_processes
+    if getattr(options, 'timeline_model_cache_dir', None):
+      opts.timeline_model_cache_dir = options.timeline_model_cache_dir
     return timeline_based_measurement.TimelineBasedMeasurement(opts)
 
   def CreatePageSet(self, options):  # pylint: disable=unused-argument
@@ -343,6 +347,20 @@ class Benchmark(command_line.Command):
 def AddCommandLineArgs(parser):
   user_story_runner.AddCommandLineArgs(parser)
 
+  group = optparse.OptionGroup(parser, 'Timeline based measurement options')
+  group.add_option('--background-metric-processes', default=0, type='int',
+                   help='Number of processes that import the traces and '
+                   'compute the metrics while the next user stories run. '
+                   'Overrides the count chosen by the benchmark.')
+  group.add_option('--timeline-model-cache-dir',
+                   help='Directory in which to cache the timeline models '
+                   'imported from the traces, so that analyzing the same '
+                   'trace again skips the import.')
+  parser.add_option_group(group)
+
 
 def ProcessCommandLineArgs(parser, args):
   user_story_runner.ProcessCommandLineArgs(parser, args)
+
+  if args.background_metric_processes < 0:
+    parser.error('--background-metric-processes must not be negative.')
@@ -10,8 +10,10 @@ actually running the benchmark is in Benchmark and PageRunner."""
 import hashlib
 import inspect
 import json
+import logging
 import os
 import sys
+import tempfile
 
 from telemetry import benchmark
 from telemetry.core import browser_finder
@@ -21,6 +23,7 @@ from telemetry.core import discover
 from telemetry.core import util
 from telemetry import decorators
 from telemetry.util import find_dependencies
+from telemetry.util import path
 
 
 class Environment(object):
@@ -214,14 +217,110 @@ def _MatchingCommands(string):
 
 @decorators.Cache
 def _Benchmarks(environment):
+  # Stat the files before importing them, so that files changed meanwhile make
+  # the index stale.
+  file_stats = _GetBenchmarkFileStats(environment)
   benchmarks = []
   for search_dir in environment.benchmark_dirs:
     benchmarks += discover.DiscoverClasses(search_dir,
                                            environment.top_level_dir,
                                            benchmark.Benchmark,
                                            index_by_class_name=True).values()
+  _WriteBenchmarkIndex(environment, file_stats, benchmarks)
   return benchmarks
 
+
+# Bump this when the format of the benchmark index changes.
+_BENCHMARK_INDEX_VERSION = 1
+
+
+def _GetBenchmarkIndexPath(environment):
+  """Returns the path of the benchmark index of environment.
+
+  The index maps benchmark names to the module and class defining them, so
+  that a benchmark can be found without importing every benchmark module.
+  """
+  key = hashlib.sha1(json.dumps(
+      [os.path.abspath(environment.top_level_dir)] +
+      [os.path.abspath(d) for d in environment.benchmark_dirs])).hexdigest()
+  return os.path.join(path.GetCacheDir(), 'benchmark_index_%s.json' % key[:16])
+
+
+def _GetBenchmarkFileStats(environment):
+  file_stats = {}
+  for search_dir in environment.benchmark_dirs:
+    file_stats.update(discover.GetModuleFileStats(
+        search_dir, environment.top_level_dir))
+  return file_stats
+
+
+def _WriteBenchmarkIndex(environment, file_stats, benchmarks):
+  index = {
+    'version': _BENCHMARK_INDEX_VERSION,
+    'file_stats': file_stats,
+    'benchmarks': dict(
+        (benchmark_class.Name(),
+         [benchmark_class.__module__, benchmark_class.__name__])
+        for benchmark_class in benchmarks),
+  }
+  index_path = _GetBenchmarkIndexPath(environment)
+  try:
+    if not os.path.isdir(os.path.dirname(index_path)):
+      os.makedirs(os.path.dirname(index_path))
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(index_path))
+    with os.fdopen(fd, 'w') as f:
+      json.dump(index, f)
+    os.rename(temp_path, index_path)
+  except (IOError, OSError) as e:
+    logging.warning('Could not write benchmark index %s: %s', index_path, e)
+  _LoadBenchmarkIndex.cache_clear()
+
+
+@decorators.Cache
+def _LoadBenchmarkIndex(environment):
+  """Returns {benchmark_name: (module_name, class_name)}, or None if the
+  index is missing or any benchmark file changed since it was written.
+
+  Benchmarks whose module isn't in the benchmark dirs are left out, so that
+  only those modules are ever imported based on the index.
+  """
+  try:
+    with open(_GetBenchmarkIndexPath(environment)) as f:
+      index = json.load(f)
+  except (IOError, ValueError):
+    return None
+  file_stats = _GetBenchmarkFileStats(environment)
+  if (index.get('version') != _BENCHMARK_INDEX_VERSION or
+      index.get('file_stats') != file_stats):
+    return None
+  return dict((name, tuple(location))
+              for name, location in index['benchmarks'].iteritems()
+              if location[0] in file_stats)
+
+
+def _LoadIndexedBenchmarks(benchmark_names, environment):
+  """Imports the modules of benchmark_names according to the index.
+
+  Returns the benchmark classes, or None if the index can't be trusted for
+  any of them.
+  """
+  index = _LoadBenchmarkIndex(environment)
+  benchmark_classes = []
+  for name in benchmark_names:
+    module_name, class_name = index[name]
+    try:
+      module = __import__(module_name, fromlist=[True])
+    except ImportError:
+      return None
+    benchmark_class = getattr(module, class_name, None)
+    if (not inspect.isclass(benchmark_class) or
+        not issubclass(benchmark_class, benchmark.Benchmark) or
+        benchmark_class.Name() != name):
+      return None
+    benchmark_classes.append(benchmark_class)
+  return benchmark_classes
+
+
 def _MatchBenchmarkName(input_benchmark_name, environment, exact_matches=True):
   def _Matches(input_string, search_string):
     if search_string.startswith(input_string):
@@ -239,12 +338,28 @@ def _MatchBenchmarkName(input_benchmark_name, environment, exact_matches=True):
     else:
       exact_match = input_benchmark_name
 
+    # A hit in an up to date index only imports the benchmark's module. A
+    # name can still be missing from it, e.g. if it comes from a base class
+    # outside the benchmark directories, so a miss falls back to discovery.
+    index = _LoadBenchmarkIndex(environment)
+    if index is not None and exact_match in index:
+      benchmark_classes = _LoadIndexedBenchmarks([exact_match], environment)
+      if benchmark_classes:
+        return benchmark_classes
+
     for benchmark_class in _Benchmarks(environment):
       if exact_match == benchmark_class.Name():
         return [benchmark_class]
     return []
 
   # Fuzzy matching.
+  index = _LoadBenchmarkIndex(environment)
+  if index is not None:
+    benchmark_classes = _LoadIndexedBenchmarks(
+        [name for name in index if _Matches(input_benchmark_name, name)],
+        environment)
+    if benchmark_classes is not None:
+      return benchmark_classes
   return [benchmark_class for benchmark_class in _Benchmarks(environment)
           if _Matches(input_benchmark_name, benchmark_class.Name())]
 
@@ -0,0 +1,115 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+# pylint: disable=W0212
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from telemetry import benchmark_runner
+
+
+_BENCHMARK_MODULE = """
+from telemetry import benchmark
+
+class %s(benchmark.Benchmark):
+  pass
+"""
+
+
+class BenchmarkIndexTest(unittest.TestCase):
+
+  def setUp(self):
+    self._top_level_dir = tempfile.mkdtemp()
+    self._benchmark_dir = os.path.join(self._top_level_dir, 'fake_benchmarks')
+    os.mkdir(self._benchmark_dir)
+    self._WriteFile('__init__.py', '')
+    self._WriteFile('foo.py', _BENCHMARK_MODULE % 'FooBenchmark')
+    self._WriteFile('bar.py', _BENCHMARK_MODULE % 'BarBenchmark')
+    sys.path.insert(0, self._top_level_dir)
+
+  def tearDown(self):
+    sys.path.remove(self._top_level_dir)
+    for module_name in sys.modules.keys():
+      if module_name.startswith('fake_benchmarks'):
+        del sys.modules[module_name]
+    index_path = benchmark_runner._GetBenchmarkIndexPath(
+        self._CreateEnvironment())
+    if os.path.exists(index_path):
+      os.remove(index_path)
+    shutil.rmtree(self._top_level_dir)
+
+  def _WriteFile(self, filename, contents):
+    with open(os.path.join(self._benchmark_dir, filename), 'w') as f:
+      f.write(contents)
+
+  def _CreateEnvironment(self):
+    # Each environment has its own cached benchmarks and index.
+    return benchmark_runner.Environment(
+        top_level_dir=self._top_level_dir,
+        benchmark_dirs=[self._benchmark_dir])
+
+  def _MatchBenchmarkNames(self, name, exact_matches=True):
+    return sorted(b.Name() for b in benchmark_runner._MatchBenchmarkName(
+        name, self._CreateEnvironment(), exact_matches))
+
+  def testMatchWithIndexImportsOnlyMatchingModules(self):
+    self.assertEquals(['foo.FooBenchmark'],
+                      self._MatchBenchmarkNames('foo.FooBenchmark'))
+    del sys.modules['fake_benchmarks.bar']
+
+    self.assertEquals(['foo.FooBenchmark'],
+                      self._MatchBenchmarkNames('foo.FooBenchmark'))
+    self.assertEquals(['foo.FooBenchmark'],
+                      self._MatchBenchmarkNames('Foo', exact_matches=False))
+    self.assertNotIn('fake_benchmarks.bar', sys.modules)
+
+  def testBenchmarkMissingFromIndexIsFound(self):
+    self.assertEquals([], self._MatchBenchmarkNames('baz.BazBenchmark'))
+    index_path = benchmark_runner._GetBenchmarkIndexPath(
+        self._CreateEnvironment())
+    with open(index_path) as f:
+      index = json.load(f)
+    del index['benchmarks']['foo.FooBenchmark']
+    with open(index_path, 'w') as f:
+      json.dump(index, f)
+    self.assertIsNotNone(benchmark_runner._LoadBenchmarkIndex(
+        self._CreateEnvironment()))
+
+    self.assertEquals(['foo.FooBenchmark'],
+                      self._MatchBenchmarkNames('foo.FooBenchmark'))
+
+  def testChangedFileMakesIndexStale(self):
+    self.assertEquals(['bar.BarBenchmark', 'foo.FooBenchmark'],
+                      self._MatchBenchmarkNames('', exact_matches=False))
+    self._WriteFile('foo.py', _BENCHMARK_MODULE % 'FooBenchmark' + '\n')
+    self.assertIsNone(benchmark_runner._LoadBenchmarkIndex(
+        self._CreateEnvironment()))
+
+    # Live discovery brings the index up to date again.
+    self.assertEquals(['foo.FooBenchmark'],
+                      self._MatchBenchmarkNames('foo.FooBenchmark'))
+    self.assertIsNotNone(benchmark_runner._LoadBenchmarkIndex(
+        self._CreateEnvironment()))
+
+  def testRewrittenIndexIsReloaded(self):
+    environment = self._CreateEnvironment()
+    self.assertIsNone(benchmark_runner._LoadBenchmarkIndex(environment))
+    benchmark_runner._Benchmarks(environment)
+    self.assertIsNotNone(benchmark_runner._LoadBenchmarkIndex(environment))
+
+  def testModulesOutsideBenchmarkDirsAreNotImported(self):
+    self._MatchBenchmarkNames('foo.FooBenchmark')
+    index_path = benchmark_runner._GetBenchmarkIndexPath(
+        self._CreateEnvironment())
+    with open(index_path) as f:
+      index = json.load(f)
+    index['benchmarks']['foo.FooBenchmark'] = ['os', 'path']
+    with open(index_path, 'w') as f:
+      json.dump(index, f)
+    self.assertNotIn('foo.FooBenchmark', benchmark_runner._LoadBenchmarkIndex(
+        self._CreateEnvironment()))
@@ -103,6 +103,39 @@ class BenchmarkTest(unittest.TestCase):
         DefaultTbmBenchmark().CreatePageTest(options=None),
         timeline_based_measurement.TimelineBasedMeasurement)
 
+  def testBackgroundMetricProcessesOption(self):
+    # pylint: disable=W0212
+    class TbmBenchmark(benchmark.Benchmark):
+      def CreateTimelineBasedMeasurementOptions(self):
+        return timeline_based_measurement.Options(
+            background_metric_processes=2)
+
+    parser = optparse.OptionParser()
+    benchmark.AddCommandLineArgs(parser)
+    options, _ = parser.parse_args([])
+    tbm_options = TbmBenchmark().CreatePageTest(options)._tbm_options
+    self.assertEquals(2, tbm_options.background_metric_processes)
+
+    options, _ = parser.parse_args(['--background-metric-processes=4'])
+    tbm_options = TbmBenchmark().CreatePageTest(options)._tbm_options
+    self.assertEquals(4, tbm_options.background_metric_processes)
+
+  def testTimelineModelCacheDirOption(self):
+    # pylint: disable=W0212
+    class TbmBenchmark(benchmark.Benchmark):
+      def CreateTimelineBasedMeasurementOptions(self):
+        return timeline_based_measurement.Options()
+
+    parser = optparse.OptionParser()
+    benchmark.AddCommandLineArgs(parser)
+    options, _ = parser.parse_args([])
+    tbm_options = TbmBenchmark().CreatePageTest(options)._tbm_options
+    self.assertIsNone(tbm_options.timeline_model_cache_dir)
+
+    options, _ = parser.parse_args(['--timeline-model-cache-dir=/tmp/models'])
+    tbm_options = TbmBenchmark().CreatePageTest(options)._tbm_options
+    self.assertEquals('/tmp/models', tbm_options.timeline_model_cache_dir)
+
   def testUnknownTestTypeRaises(self):
     class UnknownTestType(object):
       pass
@@ -7,82 +7,67 @@ Bitmap is a basic wrapper for image pixels. It includes some basic processing
 tools: crop, find bounding box of a color and compute histogram of color values.
 """
 
-import array
-import base64
-import cStringIO
-import struct
-import subprocess
+import itertools
 
-from telemetry.core import platform
 from telemetry.core import util
 from telemetry.image_processing import histogram
 from telemetry.image_processing import rgba_color
-from telemetry.util import support_binaries
 
 util.AddDirToPythonPath(util.GetTelemetryDir(), 'third_party', 'png')
 import png  # pylint: disable=F0401
 
 
-class _BitmapTools(object):
-  """Wraps a child process of bitmaptools and allows for one command."""
-  CROP_PIXELS = 0
-  HISTOGRAM = 1
-  BOUNDING_BOX = 2
-
-  def __init__(self, dimensions, pixels):
-    binary = support_binaries.FindPath(
-        'bitmaptools',
-        platform.GetHostPlatform().GetArchName(),
-        platform.GetHostPlatform().GetOSName())
-    assert binary, 'You must build bitmaptools first!'
-
-    self._popen = subprocess.Popen([binary],
-                                   stdin=subprocess.PIPE,
-                                   stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE)
-
-    # dimensions are: bpp, width, height, boxleft, boxtop, boxwidth, boxheight
-    packed_dims = struct.pack('iiiiiii', *dimensions)
-    self._popen.stdin.write(packed_dims)
-    # If we got a list of ints, we need to convert it into a byte buffer.
-    if type(pixels) is not bytearray:
-      pixels = bytearray(pixels)
-    self._popen.stdin.write(pixels)
-
-  def _RunCommand(self, *command):
-    assert not self._popen.stdin.closed, (
-      'Exactly one command allowed per instance of tools.')
-    packed_command = struct.pack('i' * len(command), *command)
-    self._popen.stdin.write(packed_command)
-    self._popen.stdin.close()
-    length_packed = self._popen.stdout.read(struct.calcsize('i'))
-    if not length_packed:
-      raise Exception(self._popen.stderr.read())
-    length = struct.unpack('i', length_packed)[0]
-    return self._popen.stdout.read(length)
-
-  def CropPixels(self):
-    return self._RunCommand(_BitmapTools.CROP_PIXELS)
-
-  def Histogram(self, ignore_color, tolerance):
-    ignore_color_int = -1 if ignore_color is None else int(ignore_color)
-    response = self._RunCommand(_BitmapTools.HISTOGRAM,
-                                ignore_color_int, tolerance)
-    out = array.array('i')
-    out.fromstring(response)
-    assert len(out) == 768, (
-        'The ColorHistogram has the wrong number of buckets: %s' % len(out))
-    return histogram.ColorHistogram(out[:256], out[256:512], out[512:],
-                                    ignore_color)
+# What a matching pixel reads as in the buffers returned by _MatchColor. Each
+# channel has its own marker, so it can only be found at pixel boundaries.
+_MATCH = '\x01\x02\x03'
+
+
+def _ToleranceTable(value, tolerance, marker):
+  """Returns a translation table that maps the bytes within tolerance of value
+  to marker, and all other bytes to zero."""
+  low = max(0, value - tolerance)
+  high = min(255, value + tolerance) + 1
+  table = bytearray(256)
+  table[low:high] = marker * (high - low)
+  return str(table)
+
+
+def _MatchColor(rgb, color, tolerance):
+  """Returns a copy of an RGB buffer in which each pixel that is within
+  tolerance of color reads as _MATCH."""
+  matches = bytearray(len(rgb))
+  for c in xrange(3):
+    matches[c::3] = rgb[c::3].translate(
+        _ToleranceTable(color[c], tolerance, _MATCH[c]))
+  return matches
+
+
+_BYTE_VALUES = ''.join(chr(value) for value in xrange(256))
 
-  def BoundingBox(self, color, tolerance):
-    response = self._RunCommand(_BitmapTools.BOUNDING_BOX, int(color),
-                                tolerance)
-    unpacked = struct.unpack('iiiii', response)
-    box, count = unpacked[:4], unpacked[-1]
-    if box[2] < 0 or box[3] < 0:
-      box = None
-    return box, count
+
+def _Histogram(channel):
+  """Returns how often each byte value occurs in the channel string."""
+  counts = [0] * 256
+  _CountValues(channel, 0, 256, counts)
+  return counts
+
+
+def _CountValues(data, low, high, counts):
+  """Sets the counts of the values in [low, high), which are the only values
+  in data. Each split by value deletes the other half of the values in C."""
+  if not data:
+    return
+  if high - low == 1:
+    counts[low] = len(data)
+    return
+  mid = (low + high) // 2
+  _CountValues(data.translate(None, _BYTE_VALUES[mid:high]), low, mid, counts)
+  _CountValues(data.translate(None, _BYTE_VALUES[low:mid]), mid, high, counts)
+
+
+def _UnpackColor(color):
+  color = int(color)
+  return (color >> 16) & 0xff, (color >> 8) & 0xff, color & 0xff
 
 
 class Bitmap(object):
@@ -114,23 +99,66 @@ class Bitmap(object):
   def height(self):
     return self._crop_box[3] if self._crop_box else self._height
 
-  def _PrepareTools(self):
-    """Prepares an instance of _BitmapTools which allows exactly one command.
+  def _GetBuffer(self):
+    """Returns the uncropped pixel buffer as a bytearray."""
+    if type(self._pixels) is not bytearray:
+      self._pixels = bytearray(self._pixels)
+    return self._pixels
+
+  def _RowRanges(self):
+    """Yields the (start, end) buffer offsets of each row in the crop box."""
+    left, top, width, height = (
+        self._crop_box or (0, 0, self._width, self._height))
+    row_stride = self._bpp * self._width
+    row_size = self._bpp * width
+    start = top * row_stride + self._bpp * left
+    for _ in xrange(height):
+      yield start, start + row_size
+      start += row_stride
+
+  def _CroppedBuffer(self):
+    """Returns the pixels in the crop box as a contiguous buffer.
+
+    Without a crop box, this is the pixel buffer itself, not a copy.
     """
-    crop_box = self._crop_box or (0, 0, self._width, self._height)
-    return _BitmapTools((self._bpp, self._width, self._height) + crop_box,
-                        self._pixels)
+    if not self._crop_box:
+      return self._GetBuffer()
+    view = memoryview(self._GetBuffer())
+    cropped = bytearray()
+    for start, end in self._RowRanges():
+      cropped.extend(view[start:end])
+    return cropped
+
+  def _RgbBuffer(self):
+    """Returns the pixels in the crop box without their alpha channel."""
+    pixels = self._CroppedBuffer()
+    if self._bpp == 3:
+      return pixels
+    rgb = bytearray(len(pixels) // 4 * 3)
+    for c in xrange(3):
+      rgb[c::3] = pixels[c::4]
+    return rgb
+
+  def _PaddedRgbBuffer(self, width, height):
+    """Returns _RgbBuffer, padded with black to width x height pixels."""
+    rgb = self._RgbBuffer()
+    if (width, height) == (self.width, self.height):
+      return rgb
+    padded = bytearray(3 * width * height)
+    row_size = 3 * self.width
+    for y in xrange(self.height):
+      start = 3 * width * y
+      padded[start:start + row_size] = rgb[y * row_size:(y + 1) * row_size]
+    return padded
 
   @property
   def pixels(self):
     if self._crop_box:
-      self._pixels = self._PrepareTools().CropPixels()
+      self._pixels = self._CroppedBuffer()
       # pylint: disable=unpacking-non-sequence
       _, _, self._width, self._height = self._crop_box
       self._crop_box = None
-    if type(self._pixels) is not bytearray:
-      self._pixels = bytearray(self._pixels)
-    return self._pixels
+    return self._GetBuffer()
 
   @property
   def metadata(self):
@@ -140,7 +168,10 @@ class Bitmap(object):
     return self._metadata
 
   def GetPixelColor(self, x, y):
-    pixels = self.pixels
+    pixels = self._GetBuffer()
+    if self._crop_box:
+      x += self._crop_box[0]
+      y += self._crop_box[1]
     base = self._bpp * (y * self._width + x)
     if self._bpp == 4:
       return rgba_color.RgbaColor(pixels[base + 0], pixels[base + 1],
@@ -167,58 +198,57 @@ class Bitmap(object):
     if self.width != other.width or self.height != other.height:
       return False
 
-    # Loop over each pixel and test for equality
-    if tolerance or self.bpp != other.bpp:
+    if self.bpp != other.bpp:
+      # Loop over each pixel and test for equality
       for y in range(self.height):
         for x in range(self.width):
           c0 = self.GetPixelColor(x, y)
           c1 = other.GetPixelColor(x, y)
           if not c0.IsEqual(c1, tolerance):
             return False
-    else:
+      return True
+
+    if not tolerance:
       return self.pixels == other.pixels
 
-    return True
+    # Compare all channels, including alpha. The standard library has no bulk
+    # operation for differences, so only identical buffers take a shortcut.
+    pixels0 = self._CroppedBuffer()
+    pixels1 = other._CroppedBuffer()
+    if pixels0 == pixels1:
+      return True
+    return all(abs(p0 - p1) <= tolerance
+               for p0, p1 in itertools.izip(pixels0, pixels1))
 
   def Diff(self, other):
     # Output dimensions will be the maximum of the two input dimensions
     out_width = max(self.width, other.width)
     out_height = max(self.height, other.height)
 
-    diff = [[0 for x in xrange(out_width * 3)] for x in xrange(out_height)]
-
-    # Loop over each pixel and write out the difference
-    for y in range(out_height):
-      for x in range(out_width):
-        if x < self.width and y < self.height:
-          c0 = self.GetPixelColor(x, y)
-        else:
-          c0 = rgba_color.RgbaColor(0, 0, 0, 0)
+    # Pixels outside of either bitmap are compared against transparent black.
+    rgb0 = self._PaddedRgbBuffer(out_width, out_height)
+    rgb1 = other._PaddedRgbBuffer(out_width, out_height)
+    diff = bytearray(abs(p0 - p1) for p0, p1 in itertools.izip(rgb0, rgb1))
 
-        if x < other.width and y < other.height:
-          c1 = other.GetPixelColor(x, y)
-        else:
-          c1 = rgba_color.RgbaColor(0, 0, 0, 0)
-
-        offset = x * 3
-        diff[y][offset] = abs(c0.r - c1.r)
-        diff[y][offset+1] = abs(c0.g - c1.g)
-        diff[y][offset+2] = abs(c0.b - c1.b)
-
-    # This particular method can only save to a file, so the result will be
-    # written into an in-memory buffer and read back into a Bitmap
-    diff_img = png.from_array(diff, mode='RGB')
-    output = cStringIO.StringIO()
-    try:
-      diff_img.save(output)
-      diff = Bitmap.FromPng(output.getvalue())
-    finally:
-      output.close()
-
-    return diff
+    return Bitmap(3, out_width, out_height, diff)
 
   def GetBoundingBox(self, color, tolerance=0):
-    return self._PrepareTools().BoundingBox(color, tolerance)
+    matches = _MatchColor(self._RgbBuffer(), _UnpackColor(color), tolerance)
+    count = matches.count(_MATCH)
+    if not count:
+      return None, 0
+    row_size = 3 * self.width
+    top = matches.find(_MATCH) // row_size
+    bottom = matches.rfind(_MATCH) // row_size + 1
+    left, right = self.width, 0
+    for start in xrange(top * row_size, bottom * row_size, row_size):
+      end = start + row_size
+      first = matches.find(_MATCH, start, end)
+      if first >= 0:
+        left = min(left, (first - start) // 3)
+        last = matches.rfind(_MATCH, start, end)
+        right = max(right, (last - start) // 3 + 1)
+    return (left, top, right - left, bottom - top), count
 
   def Crop(self, left, top, width, height):
     cur_box = self._crop_box or (0, 0, self._width, self._height)
@@ -233,4 +263,23 @@ class Bitmap(object):
     return self
 
   def ColorHistogram(self, ignore_color=None, tolerance=0):
-    return self._PrepareTools().Histogram(ignore_color, tolerance)
+    rgb = self._RgbBuffer()
+    counts = [_Histogram(str(rgb[c::3])) for c in xrange(3)]
+    if ignore_color is not None:
+      ignored = _UnpackColor(ignore_color)
+      matches = _MatchColor(rgb, ignored, tolerance)
+      if matches.count(_MATCH):
+        # Takes the ignored pixels out of the counts, one value in the
+        # tolerance range of each channel at a time.
+        for c, channel_counts in enumerate(counts):
+          low = max(0, ignored[c] - tolerance)
+          high = min(255, ignored[c] + tolerance) + 1
+          for value in xrange(low, high):
+            if not channel_counts[value]:
+              continue
+            value_matches = bytearray(matches)
+            value_matches[c::3] = rgb[c::3].translate(
+                _ToleranceTable(value, 0, _MATCH[c]))
+            channel_counts[value] -= value_matches.count(_MATCH)
+    return histogram.ColorHistogram(counts[0], counts[1], counts[2],
+                                    ignore_color)
@@ -259,7 +259,10 @@ class Browser(app.App):
     if not paths:
       return False
 
-    server = memory_cache_http_server.MemoryCacheHTTPServer(paths)
+    browser_options = self._browser_backend.browser_options
+    server = memory_cache_http_server.MemoryCacheHTTPServer(
+        paths, lazy=browser_options.lazy_http_server,
+        max_threads=browser_options.http_server_max_threads)
     self.StartLocalServer(server)
     return True
 
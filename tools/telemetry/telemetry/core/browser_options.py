@@ -230,6 +230,13 @@ class BrowserOptions(object):
     self.clear_sytem_cache_for_browser_and_profile_on_start = False
     self.startup_url = 'about:blank'
 
+    # Large local page sets can have the HTTP server load files on demand, and
+    # handle connections in a bounded number of threads, at least
+    # memory_cache_http_server.MIN_POOLED_THREADS.
+    # See memory_cache_http_server.MemoryCacheHTTPServer.
+    self.lazy_http_server = False
+    self.http_server_max_threads = None
+
     # Background pages of built-in component extensions can interfere with
     # performance measurements.
     self.disable_component_extensions_with_background_pages = True
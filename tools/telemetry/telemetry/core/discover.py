@@ -24,6 +24,37 @@ def DiscoverModules(start_dir, top_level_dir, pattern='*'):
     list of modules.
   """
   modules = []
+  for _, module_name in _IterModulePaths(start_dir, top_level_dir, pattern):
+    # Import the module.
+    try:
+      module = __import__(module_name, fromlist=[True])
+    except ImportError:
+      continue
+    modules.append(module)
+  return modules
+
+
+def GetModuleFileStats(start_dir, top_level_dir, pattern='*'):
+  """Stats the files of the modules DiscoverModules would import.
+
+  Nothing is imported, so this is a cheap way to tell whether the results of
+  an earlier discovery are still up to date.
+
+  Returns:
+    dict of {module_name: [mtime, size]}
+  """
+  file_stats = {}
+  for path, module_name in _IterModulePaths(start_dir, top_level_dir, pattern):
+    try:
+      stat = os.stat(path)
+    except OSError:
+      continue
+    file_stats[module_name] = [stat.st_mtime, stat.st_size]
+  return file_stats
+
+
+def _IterModulePaths(start_dir, top_level_dir, pattern):
+  """Yields (path, module_name) for each module file in |start_dir|."""
   for dir_path, _, filenames in os.walk(start_dir):
     for filename in filenames:
       # Filter out unwanted filenames.
@@ -35,17 +66,10 @@ def DiscoverModules(start_dir, top_level_dir, pattern='*'):
         continue
 
       # Find the module.
-      module_rel_path = os.path.relpath(os.path.join(dir_path, filename),
-                                        top_level_dir)
+      path = os.path.join(dir_path, filename)
+      module_rel_path = os.path.relpath(path, top_level_dir)
       module_name = re.sub(r'[/\\]', '.', os.path.splitext(module_rel_path)[0])
-
-      # Import the module.
-      try:
-        module = __import__(module_name, fromlist=[True])
-      except ImportError:
-        continue
-      modules.append(module)
-  return modules
+      yield path, module_name
 
 
 # TODO(dtu): Normalize all discoverable classes to have corresponding module
@@ -7,19 +7,46 @@ from collections import namedtuple
 import errno
 import gzip
 import mimetypes
+import mmap
 import os
+import Queue
 import SimpleHTTPServer
 import socket
 import SocketServer
 import StringIO
 import sys
+import threading
 import urlparse
 
 from telemetry.core import local_server
+from telemetry import decorators
 
 ByteRange = namedtuple('ByteRange', ['from_byte', 'to_byte'])
 ResourceAndRange = namedtuple('ResourceAndRange', ['resource', 'byte_range'])
 
+# Resources of these types are served gzipped.
+_ZIPPED_CONTENT_TYPES = ('text/html', 'text/css', 'application/javascript')
+# The number of gzipped bodies a lazily loading server keeps in memory.
+_MAX_ZIPPED_BODIES = 256
+# Bodies that aren't kept in memory are written from a memory map of their
+# file, in chunks of this many bytes.
+_SEND_CHUNK_SIZE = 1024 * 1024
+# With a bounded pool of threads, connections that wait this many seconds for
+# a request are closed, so that idle keep-alive connections don't hold on to a
+# thread.
+_POOLED_CONNECTION_TIMEOUT = 5
+# Browsers keep up to 6 connections per host alive. With fewer threads, a new
+# connection can wait for up to _POOLED_CONNECTION_TIMEOUT behind idle ones.
+MIN_POOLED_THREADS = 6
+
+
+def _GzipData(data):
+  sio = StringIO.StringIO()
+  gzf = gzip.GzipFile(fileobj=sio, compresslevel=9, mode='wb')
+  gzf.write(data)
+  gzf.close()
+  return sio.getvalue()
+
 
 class MemoryCacheHTTPRequestHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
 
@@ -36,6 +63,16 @@ class MemoryCacheHTTPRequestHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
       if e[0] != errno.ECONNRESET:
         raise
 
+  def handle_one_request(self):
+    # Only waiting for the request times out. Responses are written without a
+    # timeout, so that a slow client still gets all of it.
+    self.connection.settimeout(self.server.idle_connection_timeout)
+    BaseHTTPServer.BaseHTTPRequestHandler.handle_one_request(self)
+
+  def parse_request(self):
+    self.connection.settimeout(None)
+    return BaseHTTPServer.BaseHTTPRequestHandler.parse_request(self)
+
   def do_GET(self):
     """Serve a GET request."""
     resource_range = self.SendHead()
@@ -44,6 +81,13 @@ class MemoryCacheHTTPRequestHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
       return
     response = resource_range.resource['response']
 
+    if response is None:
+      # The body is sent from the file, without loading it into memory.
+      byte_range = resource_range.byte_range or ByteRange(
+          0, resource_range.resource['content-length'] - 1)
+      self.SendFileRange(resource_range.resource['file-path'], byte_range)
+      return
+
     if not resource_range.byte_range:
       self.wfile.write(response)
       return
@@ -52,6 +96,21 @@ class MemoryCacheHTTPRequestHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
     end_index = resource_range.byte_range.to_byte
     self.wfile.write(response[start_index:end_index + 1])
 
+  def SendFileRange(self, file_path, byte_range):
+    """Writes byte_range of the file at file_path to the connection."""
+    num_of_bytes = byte_range.to_byte - byte_range.from_byte + 1
+    if num_of_bytes <= 0:
+      return
+    with open(file_path, 'rb') as f:
+      mapped_file = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+      try:
+        for offset in xrange(byte_range.from_byte, byte_range.to_byte + 1,
+                             _SEND_CHUNK_SIZE):
+          self.wfile.write(mapped_file[
+              offset:min(offset + _SEND_CHUNK_SIZE, byte_range.to_byte + 1)])
+      finally:
+        mapped_file.close()
+
   def do_HEAD(self):
     """Serve a HEAD request."""
     self.SendHead()
@@ -64,12 +123,11 @@ class MemoryCacheHTTPRequestHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
     pass
 
   def SendHead(self):
-    path = os.path.realpath(self.translate_path(self.path))
-    if path not in self.server.resource_map:
+    resource = self.server.GetResource(self.translate_path(self.path))
+    if not resource:
       self.send_error(404, 'File not found')
       return None
 
-    resource = self.server.resource_map[path]
     total_num_of_bytes = resource['content-length']
     byte_range = self.GetByteRange(total_num_of_bytes)
     if byte_range:
@@ -142,6 +200,32 @@ class MemoryCacheHTTPRequestHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
     return ByteRange(from_byte, to_byte)
 
 
+class _ThreadPoolMixIn(object):
+  """Handles requests in a fixed number of threads instead of one per request.
+
+  Mix in before a SocketServer.ThreadingMixIn server, whose
+  process_request_thread is reused. Connections wait in a queue until a
+  thread is free. Set max_threads before calling StartThreads(); see
+  MIN_POOLED_THREADS.
+  """
+  max_threads = None
+
+  def StartThreads(self):
+    self._requests = Queue.Queue()
+    for _ in xrange(self.max_threads):
+      thread = threading.Thread(target=self._ProcessRequests)
+      thread.daemon = self.daemon_threads
+      thread.start()
+
+  def _ProcessRequests(self):
+    while True:
+      request, client_address = self._requests.get()
+      self.process_request_thread(request, client_address)
+
+  def process_request(self, request, client_address):
+    self._requests.put((request, client_address))
+
+
 class _MemoryCacheHTTPServerImpl(SocketServer.ThreadingMixIn,
                                  BaseHTTPServer.HTTPServer):
   # Increase the request queue size. The default value, 5, is set in
@@ -153,6 +237,9 @@ class _MemoryCacheHTTPServerImpl(SocketServer.ThreadingMixIn,
   # Don't prevent python from exiting when there is thread activity.
   daemon_threads = True
 
+  # The number of seconds to wait for a request before closing a connection.
+  idle_connection_timeout = None
+
   def __init__(self, host_port, handler, paths):
     BaseHTTPServer.HTTPServer.__init__(self, host_port, handler)
     self.resource_map = {}
@@ -162,6 +249,10 @@ class _MemoryCacheHTTPServerImpl(SocketServer.ThreadingMixIn,
       else:
         self.AddFileToResourceMap(path)
 
+  def GetResource(self, path):
+    """Returns the resource dict for the path, or None if not served."""
+    return self.resource_map.get(os.path.realpath(path))
+
   def AddDirectoryToResourceMap(self, directory_path):
     """Loads all files in directory_path into the in-memory resource map."""
     for root, dirs, files in os.walk(directory_path):
@@ -186,19 +277,15 @@ class _MemoryCacheHTTPServerImpl(SocketServer.ThreadingMixIn,
       fs = os.fstat(fd.fileno())
     content_type = mimetypes.guess_type(file_path)[0]
     zipped = False
-    if content_type in ['text/html', 'text/css', 'application/javascript']:
+    if content_type in _ZIPPED_CONTENT_TYPES:
       zipped = True
-      sio = StringIO.StringIO()
-      gzf = gzip.GzipFile(fileobj=sio, compresslevel=9, mode='wb')
-      gzf.write(response)
-      gzf.close()
-      response = sio.getvalue()
-      sio.close()
+      response = _GzipData(response)
     self.resource_map[file_path] = {
         'content-type': content_type,
         'content-length': len(response),
         'last-modified': fs.st_mtime,
         'response': response,
+        'file-path': file_path,
         'zipped': zipped
         }
 
@@ -208,6 +295,95 @@ class _MemoryCacheHTTPServerImpl(SocketServer.ThreadingMixIn,
       self.resource_map[dir_path] = self.resource_map[file_path]
 
 
+class _LazyMemoryCacheHTTPServerImpl(_ThreadPoolMixIn,
+                                     _MemoryCacheHTTPServerImpl):
+  """Looks up and loads files when they are first requested.
+
+  Nothing is read at startup. Files that are served gzipped are compressed on
+  their first request, and the most recently used compressed bodies are kept
+  in memory. Other files are sent straight from disk.
+  """
+  def __init__(self, host_port, handler, paths, max_threads=None):
+    # pylint: disable=W0231
+    BaseHTTPServer.HTTPServer.__init__(self, host_port, handler)
+    self.resource_map = {}
+    # Request paths are resolved up to the cwd, which may hold symlinks to
+    # served directories.
+    self._served_paths = set()
+    for path in map(os.path.abspath, paths):
+      self._served_paths.add(os.path.realpath(path))
+      self._served_paths.add(os.path.join(
+          os.path.realpath(os.path.dirname(path)), os.path.basename(path)))
+    self.max_threads = max_threads
+    if max_threads:
+      self.idle_connection_timeout = _POOLED_CONNECTION_TIMEOUT
+      self.StartThreads()
+
+  def process_request(self, request, client_address):
+    if self.max_threads:
+      _ThreadPoolMixIn.process_request(self, request, client_address)
+    else:
+      SocketServer.ThreadingMixIn.process_request(
+          self, request, client_address)
+
+  def _IsServed(self, path):
+    """Returns whether the eagerly loading server would serve path.
+
+    That server walks the served directories without following symlinks to
+    directories, and serves each file it finds, including symlinks to files
+    anywhere, by its real path.
+    """
+    return (self._IsFoundByWalk(path) or
+            self._IsFoundByWalk(os.path.realpath(path)))
+
+  def _IsFoundByWalk(self, path):
+    for served_path in self._served_paths:
+      if path == served_path:
+        return True
+      relative_path = os.path.relpath(path, served_path)
+      if relative_path.startswith(os.pardir):
+        continue
+      parts = relative_path.split(os.sep)
+      # Skip hidden files and folders (like .svn and .git).
+      if any(part.startswith('.') for part in parts):
+        continue
+      # os.walk doesn't descend into symlinks to directories.
+      if not any(os.path.islink(os.path.join(served_path, *parts[:i]))
+                 for i in xrange(1, len(parts))):
+        return True
+    return False
+
+  def GetResource(self, path):
+    if os.path.isdir(path):
+      path = os.path.join(path, 'index.html')
+    if not self._IsServed(path) or not os.path.isfile(path):
+      return None
+    fs = os.stat(path)
+    content_type = mimetypes.guess_type(path)[0]
+    resource = {
+        'content-type': content_type,
+        'content-length': fs.st_size,
+        'last-modified': fs.st_mtime,
+        'response': None,
+        'file-path': path,
+        'zipped': False
+        }
+    if content_type in _ZIPPED_CONTENT_TYPES:
+      # The cache is thread-safe, and bodies are zipped outside of its lock.
+      response = self._GetZippedBody(path, fs.st_mtime, fs.st_size)
+      resource['response'] = response
+      resource['content-length'] = len(response)
+      resource['zipped'] = True
+    return resource
+
+  @decorators.Memoize(max_size=_MAX_ZIPPED_BODIES)
+  def _GetZippedBody(self, path, mtime, size):  # pylint: disable=W0613
+    # mtime and size are part of the key, so that changed files are zipped
+    # again.
+    with open(path, 'rb') as f:
+      return _GzipData(f.read())
+
+
 class MemoryCacheHTTPServerBackend(local_server.LocalServerBackend):
   def __init__(self):
     super(MemoryCacheHTTPServerBackend, self).__init__()
@@ -225,8 +401,13 @@ class MemoryCacheHTTPServerBackend(local_server.LocalServerBackend):
 
     server_address = (args['host'], args['port'])
     MemoryCacheHTTPRequestHandler.protocol_version = 'HTTP/1.1'
-    self._httpd = _MemoryCacheHTTPServerImpl(
-        server_address, MemoryCacheHTTPRequestHandler, paths)
+    if args.get('lazy'):
+      self._httpd = _LazyMemoryCacheHTTPServerImpl(
+          server_address, MemoryCacheHTTPRequestHandler, paths,
+          args.get('max_threads'))
+    else:
+      self._httpd = _MemoryCacheHTTPServerImpl(
+          server_address, MemoryCacheHTTPRequestHandler, paths)
     return [local_server.NamedPort('http', self._httpd.server_address[1])]
 
   def ServeForever(self):
@@ -234,10 +415,23 @@ class MemoryCacheHTTPServerBackend(local_server.LocalServerBackend):
 
 
 class MemoryCacheHTTPServer(local_server.LocalServer):
-  def __init__(self, paths):
+  def __init__(self, paths, lazy=False, max_threads=None):
+    """
+    Args:
+      paths: The files and directories to serve.
+      lazy: If True, files are only looked up and loaded when requested,
+          instead of all being read into memory at startup.
+      max_threads: In lazy mode, the number of threads handling connections,
+          at least MIN_POOLED_THREADS. By default, each connection gets a new
+          thread.
+    """
     super(MemoryCacheHTTPServer, self).__init__(
         MemoryCacheHTTPServerBackend)
+    assert max_threads is None or max_threads >= MIN_POOLED_THREADS, (
+        'max_threads must be at least %d.' % MIN_POOLED_THREADS)
     self._base_dir = None
+    self._lazy = lazy
+    self._max_threads = max_threads
 
     for path in paths:
       assert os.path.exists(path), '%s does not exist.' % path
@@ -257,7 +451,9 @@ class MemoryCacheHTTPServer(local_server.LocalServer):
     return {'base_dir': self._base_dir,
             'paths': self._paths,
             'host': self.host_ip,
-            'port': 0}
+            'port': 0,
+            'lazy': self._lazy,
+            'max_threads': self._max_threads}
 
   @property
   def paths(self):
@@ -2,8 +2,18 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import gzip
+import httplib
 import os
+import shutil
+import socket
+import StringIO
+import tempfile
+import threading
+import time
+import unittest
 
+from telemetry.core import memory_cache_http_server
 from telemetry.core import util
 from telemetry.unittest_util import tab_test_case
 
@@ -67,3 +77,122 @@ class MemoryCacheHTTPServerTest(tab_test_case.TabTestCase):
     content_length = self._tab.EvaluateJavaScript(
         'xmlhttp.getResponseHeader("Content-Length");')
     self.assertEquals(content_length, str(content_length_response))
+
+
+class LazyMemoryCacheHTTPServerTest(unittest.TestCase):
+  def setUp(self):
+    self._serving_dir = tempfile.mkdtemp()
+    os.mkdir(os.path.join(self._serving_dir, '.git'))
+    for file_name, contents in (('index.html', '<html>Hello</html>'),
+                                ('data.bin', ''.join(map(chr, range(256)))),
+                                ('.git/config', 'hidden')):
+      with open(os.path.join(self._serving_dir, file_name), 'wb') as f:
+        f.write(contents)
+    # The handler resolves request paths against the cwd.
+    self.addCleanup(os.chdir, os.getcwd())
+    os.chdir(self._serving_dir)
+    self._httpd = None
+
+  def tearDown(self):
+    if self._httpd:
+      self._httpd.shutdown()
+      self._httpd.server_close()
+    shutil.rmtree(self._serving_dir)
+
+  def _StartServer(self, max_threads=None, lazy=True):
+    handler = memory_cache_http_server.MemoryCacheHTTPRequestHandler
+    if lazy:
+      self._httpd = memory_cache_http_server._LazyMemoryCacheHTTPServerImpl(
+          ('127.0.0.1', 0), handler, [self._serving_dir], max_threads)
+    else:
+      self._httpd = memory_cache_http_server._MemoryCacheHTTPServerImpl(
+          ('127.0.0.1', 0), handler, [self._serving_dir])
+    thread = threading.Thread(target=self._httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+  def _Get(self, path, headers=None):
+    connection = httplib.HTTPConnection(*self._httpd.server_address)
+    try:
+      connection.request('GET', path, headers=headers or {})
+      response = connection.getresponse()
+      return response.status, dict(response.getheaders()), response.read()
+    finally:
+      connection.close()
+
+  def _CheckResponses(self):
+    status, headers, body = self._Get('/')
+    self.assertEquals(200, status)
+    self.assertEquals('gzip', headers['content-encoding'])
+    self.assertEquals('<html>Hello</html>',
+                      gzip.GzipFile(fileobj=StringIO.StringIO(body)).read())
+
+    status, headers, body = self._Get('/data.bin')
+    self.assertEquals(200, status)
+    self.assertEquals(''.join(map(chr, range(256))), body)
+
+    status, headers, body = self._Get('/data.bin', {'Range': 'bytes=2-5'})
+    self.assertEquals(206, status)
+    self.assertEquals('bytes 2-5/256', headers['content-range'])
+    self.assertEquals('\x02\x03\x04\x05', body)
+
+    self.assertEquals(404, self._Get('/.git/config')[0])
+    self.assertEquals(404, self._Get('/missing.html')[0])
+
+  def testLazyLoading(self):
+    self._StartServer()
+    self.assertEquals({}, self._httpd.resource_map)
+    self._CheckResponses()
+
+  def testThreadPool(self):
+    self._StartServer(max_threads=memory_cache_http_server.MIN_POOLED_THREADS)
+    for _ in xrange(3):
+      self._CheckResponses()
+
+  def testSymlinksAreServedLikeWhenEager(self):
+    outside_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, outside_dir)
+    for file_name in ('outside.bin', 'other.bin'):
+      with open(os.path.join(outside_dir, file_name), 'wb') as f:
+        f.write('outside')
+    os.symlink(os.path.join(outside_dir, 'outside.bin'),
+               os.path.join(self._serving_dir, 'file_link.bin'))
+    os.symlink(outside_dir, os.path.join(self._serving_dir, 'dir_link'))
+
+    for lazy in (False, True):
+      self._StartServer(lazy=lazy)
+      self.assertEquals((200, 'outside'),
+                        self._Get('/file_link.bin')[::2], lazy)
+      self.assertEquals(404, self._Get('/dir_link/other.bin')[0], lazy)
+      self._httpd.shutdown()
+      self._httpd.server_close()
+
+  def testPooledConnectionsOnlyTimeOutWaitingForRequests(self):
+    self._Patch(memory_cache_http_server, '_POOLED_CONNECTION_TIMEOUT', 0.2)
+    size = 16 * 1024 * 1024
+    with open(os.path.join(self._serving_dir, 'large.bin'), 'wb') as f:
+      f.write('x' * size)
+    self._StartServer(max_threads=memory_cache_http_server.MIN_POOLED_THREADS)
+
+    # A client that doesn't read for a while still gets the whole response.
+    connection = httplib.HTTPConnection(*self._httpd.server_address)
+    connection.request('GET', '/large.bin')
+    time.sleep(0.5)
+    response = connection.getresponse()
+    self.assertEquals(size, len(response.read()))
+
+    # An idle keep-alive connection is closed.
+    time.sleep(0.5)
+    connection.sock.settimeout(5)
+    self.assertEquals('', connection.sock.recv(1))
+    connection.close()
+
+  def _Patch(self, obj, name, value):
+    self.addCleanup(setattr, obj, name, getattr(obj, name))
+    setattr(obj, name, value)
+
+  def testTooFewThreads(self):
+    with self.assertRaises(AssertionError):
+      memory_cache_http_server.MemoryCacheHTTPServer(
+          [self._serving_dir], lazy=True,
+          max_threads=memory_cache_http_server.MIN_POOLED_THREADS - 1)
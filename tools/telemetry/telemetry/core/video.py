@@ -2,7 +2,10 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import hashlib
+import Queue
 import subprocess
+import threading
 
 from telemetry.core import platform
 from telemetry.image_processing import image_util
@@ -11,6 +14,9 @@ from telemetry.util import cloud_storage
 
 HIGHLIGHT_ORANGE_FRAME = rgba_color.WEB_PAGE_TEST_ORANGE
 
+# Number of frame buffers the decoder may fill ahead of the consumer.
+_FRAME_BUFFER_COUNT = 8
+
 class BoundingBoxNotFoundException(Exception):
   pass
 
@@ -32,20 +38,26 @@ class Video(object):
     """
     cloud_storage.Insert(bucket, target_path, self._video_file_obj.name)
 
-  def GetVideoFrameIter(self):
+  def GetVideoFrameIter(self, skip_duplicate_frames=False):
     """Returns the iteration for processing the video capture.
 
     This looks for the initial color flash in the first frame to establish the
     tab content boundaries and then omits all frames displaying the flash.
 
+    Args:
+      skip_duplicate_frames: If True, frames identical to their predecessor
+          are dropped before any image processing is done on them.
+
     Yields:
       (time_ms, image) tuples representing each video keyframe. Only the first
       frame is a run of sequential duplicate bitmaps is typically included.
         time_ms is milliseconds since navigationStart.
         image may be a telemetry.core.Bitmap, or a numpy array depending on
-        whether numpy is installed.
+        whether numpy is installed. It is only valid until the next frame is
+        requested.
     """
-    frame_generator = self._FramesFromMp4(self._video_file_obj.name)
+    frame_generator = self._FramesFromMp4(self._video_file_obj.name,
+                                          skip_duplicate_frames)
 
     # Flip through frames until we find the initial tab contents flash.
     content_box = None
@@ -115,7 +127,7 @@ class Video(object):
 
     return self._tab_contents_bounding_box
 
-  def _FramesFromMp4(self, mp4_file):
+  def _FramesFromMp4(self, mp4_file, skip_duplicate_frames=False):
     host_platform = platform.GetHostPlatform()
     if not host_platform.CanLaunchApplication('avconv'):
       host_platform.InstallApplication('avconv')
@@ -135,37 +147,110 @@ class Video(object):
                           output)
       return dimensions
 
-    def GetFrameTimestampMs(stderr):
-      """Returns the frame timestamp in integer milliseconds from the dump log.
+    width, height = GetDimensions(mp4_file)
+    # Use rawvideo so that we don't need any external library to parse frames.
+    frame_source = _RawVideoFrameSource(
+        ['avconv', '-i', mp4_file, '-vcodec', 'rawvideo', '-pix_fmt', 'rgb24',
+         '-dump', '-loglevel', 'debug', '-f', 'rawvideo', '-'],
+        width, height, skip_duplicate_frames)
+    return frame_source.GetFrames()
+
 
-      The expected line format is:
-      '  dts=1.715  pts=1.715\n'
+class _RawVideoFrameSource(object):
+  """Decodes rgb24 frames from a rawvideo decoder process in the background.
 
-      We have to be careful to only read a single timestamp per call to avoid
-      deadlock because avconv interleaves its writes to stdout and stderr.
-      """
+  The decoder writes raw frames to stdout and logs one '  dts=1.715  pts=1.715'
+  line per frame to stderr. Both streams are drained by their own threads, so
+  decoding overlaps with the processing of earlier frames. Frames are read
+  into a ring of preallocated buffers which are recycled once the consumer
+  asks for the next frame. If |skip_duplicate_frames| is set, frames are
+  hashed as they are read and those identical to their predecessor are
+  dropped.
+  """
+
+  def __init__(self, args, width, height, skip_duplicate_frames=False,
+               buffer_count=_FRAME_BUFFER_COUNT):
+    assert buffer_count >= 2, 'Need a buffer for the decoder and the consumer.'
+    self._width = width
+    self._height = height
+    self._skip_duplicate_frames = skip_duplicate_frames
+    self._free_buffers = Queue.Queue()
+    for _ in xrange(buffer_count):
+      self._free_buffers.put(bytearray(width * height * 3))
+    self._frames = Queue.Queue()
+    self._timestamps = Queue.Queue()
+    self._error = None
+
+    self._proc = subprocess.Popen(args, stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE)
+    self._threads = [threading.Thread(target=self._ReadFrames),
+                     threading.Thread(target=self._ReadTimestamps)]
+    for thread in self._threads:
+      thread.daemon = True
+      thread.start()
+
+  def _ReadFrames(self):
+    """Reads whole frames from stdout, hashing them if duplicates are skipped.
+    """
+    try:
       while True:
-        line = ''
-        next_char = ''
-        while next_char != '\n':
-          next_char = stderr.read(1)
-          line += next_char
+        frame_data = self._free_buffers.get()
+        if frame_data is None:
+          break
+        num_read = self._proc.stdout.readinto(frame_data)
+        if not num_read:
+          break
+        if num_read != len(frame_data):
+          self._error = 'Unexpected frame size: %d' % num_read
+          break
+        digest = None
+        if self._skip_duplicate_frames:
+          digest = hashlib.sha1(frame_data).digest()
+        self._frames.put((frame_data, digest))
+    finally:
+      self._frames.put(None)
+
+  def _ReadTimestamps(self):
+    """Parses frame timestamps in integer milliseconds from the dump log."""
+    try:
+      for line in iter(self._proc.stderr.readline, ''):
         if 'pts=' in line:
-          return int(1000 * float(line.split('=')[-1]))
+          self._timestamps.put(int(1000 * float(line.split('=')[-1])))
+    finally:
+      self._timestamps.put(None)
 
-    dimensions = GetDimensions(mp4_file)
-    frame_length = dimensions[0] * dimensions[1] * 3
-    frame_data = bytearray(frame_length)
+  def GetFrames(self):
+    """Yields (timestamp_ms, image) for each decoded frame.
 
-    # Use rawvideo so that we don't need any external library to parse frames.
-    proc = subprocess.Popen(['avconv', '-i', mp4_file, '-vcodec',
-                             'rawvideo', '-pix_fmt', 'rgb24', '-dump',
-                             '-loglevel', 'debug', '-f', 'rawvideo', '-'],
-                            stderr=subprocess.PIPE, stdout=subprocess.PIPE)
-    while True:
-      num_read = proc.stdout.readinto(frame_data)
-      if not num_read:
-        raise StopIteration
-      assert num_read == len(frame_data), 'Unexpected frame size: %d' % num_read
-      yield (GetFrameTimestampMs(proc.stderr),
-             image_util.FromRGBPixels(dimensions[0], dimensions[1], frame_data))
+    Each image shares its pixels with a ring buffer and is only valid until the
+    next frame is requested.
+    """
+    frame_data = None
+    last_digest = None
+    try:
+      while True:
+        if frame_data is not None:
+          self._free_buffers.put(frame_data)
+        frame = self._frames.get()
+        if frame is None:
+          break
+        frame_data, digest = frame
+        timestamp = self._timestamps.get()
+        assert timestamp is not None, 'Missing timestamp for decoded frame.'
+        if digest is not None and digest == last_digest:
+          continue
+        last_digest = digest
+        yield timestamp, image_util.FromRGBPixels(self._width, self._height,
+                                                  frame_data)
+      assert not self._error, self._error
+    finally:
+      self._Close()
+
+  def _Close(self):
+    # Unblock the frame reader if it is waiting for a free buffer.
+    self._free_buffers.put(None)
+    if self._proc.poll() is None:
+      self._proc.kill()
+    self._proc.wait()
+    for thread in self._threads:
+      thread.join()
@@ -4,6 +4,7 @@
 
 import logging
 import os
+import sys
 import unittest
 
 from telemetry.core import platform
@@ -48,3 +49,42 @@ class VideoTest(unittest.TestCase):
       expected_bitmap = image_util.FromPngFile(os.path.join(
           util.GetUnittestDataDir(), 'frame%d.png' % i))
       self.assertTrue(image_util.AreEqual(expected_bitmap, bmp))
+
+
+# Writes 2x1 rgb24 frames to stdout and their timestamps to stderr the way
+# avconv -dump does. The third frame repeats the second one.
+_FAKE_DECODER = r"""
+import sys
+for i, frame in enumerate(['\x01' * 6, '\x02' * 6, '\x02' * 6, '\x03' * 6]):
+  sys.stdout.write(frame)
+  sys.stdout.flush()
+  sys.stderr.write('  dts=%.3f  pts=%.3f\n' % (i * 0.5, i * 0.5))
+"""
+
+
+class RawVideoFrameSourceTest(unittest.TestCase):
+
+  def _GetFrames(self, skip_duplicate_frames, buffer_count=2):
+    # pylint: disable=W0212
+    frame_source = video._RawVideoFrameSource(
+        [sys.executable, '-c', _FAKE_DECODER], 2, 1,
+        skip_duplicate_frames=skip_duplicate_frames, buffer_count=buffer_count)
+    return [(timestamp, image_util.GetPixelColor(bmp, 1, 0).r)
+            for timestamp, bmp in frame_source.GetFrames()]
+
+  def testGetFrames(self):
+    self.assertEquals([(0, 1), (500, 2), (1000, 2), (1500, 3)],
+                      self._GetFrames(skip_duplicate_frames=False))
+
+  def testGetFramesSkipsDuplicateFrames(self):
+    self.assertEquals([(0, 1), (500, 2), (1500, 3)],
+                      self._GetFrames(skip_duplicate_frames=True))
+
+  def testStopIteratingEarly(self):
+    # pylint: disable=W0212
+    frame_source = video._RawVideoFrameSource(
+        [sys.executable, '-c', _FAKE_DECODER], 2, 1, buffer_count=2)
+    frames = frame_source.GetFrames()
+    self.assertEquals(0, next(frames)[0])
+    frames.close()
+    self.assertIsNotNone(frame_source._proc.returncode)
@@ -3,9 +3,13 @@
 # found in the LICENSE file.
 # pylint: disable=W0212
 
+import collections
 import functools
 import inspect
+import threading
+import time
 import types
+import weakref
 
 
 def Cache(obj):
@@ -22,15 +26,238 @@ def Cache(obj):
   Cached methods maintain their cache for the lifetime of the /instance/, while
   cached functions maintain their cache for the lifetime of the /module/.
   """
-  @functools.wraps(obj)
-  def Cacher(*args, **kwargs):
-    cacher = args[0] if inspect.getargspec(obj).args[:1] == ['self'] else obj
-    cacher.__cache = cacher.__cache if hasattr(cacher, '__cache') else {}
-    key = str(obj) + str(args) + str(kwargs)
-    if key not in cacher.__cache:
-      cacher.__cache[key] = obj(*args, **kwargs)
-    return cacher.__cache[key]
-  return Cacher
+  return Memoize()(obj)
+
+
+CacheInfo = collections.namedtuple(
+    'CacheInfo', ['hits', 'misses', 'evictions'])
+
+
+def Memoize(max_size=None, ttl=None):
+  """Decorator factory for caching return values, like Cache.
+
+  Example usage (keeps the 100 most recently used results for a minute):
+    @Memoize(max_size=100, ttl=60)
+    def ReadFoo(path):
+      ...
+
+  Arguments are compared by type and value: lists, tuples, dicts and sets by
+  their contents, other hashable arguments by their hash and equality, and
+  any other argument by its str(). Arguments that are only equal to themselves,
+  like tabs, are held by weak reference, so the cache doesn't keep them alive,
+  and their results are dropped once they are garbage collected. Methods, i.e.
+  functions whose first argument is named self, keep one cache per instance,
+  keyed by the other arguments.
+
+  The decorated function has two more attributes: cache_info(), which returns
+  a CacheInfo with the hits, misses and evictions across all of its caches,
+  and cache_clear(), which empties all of its caches, including those of
+  instances, and resets the counters.
+
+  The caches may be used from several threads. The function itself is called
+  outside of any lock, so concurrent misses on the same arguments each compute
+  the result.
+
+  Args:
+    max_size: If given, the least recently used result is evicted once a cache
+        holds more than this many results.
+    ttl: If given, results are recomputed when they are older than this many
+        seconds.
+  """
+  def _Memoize(obj):
+    # The argspec is only needed to tell methods apart, so it is looked up
+    # once here instead of on every call.
+    is_method = inspect.getargspec(obj).args[:1] == ['self']
+    stats = _MemoizeStats()
+    function_cache = _MemoizeCache(max_size, ttl, stats)
+    instance_caches = weakref.WeakSet()
+
+    @functools.wraps(obj)
+    def Cacher(*args, **kwargs):
+      if is_method:
+        caches = args[0].__dict__.setdefault('_memoize_caches', {})
+        cache = caches.get(Cacher)
+        if cache is None:
+          new_cache = _MemoizeCache(max_size, ttl, stats)
+          cache = caches.setdefault(Cacher, new_cache)
+          if cache is new_cache:
+            instance_caches.add(cache)
+        key_args = args[1:]
+      else:
+        cache = function_cache
+        key_args = args
+      refs = []
+      key = _MemoizeKey((key_args, kwargs), cache.OnArgumentCollected, refs)
+      found, value = cache.Get(key)
+      if not found:
+        value = obj(*args, **kwargs)
+        cache.Set(key, refs, value)
+      return value
+
+    def CacheClear():
+      function_cache.Clear()
+      for cache in list(instance_caches):
+        cache.Clear()
+      stats.Reset()
+
+    Cacher.cache_info = stats.GetInfo
+    Cacher.cache_clear = CacheClear
+    return Cacher
+  return _Memoize
+
+
+def _MemoizeKey(value, on_collected, refs):
+  """Returns a hashable key that compares equal for equal arguments.
+
+  Arguments that are held by weak reference call |on_collected| with their
+  reference once they are garbage collected. The references are appended to
+  |refs|.
+  """
+  if isinstance(value, (tuple, list)):
+    return (type(value),
+            tuple(_MemoizeKey(v, on_collected, refs) for v in value))
+  if isinstance(value, dict):
+    return (type(value), frozenset(
+        (_MemoizeKey(k, on_collected, refs),
+         _MemoizeKey(v, on_collected, refs))
+        for k, v in value.iteritems()))
+  if isinstance(value, (set, frozenset)):
+    return (type(value),
+            frozenset(_MemoizeKey(v, on_collected, refs) for v in value))
+  try:
+    hash(value)
+  except TypeError:
+    # E.g. optparse.Values, which compares by its contents.
+    return (type(value), str(value))
+  if _HasIdentityHash(value):
+    try:
+      ref = weakref.ref(value, on_collected)
+    except TypeError:
+      # E.g. instances of classes with __slots__.
+      return (type(value), str(value))
+    refs.append(ref)
+    return (type(value), ref)
+  # The type keeps e.g. 1 and True apart.
+  return (type(value), value)
+
+
+def _HasIdentityHash(value):
+  """Returns whether |value| is hashed by identity, i.e. only equals itself."""
+  if isinstance(value, types.InstanceType):
+    return not (hasattr(value, '__hash__') or hasattr(value, '__eq__') or
+                hasattr(value, '__cmp__'))
+  return not any(name in cls.__dict__
+                 for cls in type(value).__mro__[:-1]
+                 for name in ('__hash__', '__eq__', '__cmp__'))
+
+
+class _MemoizeStats(object):
+  """Counters shared by all caches of a function, and the lock guarding them.
+  """
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.Reset()
+
+  def Reset(self):
+    with self.lock:
+      self.hits = 0
+      self.misses = 0
+      self.evictions = 0
+
+  def GetInfo(self):
+    with self.lock:
+      return CacheInfo(self.hits, self.misses, self.evictions)
+
+
+class _MemoizeCache(object):
+  """Results keyed by arguments, oldest first, with their time of creation.
+
+  The caches of a function share the lock of their stats.
+  """
+  def __init__(self, max_size, ttl, stats):
+    self._max_size = max_size
+    self._ttl = ttl
+    self._stats = stats
+    self._lock = stats.lock
+    # Maps each key to (value, time of creation, weak references in the key,
+    # key). Keys of dead references only equal themselves, so the stored key
+    # is kept to reinsert it.
+    self._entries = collections.OrderedDict()
+    # Maps weak references to the keys that contain them.
+    self._keys_by_ref = {}
+    # References whose referent was collected, to be removed with their keys.
+    self._collected_refs = []
+
+  def Get(self, key):
+    """Returns (True, value) for a cached result, or (False, None)."""
+    with self._lock:
+      self._RemoveCollected()
+      entry = self._entries.get(key)
+      if entry is not None and self._ttl is not None:
+        if time.time() - entry[1] > self._ttl:
+          self._Remove(key)
+          self._stats.evictions += 1
+          entry = None
+      if entry is None:
+        self._stats.misses += 1
+        return False, None
+      self._stats.hits += 1
+      if self._max_size is not None:
+        # Move the entry to the end, as the most recently used.
+        del self._entries[key]
+        self._entries[entry[3]] = entry
+      return True, entry[0]
+
+  def Set(self, key, refs, value):
+    """Caches |value| for |key|, which holds the weak references |refs|."""
+    with self._lock:
+      self._RemoveCollected()
+      # Another thread may have cached the same arguments meanwhile. Its key
+      # holds other references, so it is replaced as a whole.
+      self._Remove(key)
+      self._entries[key] = (value, time.time(), refs, key)
+      for ref in refs:
+        self._keys_by_ref.setdefault(ref, set()).add(key)
+      if self._max_size is not None:
+        while len(self._entries) > self._max_size:
+          self._Remove(next(iter(self._entries)))
+          self._stats.evictions += 1
+
+  def Clear(self):
+    with self._lock:
+      self._entries.clear()
+      self._keys_by_ref.clear()
+      del self._collected_refs[:]
+
+  def OnArgumentCollected(self, ref):
+    """Removes the results for arguments that were garbage collected.
+
+    This may run in any thread, at any allocation, even while that thread
+    holds the lock. So the reference is queued and only removed right away if
+    the lock is free.
+    """
+    self._collected_refs.append(ref)
+    if self._lock.acquire(False):
+      try:
+        self._RemoveCollected()
+      finally:
+        self._lock.release()
+
+  def _RemoveCollected(self):
+    while self._collected_refs:
+      for key in self._keys_by_ref.pop(self._collected_refs.pop(), ()):
+        self._Remove(key)
+
+  def _Remove(self, key):
+    entry = self._entries.pop(key, None)
+    if entry is None:
+      return
+    for ref in entry[2]:
+      keys = self._keys_by_ref.get(ref)
+      if keys is not None:
+        keys.discard(key)
+        if not keys:
+          del self._keys_by_ref[ref]
 
 
 def Disabled(*args):
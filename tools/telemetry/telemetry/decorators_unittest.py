@@ -2,7 +2,9 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import threading
 import unittest
+import weakref
 
 from telemetry import decorators
 
@@ -82,3 +84,139 @@ class TestShouldSkip(unittest.TestCase):
 
     test.SetDisabledStrings(['another_os_name', 'another_os_version_name'])
     self.assertFalse(decorators.ShouldSkip(test, possible_browser)[0])
+
+
+class TestMemoize(unittest.TestCase):
+  def setUp(self):
+    self._calls = []
+    self._now = 0
+    self._actual_time = decorators.time.time
+    decorators.time.time = lambda: self._now
+
+  def tearDown(self):
+    decorators.time.time = self._actual_time
+
+  def _CreateFunction(self, **kwargs):
+    @decorators.Memoize(**kwargs)
+    def Function(*args, **kwargs):
+      self._calls.append((args, kwargs))
+      return len(self._calls)
+    return Function
+
+  def testArgumentsAreComparedByValue(self):
+    function = self._CreateFunction()
+    self.assertEquals(1, function([1, 2], {'a': [3]}, b=set([4])))
+    self.assertEquals(1, function([1, 2], {'a': [3]}, b=set([4])))
+    self.assertEquals(2, function([1, 2], {'a': [4]}, b=set([4])))
+    self.assertEquals(3, function((1, 2), {'a': [3]}, b=set([4])))
+    self.assertEquals(4, function(True))
+    self.assertEquals(5, function(1))
+    self.assertEquals(decorators.CacheInfo(hits=1, misses=5, evictions=0),
+                      function.cache_info())
+
+    function.cache_clear()
+    self.assertEquals(decorators.CacheInfo(hits=0, misses=0, evictions=0),
+                      function.cache_info())
+    self.assertEquals(6, function(1))
+
+  def testArgumentsComparedByIdentityAreNotKeptAlive(self):
+    class Tab(object):
+      pass
+
+    @decorators.Cache
+    def Function(_):
+      self._calls.append(None)
+      return len(self._calls)
+
+    tab = Tab()
+    tab_ref = weakref.ref(tab)
+    self.assertEquals(1, Function(tab))
+    self.assertEquals(1, Function(tab))
+    self.assertEquals(2, Function(Tab()))
+    del tab
+    self.assertIsNone(tab_ref())
+
+  def testLeastRecentlyUsedIsEvicted(self):
+    function = self._CreateFunction(max_size=2)
+    self.assertEquals(1, function('a'))
+    self.assertEquals(2, function('b'))
+    self.assertEquals(1, function('a'))
+    self.assertEquals(3, function('c'))
+    self.assertEquals(1, function('a'))
+    self.assertEquals(4, function('b'))
+    self.assertEquals(decorators.CacheInfo(hits=2, misses=4, evictions=2),
+                      function.cache_info())
+
+  def testExpiredResultIsRecomputed(self):
+    function = self._CreateFunction(ttl=10)
+    self.assertEquals(1, function('a'))
+    self._now = 10
+    self.assertEquals(1, function('a'))
+    self._now = 11
+    self.assertEquals(2, function('a'))
+    self.assertEquals(decorators.CacheInfo(hits=1, misses=2, evictions=1),
+                      function.cache_info())
+
+  def testMethodsAreCachedPerInstance(self):
+    calls = self._calls
+
+    class Foo(object):
+      @decorators.Cache
+      def Bar(self, value):
+        calls.append(value)
+        return len(calls)
+
+    foo1 = Foo()
+    foo2 = Foo()
+    self.assertEquals(1, foo1.Bar('a'))
+    self.assertEquals(1, foo1.Bar('a'))
+    self.assertEquals(2, foo2.Bar('a'))
+    self.assertEquals(decorators.CacheInfo(hits=1, misses=2, evictions=0),
+                      Foo.Bar.cache_info())
+
+  def testResultsForCollectedArgumentsAreDropped(self):
+    class Tab(object):
+      pass
+
+    class Result(object):
+      pass
+
+    @decorators.Cache
+    def Function(_):
+      return Result()
+
+    tab = Tab()
+    result_ref = weakref.ref(Function(tab))
+    self.assertIsNotNone(result_ref())
+    del tab
+    self.assertIsNone(result_ref())
+
+  def testCacheClearClearsInstanceCaches(self):
+    calls = self._calls
+
+    class Foo(object):
+      @decorators.Cache
+      def Bar(self):
+        calls.append(None)
+        return len(calls)
+
+    foo = Foo()
+    self.assertEquals(1, foo.Bar())
+    Foo.Bar.cache_clear()
+    self.assertEquals(2, foo.Bar())
+    self.assertEquals(decorators.CacheInfo(hits=0, misses=1, evictions=0),
+                      Foo.Bar.cache_info())
+
+  def testConcurrentCalls(self):
+    function = self._CreateFunction(max_size=10)
+    def Call():
+      for i in xrange(1000):
+        function(i % 20)
+    threads = [threading.Thread(target=Call) for _ in xrange(4)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    info = function.cache_info()
+    self.assertEquals(4000, info.hits + info.misses)
+    self.assertEquals(info.misses, len(self._calls))
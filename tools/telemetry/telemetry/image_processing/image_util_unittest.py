@@ -102,6 +102,19 @@ class ImageUtilTest(unittest.TestCase):
     image_util.GetPixelColor(diff_bmp, 2, 1).AssertIsRGB(255, 255, 255)
     image_util.GetPixelColor(diff_bmp, 2, 2).AssertIsRGB(255, 255, 255)
 
+  def testDiffOfTallAndWideBitmaps(self):
+    tall_bmp = image_util.FromRGBPixels(1, 2, [1,2,3, 4,5,6])
+    wide_bmp = image_util.FromRGBPixels(2, 1, [1,2,3, 7,8,9])
+
+    diff_bmp = image_util.Diff(tall_bmp, wide_bmp)
+
+    self.assertEquals(2, image_util.Width(diff_bmp))
+    self.assertEquals(2, image_util.Height(diff_bmp))
+    image_util.GetPixelColor(diff_bmp, 0, 0).AssertIsRGB(0, 0, 0)
+    image_util.GetPixelColor(diff_bmp, 1, 0).AssertIsRGB(7, 8, 9)
+    image_util.GetPixelColor(diff_bmp, 0, 1).AssertIsRGB(4, 5, 6)
+    image_util.GetPixelColor(diff_bmp, 1, 1).AssertIsRGB(0, 0, 0)
+
   def testGetBoundingBox(self):
     pixels = [0,0,0, 0,0,0, 0,0,0, 0,0,0,
               0,0,0, 1,0,0, 1,0,0, 0,0,0,
@@ -127,3 +140,24 @@ class ImageUtilTest(unittest.TestCase):
     image_util.GetPixelColor(bmp, 0, 0).AssertIsRGB(1, 2, 0)
     image_util.GetPixelColor(bmp, 1, 0).AssertIsRGB(2, 2, 0)
     self.assertEquals(image_util.Pixels(bmp), bytearray([1,2,0, 2,2,0]))
+
+  def testCroppedRgbaBoundingBoxAndHistogram(self):
+    pixels = [0,0,0,255, 9,0,0,255, 0,0,0,255, 0,0,0,255,
+              0,0,0,255, 8,1,0,0, 8,0,0,255, 0,0,0,255,
+              0,0,0,255, 0,0,0,255, 0,0,0,255, 9,0,0,255]
+    bmp = image_util.FromRGBPixels(4, 3, pixels, bpp=4)
+    bmp = image_util.Crop(bmp, 1, 1, 3, 2)
+
+    box, count = image_util.GetBoundingBox(bmp, RgbaColor(8, 0, 0))
+    self.assertEquals(box, (1, 0, 1, 1))
+    self.assertEquals(count, 1)
+    box, count = image_util.GetBoundingBox(bmp, RgbaColor(8, 0, 0),
+                                           tolerance=1)
+    self.assertEquals(box, (0, 0, 3, 2))
+    self.assertEquals(count, 3)
+
+    hist = image_util.GetColorHistogram(bmp, RgbaColor(0, 0, 0), 0)
+    self.assertEquals(hist.r[8], 2)
+    self.assertEquals(hist.r[9], 1)
+    self.assertEquals(hist.g[1], 1)
+    self.assertEquals(sum(hist.r), 3)
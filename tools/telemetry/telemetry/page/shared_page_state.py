@@ -41,6 +41,7 @@ class SharedPageState(shared_user_story_state.SharedUserStoryState):
     super(SharedPageState, self).__init__(test, finder_options, user_story_set)
     if isinstance(test, timeline_based_measurement.TimelineBasedMeasurement):
       self._test = timeline_based_page_test.TimelineBasedPageTest(test)
+      test.StartBackgroundMetricProcesses()
     else:
       self._test = test
     device_type = self._device_type or user_story_set.user_agent_type
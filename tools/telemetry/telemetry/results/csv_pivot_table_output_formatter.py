@@ -42,8 +42,7 @@ class CsvPivotTableOutputFormatter(output_formatter.OutputFormatter):
     csv_writer.writerow(self.FIELDS + tag_headers)
 
     # Write all values. Each row contains a value + page-level metadata.
-    for run in page_test_results.all_page_runs:
-      run_index = page_test_results.all_page_runs.index(run)
+    for run_index, run in enumerate(page_test_results.IterAllPageRuns()):
       page_dict = {
           'page': run.user_story.display_name,
           'page_set': run.user_story.page_set.Name(),
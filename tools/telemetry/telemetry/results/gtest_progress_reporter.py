@@ -66,7 +66,7 @@ class GTestProgressReporter(progress_reporter.ProgressReporter):
     super(GTestProgressReporter, self).DidFinishAllTests(page_test_results)
     successful_runs = []
     failed_runs = []
-    for run in page_test_results.all_page_runs:
+    for run in page_test_results.IterAllPageRunsForOutcome():
       if run.failed:
         failed_runs.append(run)
       else:
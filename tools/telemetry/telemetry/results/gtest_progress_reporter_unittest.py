@@ -10,6 +10,7 @@ from telemetry.page import page_set
 from telemetry.results import base_test_results_unittest
 from telemetry.results import gtest_progress_reporter
 from telemetry.results import page_test_results
+from telemetry.results import user_story_run_store
 from telemetry.unittest_util import simple_mock
 from telemetry.value import failure
 from telemetry.value import skip
@@ -159,6 +160,29 @@ class GTestProgressReporterTest(
                 '%s\n'
                 '[  FAILED  ] http://www.bar.com/ (2 ms)\n' % exception_trace)
 
+  def testSummaryDoesNotReadStoredRuns(self):
+    test_page_set = _MakePageSet()
+    store = user_story_run_store.UserStoryRunStore()
+    results = page_test_results.PageTestResults(
+        progress_reporter=self._reporter, user_story_run_store=store)
+
+    results.WillRunPage(test_page_set.pages[0])
+    results.DidRunPage(test_page_set.pages[0])
+    results.WillRunPage(test_page_set.pages[1])
+    results.AddValue(failure.FailureValue.FromMessage(test_page_set.pages[1],
+                                                      'Failure'))
+    results.DidRunPage(test_page_set.pages[1])
+
+    # The file of a cleaned up store can't be read anymore.
+    store.CleanUp()
+    del self._output_stream.output_data[:]
+    self._reporter.DidFinishAllTests(results)
+    expected = ('[  PASSED  ] 1 test.\n'
+                '[  FAILED  ] 1 test, listed below:\n'
+                '[  FAILED  ]  http://www.bar.com/\n\n'
+                '1 FAILED TEST\n\n')
+    self.assertEquals(expected, ''.join(self._output_stream.output_data))
+
   def testOutputSkipInformation(self):
     test_page_set = _MakePageSet()
     self._reporter = gtest_progress_reporter.GTestProgressReporter(
@@ -27,7 +27,7 @@ def ResultsAsDict(page_test_results, benchmark_metadata):
     'summary_values': [v.AsDict() for v in
                        page_test_results.all_summary_values],
     'per_page_values': [v.AsDict() for v in
-                        page_test_results.all_page_specific_values],
+                        page_test_results.IterAllPageSpecificValues()],
     'pages': {p.id: p.AsDict() for p in _GetAllPages(page_test_results)}
   }
   if page_test_results.serialized_trace_file_ids_to_paths:
@@ -37,7 +37,7 @@ def ResultsAsDict(page_test_results, benchmark_metadata):
 
 def _GetAllPages(page_test_results):
   pages = set(page_run.user_story for page_run in
-              page_test_results.all_page_runs)
+              page_test_results.IterAllPageRuns())
   return pages
 
 
@@ -5,6 +5,7 @@
 import collections
 import copy
 import datetime
+import heapq
 import itertools
 import logging
 import random
@@ -23,7 +24,8 @@ from telemetry.value import trace
 class PageTestResults(object):
   def __init__(self, output_stream=None, output_formatters=None,
                progress_reporter=None, trace_tag='', output_dir=None,
-               value_can_be_added_predicate=lambda v, is_first: True):
+               value_can_be_added_predicate=lambda v, is_first: True,
+               user_story_run_store=None):
     """
     Args:
       output_stream: The output stream to use to write test results.
@@ -41,6 +43,9 @@ class PageTestResults(object):
           and a boolean (True when the value is part of the first result for
           the user story). It returns True if the value can be added to the
           test results and False otherwise.
+      user_story_run_store: An optional UserStoryRunStore. If given, finished
+          runs are moved to the store instead of being kept in memory, and
+          only failure, skip and trace values are indexed.
     """
     # TODO(chrishenry): Figure out if trace_tag is still necessary.
 
@@ -54,10 +59,23 @@ class PageTestResults(object):
     self._trace_tag = trace_tag
     self._output_dir = output_dir
     self._value_can_be_added_predicate = value_can_be_added_predicate
+    self._user_story_run_store = user_story_run_store
 
     self._current_page_run = None
     self._all_page_runs = []
+    # Finished runs that still wait for deferred values before they can be
+    # moved to the user story run store, in the order they finished.
+    self._unstored_page_runs = []
+    # (run, get_values, is_first_result, is_ready) for each call to
+    # AddDeferredValues whose values have not been added yet.
+    self._deferred_values = []
     self._all_user_stories = set()
+    # All page specific values, in the order they were added, with indexes
+    # into that list by (page, name), by name and by value class.
+    self._all_page_specific_values = []
+    self._values_by_page_and_name = collections.defaultdict(list)
+    self._values_by_name = collections.defaultdict(list)
+    self._value_positions_by_class = collections.defaultdict(list)
     self._representative_value_for_each_value_name = {}
     self._all_summary_values = []
     self._serialized_trace_file_ids_to_paths = {}
@@ -71,8 +89,40 @@ class PageTestResults(object):
       if isinstance(v, collections.Container):
         v = copy.copy(v)
       setattr(result, k, v)
+    # The index lists would otherwise be shared with the original.
+    result._ReindexValues()
     return result
 
+  def _IndexValue(self, value):
+    if (self._user_story_run_store and
+        not self._user_story_run_store.KeepsInMemory(value)):
+      return
+    self._values_by_page_and_name[(value.page, value.name)].append(value)
+    self._values_by_name[value.name].append(value)
+    self._value_positions_by_class[value.__class__].append(
+        len(self._all_page_specific_values))
+    self._all_page_specific_values.append(value)
+
+  def _ReindexValues(self):
+    self._all_page_specific_values = []
+    self._values_by_page_and_name = collections.defaultdict(list)
+    self._values_by_name = collections.defaultdict(list)
+    self._value_positions_by_class = collections.defaultdict(list)
+    runs = list(self.IterAllPageRunsForOutcome())
+    if self._current_page_run:
+      runs.append(self._current_page_run)
+    for run in runs:
+      for value in run.values:
+        self._IndexValue(value)
+
+  def _FindAllValuesOfType(self, value_type):
+    position_lists = [
+        positions for cls, positions
+        in self._value_positions_by_class.iteritems()
+        if issubclass(cls, value_type)]
+    return [self._all_page_specific_values[i]
+            for i in heapq.merge(*position_lists)]
+
   @property
   def serialized_trace_file_ids_to_paths(self):
     return self._serialized_trace_file_ids_to_paths
@@ -83,12 +133,26 @@ class PageTestResults(object):
 
   @property
   def all_page_specific_values(self):
-    values = []
-    for run in self._all_page_runs:
-      values += run.values
+    if self._user_story_run_store:
+      return list(self.IterAllPageSpecificValues())
+    return list(self._all_page_specific_values)
+
+  def IterAllPageSpecificValues(self):
+    """Yields the same values as all_page_specific_values, one at a time.
+
+    When finished runs are kept in a UserStoryRunStore, only one run is read
+    back into memory at a time.
+    """
+    if not self._user_story_run_store:
+      for value in self._all_page_specific_values:
+        yield value
+      return
+    for run in self.IterAllPageRuns():
+      for value in run.values:
+        yield value
     if self._current_page_run:
-      values += self._current_page_run.values
-    return values
+      for value in self._current_page_run.values:
+        yield value
 
   @property
   def all_summary_values(self):
@@ -106,12 +170,31 @@ class PageTestResults(object):
 
   @property
   def all_page_runs(self):
+    if self._user_story_run_store:
+      return list(self.IterAllPageRuns())
     return self._all_page_runs
 
+  def IterAllPageRuns(self):
+    """Yields the finished runs, reading them back from the store if any."""
+    if self._user_story_run_store:
+      return itertools.chain(self._user_story_run_store.IterRuns(),
+                             self._unstored_page_runs)
+    return iter(self._all_page_runs)
+
+  def IterAllPageRunsForOutcome(self):
+    """Like IterAllPageRuns, but the runs may only hold their failure and skip
+    values. This is enough to tell whether a run failed or was skipped, and
+    never reads the store's file."""
+    if self._user_story_run_store:
+      return itertools.chain(
+          self._user_story_run_store.IterRuns(in_memory_values_only=True),
+          self._unstored_page_runs)
+    return iter(self._all_page_runs)
+
   @property
   def pages_that_succeeded(self):
     """Returns the set of pages that succeeded."""
-    pages = set(run.user_story for run in self.all_page_runs)
+    pages = set(run.user_story for run in self.IterAllPageRunsForOutcome())
     pages.difference_update(self.pages_that_failed)
     return pages
 
@@ -119,31 +202,32 @@ class PageTestResults(object):
   def pages_that_failed(self):
     """Returns the set of failed pages."""
     failed_pages = set()
-    for run in self.all_page_runs:
+    for run in self.IterAllPageRunsForOutcome():
       if run.failed:
         failed_pages.add(run.user_story)
     return failed_pages
 
   @property
   def failures(self):
-    values = self.all_page_specific_values
-    return [v for v in values if isinstance(v, failure.FailureValue)]
+    return self._FindAllValuesOfType(failure.FailureValue)
 
   @property
   def skipped_values(self):
-    values = self.all_page_specific_values
-    return [v for v in values if isinstance(v, skip.SkipValue)]
+    return self._FindAllValuesOfType(skip.SkipValue)
 
   def _GetStringFromExcInfo(self, err):
     return ''.join(traceback.format_exception(*err))
 
   def CleanUp(self):
     """Clean up any TraceValues contained within this results object."""
-    for run in self._all_page_runs:
+    for run in itertools.chain(self._all_page_runs, self._unstored_page_runs):
       for v in run.values:
         if isinstance(v, trace.TraceValue):
           v.CleanUp()
           run.values.remove(v)
+    if self._user_story_run_store:
+      self._user_story_run_store.CleanUp()
+    self._ReindexValues()
 
   def __enter__(self):
     return self
@@ -163,22 +247,109 @@ class PageTestResults(object):
     """
     assert self._current_page_run, 'Did not call WillRunPage.'
     self._progress_reporter.DidRunPage(self)
-    self._all_page_runs.append(self._current_page_run)
+    if self._user_story_run_store:
+      self._unstored_page_runs.append(self._current_page_run)
+    else:
+      self._all_page_runs.append(self._current_page_run)
     self._all_user_stories.add(self._current_page_run.user_story)
     self._current_page_run = None
+    if self._user_story_run_store:
+      self.AddReadyDeferredValues()
 
   def AddValue(self, value):
     assert self._current_page_run, 'Not currently running test.'
-    self._ValidateValue(value)
     is_first_result = (
       self._current_page_run.user_story not in self._all_user_stories)
+    if self._AddValueToRun(self._current_page_run, value, is_first_result):
+      self._IndexValue(value)
+
+  def _AddValueToRun(self, run, value, is_first_result):
+    """Adds value to run unless the predicate rejects it.
+
+    Returns whether value was added.
+    """
+    self._ValidateValue(value)
     if not (isinstance(value, skip.SkipValue) or
             isinstance(value, failure.FailureValue) or
             self._value_can_be_added_predicate(value, is_first_result)):
-      return
+      return False
     # TODO(eakuefner/chrishenry): Add only one skip per pagerun assert here
-    self._current_page_run.AddValue(value)
+    run.AddValue(value)
     self._progress_reporter.DidAddValue(value)
+    return True
+
+  def AddDeferredValues(self, get_values, is_ready=None):
+    """Adds values to the current run that are still being computed.
+
+    Args:
+      get_values: A function that takes no arguments, blocks until the values
+          are ready and returns them as a list. It is called once the current
+          run may have finished.
+      is_ready: An optional function that takes no arguments and returns
+          whether get_values would return without blocking. Without it, the
+          values are only added by WaitForDeferredValues.
+    """
+    assert self._current_page_run, 'Not currently running test.'
+    is_first_result = (
+      self._current_page_run.user_story not in self._all_user_stories)
+    self._deferred_values.append(
+        (self._current_page_run, get_values, is_first_result, is_ready))
+
+  @property
+  def num_deferred_values(self):
+    """The number of calls to AddDeferredValues not yet added to a run."""
+    return len(self._deferred_values)
+
+  def AddReadyDeferredValues(self):
+    """Adds the deferred values that are ready, without blocking.
+
+    Deferred values of a run are added in the order they were deferred, so a
+    ready one waits for the earlier ones of its run.
+    """
+    deferred_values = []
+    waiting_runs = set()
+    for deferred in self._deferred_values:
+      run, _, _, is_ready = deferred
+      if (run in waiting_runs or run is self._current_page_run or
+          not is_ready or not is_ready()):
+        waiting_runs.add(run)
+      else:
+        deferred_values.append(deferred)
+    self._AddDeferredValues(deferred_values)
+
+  def WaitForDeferredValues(self):
+    """Adds all deferred values to their runs, blocking until they're ready.
+
+    Deferred values are added after the values their run already has.
+    """
+    self._AddDeferredValues(list(self._deferred_values))
+
+  def _AddDeferredValues(self, deferred_values):
+    if deferred_values:
+      for deferred in deferred_values:
+        self._deferred_values.remove(deferred)
+      indexed_values = False
+      for run, get_values, is_first_result, _ in deferred_values:
+        for value in get_values():
+          if (self._AddValueToRun(run, value, is_first_result) and
+              (not self._user_story_run_store or
+               self._user_story_run_store.KeepsInMemory(value))):
+            indexed_values = True
+      # The deferred values belong before the values of later runs.
+      if indexed_values:
+        self._ReindexValues()
+    self._StoreFinishedRuns()
+
+  def _StoreFinishedRuns(self):
+    """Moves finished runs to the store once none of their values, nor those
+    of an earlier run, are still deferred. Stored runs can no longer be added
+    to, and are stored in the order they finished."""
+    if not self._unstored_page_runs:
+      return
+    deferred_runs = set(run for run, _, _, _ in self._deferred_values)
+    while (self._unstored_page_runs and
+           self._unstored_page_runs[0] not in deferred_runs):
+      self._user_story_run_store.AddRun(self._unstored_page_runs.pop(0))
 
   def AddProfilingFile(self, page, file_handle):
     self._pages_to_profiling_files[page].append(file_handle)
@@ -197,6 +368,7 @@ class PageTestResults(object):
     assert value.IsMergableWith(representative_value)
 
   def PrintSummary(self):
+    self.WaitForDeferredValues()
     self._progress_reporter.DidFinishAllTests(self)
 
     # Only serialize the trace if output_format is json.
@@ -209,25 +381,19 @@ class PageTestResults(object):
       output_formatter.Format(self)
 
   def FindPageSpecificValuesForPage(self, page, value_name):
-    values = []
-    for value in self.all_page_specific_values:
-      if value.page == page and value.name == value_name:
-        values.append(value)
-    return values
+    if self._user_story_run_store:
+      return [v for v in self.IterAllPageSpecificValues()
+              if v.page == page and v.name == value_name]
+    return list(self._values_by_page_and_name.get((page, value_name), []))
 
   def FindAllPageSpecificValuesNamed(self, value_name):
-    values = []
-    for value in self.all_page_specific_values:
-      if value.name == value_name:
-        values.append(value)
-    return values
+    if self._user_story_run_store:
+      return [v for v in self.IterAllPageSpecificValues()
+              if v.name == value_name]
+    return list(self._values_by_name.get(value_name, []))
 
   def FindAllTraceValues(self):
-    values = []
-    for value in self.all_page_specific_values:
-      if isinstance(value, trace.TraceValue):
-        values.append(value)
-    return values
+    return self._FindAllValuesOfType(trace.TraceValue)
 
   def _SerializeTracesToDirPath(self, dir_path):
     """ Serialize all trace values to files in dir_path and return a list of
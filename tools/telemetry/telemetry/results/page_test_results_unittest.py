@@ -9,6 +9,7 @@ from telemetry import page as page_module
 from telemetry.page import page_set
 from telemetry.results import base_test_results_unittest
 from telemetry.results import page_test_results
+from telemetry.results import user_story_run_store
 from telemetry.timeline import trace_data
 from telemetry.value import failure
 from telemetry.value import histogram
@@ -84,6 +85,125 @@ class PageTestResultsTest(base_test_results_unittest.BaseTestResultsUnittest):
     values = results.FindAllPageSpecificValuesNamed('a')
     assert len(values) == 2
 
+  def testFindValuesFollowAddOrder(self):
+    results = page_test_results.PageTestResults()
+    for i in xrange(3):
+      for page in self.pages[:2]:
+        results.WillRunPage(page)
+        results.AddValue(scalar.ScalarValue(page, 'a', 'seconds', i))
+        results.AddValue(scalar.ScalarValue(page, 'b', 'seconds', i))
+        if i == 1:
+          results.AddValue(skip.SkipValue(page, 'testing reason'))
+        results.DidRunPage(page)
+    results.WillRunPage(self.pages[0])
+    results.AddValue(scalar.ScalarValue(self.pages[0], 'a', 'seconds', 3))
+
+    all_values = results.all_page_specific_values
+    self.assertEquals(
+        [v for v in all_values if v.page == self.pages[0] and v.name == 'a'],
+        results.FindPageSpecificValuesForPage(self.pages[0], 'a'))
+    self.assertEquals(4, len(
+        results.FindPageSpecificValuesForPage(self.pages[0], 'a')))
+    self.assertEquals([v for v in all_values if v.name == 'b'],
+                      results.FindAllPageSpecificValuesNamed('b'))
+    self.assertEquals([v for v in all_values if isinstance(v, skip.SkipValue)],
+                      results.skipped_values)
+    self.assertEquals([], results.FindAllPageSpecificValuesNamed('c'))
+    self.assertEquals([], results.FindAllTraceValues())
+
+  def testDeferredValues(self):
+    results = page_test_results.PageTestResults(
+        value_can_be_added_predicate=lambda v, is_first: is_first)
+    for i in xrange(2):
+      results.WillRunPage(self.pages[0])
+      results.AddValue(scalar.ScalarValue(self.pages[0], 'a', 'seconds', i))
+      results.AddDeferredValues(
+          lambda i=i: [scalar.ScalarValue(self.pages[0], 'b', 'seconds', i)])
+      results.DidRunPage(self.pages[0])
+    results.WillRunPage(self.pages[1])
+    results.AddValue(scalar.ScalarValue(self.pages[1], 'a', 'seconds', 2))
+    results.DidRunPage(self.pages[1])
+    self.assertEquals([], results.FindAllPageSpecificValuesNamed('b'))
+
+    results.WaitForDeferredValues()
+    # The predicate only accepts values of the first run of each page.
+    self.assertEquals(
+        [('a', 0), ('b', 0), ('a', 2)],
+        [(v.name, v.value) for v in results.all_page_specific_values])
+    self.assertEquals(
+        ['a', 'b'], [v.name for v in results.all_page_runs[0].values])
+
+  def testStreamingToUserStoryRunStore(self):
+    results = page_test_results.PageTestResults(
+        user_story_run_store=user_story_run_store.UserStoryRunStore())
+    results.WillRunPage(self.pages[0])
+    results.AddValue(scalar.ScalarValue(self.pages[0], 'a', 'seconds', 3))
+    results.DidRunPage(self.pages[0])
+
+    results.WillRunPage(self.pages[1])
+    failure_value = failure.FailureValue.FromMessage(self.pages[1], 'Failure')
+    results.AddValue(failure_value)
+    results.AddValue(scalar.ScalarValue(self.pages[1], 'a', 'seconds', 4))
+    results.DidRunPage(self.pages[1])
+
+    self.assertEquals([3, 4], [v.value for v in
+                               results.FindAllPageSpecificValuesNamed('a')])
+    self.assertEquals(['a', failure_value.name, 'a'],
+                      [v.name for v in results.all_page_specific_values])
+    self.assertEquals([failure_value], results.failures)
+    self.assertEquals(set([self.pages[1]]), results.pages_that_failed)
+    self.assertEquals(set([self.pages[0]]), results.pages_that_succeeded)
+    results.CleanUp()
+
+  def testStoringRunsWithDeferredValues(self):
+    store = user_story_run_store.UserStoryRunStore()
+    results = page_test_results.PageTestResults(user_story_run_store=store)
+    ready = [False, False]
+    for i in xrange(2):
+      results.WillRunPage(self.pages[i])
+      results.AddValue(scalar.ScalarValue(self.pages[i], 'a', 'seconds', i))
+      results.AddDeferredValues(
+          lambda i=i: [scalar.ScalarValue(self.pages[i], 'b', 'seconds', i)],
+          lambda i=i: ready[i])
+      results.DidRunPage(self.pages[i])
+    # Runs wait in memory for their deferred values, without blocking.
+    self.assertEquals(0, store.num_runs)
+    self.assertEquals(2, results.num_deferred_values)
+    self.assertEquals(['a', 'a'],
+                      [v.name for v in results.all_page_specific_values])
+
+    # The second run is stored after the first one.
+    ready[1] = True
+    results.AddReadyDeferredValues()
+    self.assertEquals(0, store.num_runs)
+    self.assertEquals(1, results.num_deferred_values)
+
+    ready[0] = True
+    results.WillRunPage(self.pages[2])
+    results.DidRunPage(self.pages[2])
+    self.assertEquals(3, store.num_runs)
+    self.assertEquals(0, results.num_deferred_values)
+    self.assertEquals(
+        [('a', 0), ('b', 0), ('a', 1), ('b', 1)],
+        [(v.name, v.value) for v in results.all_page_specific_values])
+    results.CleanUp()
+
+  def testWaitForDeferredValuesStoresRuns(self):
+    store = user_story_run_store.UserStoryRunStore()
+    results = page_test_results.PageTestResults(user_story_run_store=store)
+    results.WillRunPage(self.pages[0])
+    results.AddDeferredValues(
+        lambda: [failure.FailureValue.FromMessage(self.pages[0], 'Failure')])
+    results.DidRunPage(self.pages[0])
+    self.assertEquals(0, store.num_runs)
+    self.assertEquals([], results.failures)
+
+    results.WaitForDeferredValues()
+    self.assertEquals(1, store.num_runs)
+    self.assertEquals(1, len(results.failures))
+    self.assertEquals(set([self.pages[0]]), results.pages_that_failed)
+    results.CleanUp()
+
   def testUrlIsInvalidValue(self):
     results = page_test_results.PageTestResults()
     results.WillRunPage(self.pages[0])
@@ -16,6 +16,7 @@ from telemetry.results import html_output_formatter
 from telemetry.results import json_output_formatter
 from telemetry.results import page_test_results
 from telemetry.results import progress_reporter
+from telemetry.results import user_story_run_store
 
 # Allowed output formats. The default is the first item in the list.
 _OUTPUT_FORMAT_CHOICES = ('html', 'buildbot', 'csv', 'gtest', 'json',
@@ -62,6 +63,10 @@ def AddResultsOptions(parser):
   group.add_option('--results-label',
                     default=None,
                     help='Optional label to use for the results of a run .')
+  group.add_option('--stream-results', action='store_true',
+                    help='Write the values of each finished page to a file in '
+                    '--output-dir instead of keeping them in memory until the '
+                    'end of the run.')
   group.add_option('--suppress_gtest_report',
                    default=False,
                    help='Whether to suppress GTest progress report.')
@@ -165,7 +170,11 @@ def CreateResults(benchmark_metadata, options,
 
   reporter = _GetProgressReporter(output_skipped_tests_summary,
                                   options.suppress_gtest_report)
+  store = None
+  if options.stream_results:
+    store = user_story_run_store.UserStoryRunStore(options.output_dir)
   return page_test_results.PageTestResults(
       output_formatters=output_formatters, progress_reporter=reporter,
       output_dir=options.output_dir,
-      value_can_be_added_predicate=value_can_be_added_predicate)
+      value_can_be_added_predicate=value_can_be_added_predicate,
+      user_story_run_store=store)
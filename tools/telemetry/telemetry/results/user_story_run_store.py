@@ -0,0 +1,113 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import cPickle
+import os
+import tempfile
+
+from telemetry.results import user_story_run
+from telemetry import user_story as user_story_module
+from telemetry.value import failure
+from telemetry.value import skip
+from telemetry.value import trace
+
+# Values of these types are kept in memory instead of being written out.
+# Failures and skips are consulted after every run and can hold tracebacks,
+# which can't be pickled. TraceValues already keep their trace in a temporary
+# file, and own it.
+_IN_MEMORY_VALUE_TYPES = (
+    failure.FailureValue, skip.SkipValue, trace.TraceValue)
+
+
+class UserStoryRunStore(object):
+  """An append-only, on-disk store of finished UserStoryRuns.
+
+  Long sessions produce many values; storing finished runs in a file keeps
+  them out of memory until the output formatters read them back one run at a
+  time. The values of each run are pickled as a separate chunk, with the user
+  stories they refer to replaced by their ids.
+  """
+  def __init__(self, dir_path=None):
+    fd, self._file_path = tempfile.mkstemp(
+        dir=dir_path, prefix='user_story_runs-', suffix='.pickle')
+    self._file = os.fdopen(fd, 'wb')
+    self._user_stories_by_id = {}
+    # For each stored run, its user story and the values of the run that are
+    # kept in memory, along with their index in the run.
+    self._runs = []
+
+  @staticmethod
+  def KeepsInMemory(value):
+    return isinstance(value, _IN_MEMORY_VALUE_TYPES)
+
+  @property
+  def num_runs(self):
+    return len(self._runs)
+
+  def _GetPersistentId(self, obj):
+    if isinstance(obj, user_story_module.UserStory):
+      self._user_stories_by_id[obj.id] = obj
+      return obj.id
+    return None
+
+  def AddRun(self, run):
+    """Writes a finished run to the store."""
+    assert self._file, 'Store has been cleaned up.'
+    stored_values = []
+    in_memory_values = []
+    for i, value in enumerate(run.values):
+      if self.KeepsInMemory(value):
+        in_memory_values.append((i, value))
+      else:
+        stored_values.append(value)
+    pickler = cPickle.Pickler(self._file, cPickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = self._GetPersistentId
+    pickler.dump(stored_values)
+    self._file.flush()
+    self._runs.append((run.user_story, in_memory_values))
+
+  def IterRuns(self, in_memory_values_only=False):
+    """Yields a new UserStoryRun for each stored run, in the order added.
+
+    Args:
+      in_memory_values_only: If True, the runs only contain the values that
+          are kept in memory, and the file is not read.
+    """
+    if in_memory_values_only:
+      for user_story, in_memory_values in self._runs:
+        yield self._CreateRun(user_story, [v for _, v in in_memory_values])
+      return
+
+    assert self._file, 'Store has been cleaned up.'
+    with open(self._file_path, 'rb') as f:
+      for user_story, in_memory_values in self._runs:
+        unpickler = cPickle.Unpickler(f)
+        unpickler.persistent_load = self._user_stories_by_id.__getitem__
+        values = unpickler.load()
+        for i, value in in_memory_values:
+          values.insert(i, value)
+        yield self._CreateRun(user_story, values)
+
+  @staticmethod
+  def _CreateRun(user_story, values):
+    run = user_story_run.UserStoryRun(user_story)
+    for value in values:
+      run.AddValue(value)
+    return run
+
+  def CleanUp(self):
+    """Cleans up the TraceValues and the file of this store.
+
+    Only the values kept in memory can be read from a cleaned up store.
+    CleanUp() may be called more than once without error.
+    """
+    for _, in_memory_values in self._runs:
+      for i, value in list(in_memory_values):
+        if isinstance(value, trace.TraceValue):
+          value.CleanUp()
+          in_memory_values.remove((i, value))
+    if self._file:
+      self._file.close()
+      os.remove(self._file_path)
+      self._file = None
@@ -0,0 +1,79 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import unittest
+
+from telemetry.results import user_story_run
+from telemetry.results import user_story_run_store
+from telemetry import user_story as user_story_module
+from telemetry.timeline import trace_data
+from telemetry.user_story import shared_user_story_state
+from telemetry.value import failure
+from telemetry.value import list_of_scalar_values
+from telemetry.value import scalar
+from telemetry.value import trace
+
+
+# pylint: disable=abstract-method
+class SharedUserStoryStateBar(shared_user_story_state.SharedUserStoryState):
+  pass
+
+class UserStoryFoo(user_story_module.UserStory):
+  def __init__(self, name=''):
+    super(UserStoryFoo, self).__init__(SharedUserStoryStateBar, name)
+
+
+class UserStoryRunStoreTest(unittest.TestCase):
+  def setUp(self):
+    self.store = user_story_run_store.UserStoryRunStore()
+    self.user_stories = [UserStoryFoo('foo'), UserStoryFoo('bar')]
+
+  def tearDown(self):
+    self.store.CleanUp()
+
+  def _AddRun(self, user_story, values):
+    run = user_story_run.UserStoryRun(user_story)
+    for value in values:
+      run.AddValue(value)
+    self.store.AddRun(run)
+
+  def testRunsAreReadBackInOrder(self):
+    foo, bar = self.user_stories
+    self._AddRun(foo, [
+        scalar.ScalarValue(foo, 'a', 'ms', 1, important=False),
+        list_of_scalar_values.ListOfScalarValues(foo, 'b', 'ms', [1, 2])])
+    failure_value = failure.FailureValue.FromMessage(bar, 'Failure')
+    self._AddRun(bar, [
+        scalar.ScalarValue(bar, 'a', 'ms', 2),
+        failure_value,
+        scalar.ScalarValue(bar, 'c', 'ms', 3)])
+    self.assertEquals(2, self.store.num_runs)
+
+    runs = list(self.store.IterRuns())
+    self.assertEquals([foo, bar], [run.user_story for run in runs])
+    self.assertEquals(['a', 'b'], [v.name for v in runs[0].values])
+    self.assertIs(foo, runs[0].values[0].page)
+    self.assertFalse(runs[0].values[0].important)
+    self.assertEquals([1, 2], runs[0].values[1].values)
+    self.assertEquals(['a', failure_value.name, 'c'],
+                      [v.name for v in runs[1].values])
+    self.assertIs(failure_value, runs[1].values[1])
+    self.assertTrue(runs[1].failed)
+
+    runs = list(self.store.IterRuns(in_memory_values_only=True))
+    self.assertEquals([[], [failure_value]], [run.values for run in runs])
+
+  def testCleanUp(self):
+    foo = self.user_stories[0]
+    trace_value = trace.TraceValue(
+        foo, trace_data.TraceData({'traceEvents': []}))
+    self._AddRun(foo, [scalar.ScalarValue(foo, 'a', 'ms', 1), trace_value])
+    self.assertIs(trace_value, list(self.store.IterRuns())[0].values[1])
+
+    self.store.CleanUp()
+    self.assertTrue(trace_value.cleaned_up)
+    self.assertFalse(os.path.exists(self.store._file_path))
+    runs = list(self.store.IterRuns(in_memory_values_only=True))
+    self.assertEquals([], runs[0].values)
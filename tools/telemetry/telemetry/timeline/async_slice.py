@@ -10,6 +10,9 @@ class AsyncSlice(event.TimelineEvent):
   asynchronous operation is in progress. An AsyncSlice consumes no CPU time
   itself and so is only associated with Threads at its start and end point.
   """
+  __slots__ = ('parent_slice', 'start_thread', 'end_thread', 'sub_slices',
+               'id')
+
   def __init__(self, category, name, timestamp, args=None,
                duration=0, start_thread=None, end_thread=None,
                thread_start=None, thread_duration=None):
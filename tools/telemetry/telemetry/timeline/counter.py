@@ -2,6 +2,7 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import telemetry.timeline.bounds as bounds_module
 import telemetry.timeline.event_container as event_container
 
 
@@ -9,6 +10,8 @@ import telemetry.timeline.event_container as event_container
 # counter sample into an event. During stable operation, the samples are stored
 # a dense array of values rather than in the long-form done by an Event.
 class CounterSample(object):
+  __slots__ = ('_counter', '_sample_index')
+
   def __init__(self, counter, sample_index):
     self._counter = counter
     self._sample_index = sample_index
@@ -83,6 +86,17 @@ class Counter(event_container.TimelineEventContainer):
   def num_samples(self):
     return len(self.timestamps)
 
+  @property
+  def bounds(self):
+    counter_bounds = bounds_module.Bounds()
+    if self.timestamps:
+      counter_bounds.AddValue(min(self.timestamps))
+      counter_bounds.AddValue(max(self.timestamps))
+    return counter_bounds
+
+  def ShiftTimestamps(self, delta):
+    self.timestamps[:] = [t + delta for t in self.timestamps]
+
   def FinalizeImport(self):
     if self.num_series * self.num_samples != len(self.samples):
       raise ValueError(
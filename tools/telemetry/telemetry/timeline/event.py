@@ -11,7 +11,13 @@ class TimelineEvent(object):
   on trace events and the corresponding attributes in TimelineEvent will be
   set to None (not 0) if not present. Users of this class need to properly
   handle this case.
+
+  Traces routinely hold millions of events, so events use __slots__ rather
+  than a per-instance __dict__. Subclasses must declare __slots__ as well.
   """
+  __slots__ = ('category', 'name', 'start', 'duration', 'thread_start',
+               'thread_duration', 'args')
+
   def __init__(self, category, name, start, duration, thread_start=None,
                thread_duration=None, args=None):
     self.category = category
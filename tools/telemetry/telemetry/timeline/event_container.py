@@ -14,6 +14,9 @@ class TimelineEventContainer(object):
   def __init__(self, name, parent):
     self.parent = parent
     self.name = name
+    # Lazily built once the model is frozen; see _GetEventsByName.
+    self._events_by_name = None
+    self._events_by_category_and_name = None
 
   # Basic functions that subclasses of TimelineEventContainer should implement
   # in order to expose their events. New methods should be added to this part of
@@ -44,28 +47,61 @@ class TimelineEventContainer(object):
     return
     yield # pylint: disable=W0101
 
+  def IterSlicesInThisContainerInRange(self, start, end):
+    """Iterates the Slices in this container that lie within [start, end].
 
-  def IterAllEvents(self,
-                    recursive=True,
-                    event_type_predicate=lambda t: True,
-                    event_predicate=lambda e: True):
-    """Iterates all events in this container, pre-filtered by two predicates.
+    The default implementation is a linear scan. Containers that keep their
+    slices sorted by start time override this to avoid visiting every slice.
+    """
+    return self.IterEventsInThisContainer(
+        event_type_predicate=lambda t: t == slice_module.Slice,
+        event_predicate=lambda s: s.start >= start and s.end <= end)
 
-    Only events with a type matching event_type_predicate AND matching event
-    event_predicate will be yielded.
+  def _IsFrozen(self):
+    """Returns True once the events under this container can't change."""
+    if self.parent is None:
+      return False
+    return self.parent._IsFrozen()  # pylint: disable=protected-access
 
-    event_type_predicate is given an actual type object, e.g.:
-        event_type_predicate(slice_module.Slice)
+  def _GetEventsByName(self):
+    """Returns a map from name to all events of that name in this container.
 
-    event_predicate is given actual events:
-        event_predicate(thread.slices[7])
+    Each list is in IterAllEvents order. Only valid once the container is
+    frozen, since events added later would be missing from it.
     """
-    if not recursive:
-      for e in self.IterEventsInThisContainer(
-          event_type_predicate, event_predicate):
+    assert self._IsFrozen()
+    if self._events_by_name is None:
+      events_by_name = {}
+      for e in self.IterAllEvents():
+        if e.name is not None:
+          events_by_name.setdefault(e.name, []).append(e)
+      self._events_by_name = events_by_name
+    return self._events_by_name
+
+  def _GetEventsByCategoryAndName(self):
+    if self._events_by_category_and_name is None:
+      events_by_category_and_name = {}
+      for name, events in self._GetEventsByName().iteritems():
+        for e in events:
+          events_by_category_and_name.setdefault(
+              (e.category, name), []).append(e)
+      self._events_by_category_and_name = events_by_category_and_name
+    return self._events_by_category_and_name
+
+  def _IterIndexedEventsOfName(self, name, event_type, event_predicate=None):
+    events = self._GetEventsByName().get(name, ())
+    for e in events:
+      if event_type is not None and type(e) != event_type:
+        continue
+      if event_predicate is None or event_predicate(e):
         yield e
-      return
 
+  def _CanUseNameIndex(self, name, recursive):
+    return recursive and name is not None and self._IsFrozen()
+
+  def _IterContainers(self, recursive):
+    if not recursive:
+      return [self]
     # TODO(nduca): Write this as a proper iterator instead of one that creates a
     # list and then iterates it.
     containers = []
@@ -74,45 +110,77 @@ class TimelineEventContainer(object):
       for container in container.IterChildContainers():
         GetContainersRecursive(container)
     GetContainersRecursive(self)
+    return containers
 
-    # Actually create the iterator.
-    for c in containers:
+  def IterAllEvents(self,
+                    recursive=True,
+                    event_type_predicate=lambda t: True,
+                    event_predicate=lambda e: True):
+    """Iterates all events in this container, pre-filtered by two predicates.
+
+    Only events with a type matching event_type_predicate AND matching event
+    event_predicate will be yielded.
+
+    event_type_predicate is given an actual type object, e.g.:
+        event_type_predicate(slice_module.Slice)
+
+    event_predicate is given actual events:
+        event_predicate(thread.slices[7])
+    """
+    for c in self._IterContainers(recursive):
       for e in c.IterEventsInThisContainer(event_type_predicate,
                                            event_predicate):
         yield e
 
   # Helper functions for finding common kinds of events. Must always take an
-  # optinal recurisve parameter and be implemented in terms fo IterAllEvents.
+  # optinal recurisve parameter and be implemented in terms fo IterAllEvents
+  # or the per-container iterators above.
   def IterAllEventsOfName(self, name, recursive=True):
+    if self._CanUseNameIndex(name, recursive):
+      return self._IterIndexedEventsOfName(name, None)
     return self.IterAllEvents(
       recursive=recursive,
       event_type_predicate=lambda t: True,
       event_predicate=lambda e: e.name == name)
 
+  def IterAllEventsOfCategoryAndName(self, category, name, recursive=True):
+    if self._CanUseNameIndex(name, recursive):
+      return iter(self._GetEventsByCategoryAndName().get((category, name), ()))
+    return self.IterAllEvents(
+      recursive=recursive,
+      event_type_predicate=lambda t: True,
+      event_predicate=lambda e: e.category == category and e.name == name)
+
   def IterAllSlices(self, recursive=True):
     return self.IterAllEvents(
       recursive=recursive,
       event_type_predicate=lambda t: t == slice_module.Slice)
 
   def IterAllSlicesInRange(self, start, end, recursive=True):
-    return self.IterAllEvents(
-      recursive=recursive,
-      event_type_predicate=lambda t: t == slice_module.Slice,
-      event_predicate=lambda s: s.start >= start and s.end <= end)
+    for c in self._IterContainers(recursive):
+      for s in c.IterSlicesInThisContainerInRange(start, end):
+        yield s
 
   def IterAllSlicesOfName(self, name, recursive=True):
+    if self._CanUseNameIndex(name, recursive):
+      return self._IterIndexedEventsOfName(name, slice_module.Slice)
     return self.IterAllEvents(
       recursive=recursive,
       event_type_predicate=lambda t: t == slice_module.Slice,
       event_predicate=lambda e: e.name == name)
 
   def IterAllToplevelSlicesOfName(self, name, recursive=True):
+    if self._CanUseNameIndex(name, recursive):
+      return self._IterIndexedEventsOfName(
+          name, slice_module.Slice, lambda e: e.parent_slice == None)
     return self.IterAllEvents(
       recursive=recursive,
       event_type_predicate=lambda t: t == slice_module.Slice,
       event_predicate=lambda e: e.name == name and e.parent_slice == None)
 
   def IterAllAsyncSlicesOfName(self, name, recursive=True):
+    if self._CanUseNameIndex(name, recursive):
+      return self._IterIndexedEventsOfName(name, async_slice_module.AsyncSlice)
     def IsAsyncSlice(t):
       return t == async_slice_module.AsyncSlice
     return self.IterAllEvents(
@@ -4,7 +4,11 @@
 
 import unittest
 
+from telemetry.timeline import async_slice
 from telemetry.timeline import event
+from telemetry.timeline import flow_event
+from telemetry.timeline import sample
+from telemetry.timeline import slice as slice_module
 
 
 class TimelineEventTest(unittest.TestCase):
@@ -22,3 +26,15 @@ class TimelineEventTest(unittest.TestCase):
     self.assertFalse(event_2.has_thread_timestamps)
     self.assertFalse(event_3.has_thread_timestamps)
     self.assertTrue(event_4.has_thread_timestamps)
+
+  def testEventsHaveNoInstanceDict(self):
+    events = [
+        event.TimelineEvent('test', 'foo', 0, 10),
+        slice_module.Slice(None, 'test', 'foo', 0),
+        async_slice.AsyncSlice('test', 'foo', 0),
+        sample.Sample(None, 'test', 'foo', 0),
+        flow_event.FlowEvent('test', 72, 'foo', 0)]
+    for e in events:
+      self.assertFalse(hasattr(e, '__dict__'), type(e))
+      with self.assertRaises(AttributeError):
+        e.unknown_attribute = 1
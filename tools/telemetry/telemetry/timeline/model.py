@@ -49,13 +49,17 @@ def IsSliceOrAsyncSlice(t):
 
 
 class TimelineModel(event_container.TimelineEventContainer):
-  def __init__(self, trace_data=None, shift_world_to_zero=True):
+  def __init__(self, trace_data=None, shift_world_to_zero=True,
+               parallel_import_processes=1):
     """ Initializes a TimelineModel.
 
     Args:
         trace_data: trace_data.TraceData containing events to import
         shift_world_to_zero: If true, the events will be shifted such that the
             first event starts at time 0.
+        parallel_import_processes: If greater than 1, the slices of each
+            thread are created and nested in a pool of this many processes.
+            Import errors may then be reported in a different order.
     """
     super(TimelineModel, self).__init__(name='TimelineModel', parent=None)
     self._bounds = bounds.Bounds()
@@ -69,6 +73,7 @@ class TimelineModel(event_container.TimelineEventContainer):
     self.import_errors = []
     self.metadata = []
     self.flow_events = []
+    self._parallel_import_processes = parallel_import_processes
     if trace_data is not None:
       self.ImportTraces(trace_data, shift_world_to_zero=shift_world_to_zero)
 
@@ -76,6 +81,9 @@ class TimelineModel(event_container.TimelineEventContainer):
     for process in self._processes.itervalues():
       yield process
 
+  def _IsFrozen(self):
+    return self._frozen
+
   def GetAllProcesses(self):
     return self._processes.values()
 
@@ -93,6 +101,10 @@ class TimelineModel(event_container.TimelineEventContainer):
   def processes(self):
     return self._processes
 
+  @property
+  def parallel_import_processes(self):
+    return self._parallel_import_processes
+
   @property
   #pylint: disable=E0202
   def browser_process(self):
@@ -146,6 +158,17 @@ class TimelineModel(event_container.TimelineEventContainer):
     for importer in importers:
       # TODO: catch exceptions here and add it to error list
       importer.ImportEvents()
+
+    # Streamed trace data only discovers the parts that follow its chrome
+    # trace events once those events have been consumed.
+    imported_parts = set(i.GetSupportedPart() for i in importers)
+    late_importers = self._CreateImporters(trace_data,
+                                           exclude_parts=imported_parts)
+    for importer in late_importers:
+      importer.ImportEvents()
+    importers.extend(late_importers)
+    importers.sort(key=lambda k: k.import_order)
+
     for record in trace_data.metadata_records:
       self.metadata.append(record)
     self.FinalizeImport(shift_world_to_zero, importers)
@@ -178,25 +201,21 @@ class TimelineModel(event_container.TimelineEventContainer):
     if self._bounds.is_empty:
       return
     shift_amount = self._bounds.min
-    for event in self.IterAllEvents():
-      event.start -= shift_amount
+    for process in self._processes.itervalues():
+      process.ShiftTimestamps(-shift_amount)
 
   def UpdateBounds(self):
-    self._bounds.Reset()
-    for event in self.IterAllEvents():
-      self._bounds.AddValue(event.start)
-      self._bounds.AddValue(event.end)
+    """Recomputes the model bounds from its processes.
 
+    Threads track their bounds as events are added, so this is cheap enough
+    to call at every stage of finalization.
+    """
+    self._bounds.Reset()
     self._thread_time_bounds = {}
-    for thread in self.GetAllThreads():
-      self._thread_time_bounds[thread] = bounds.Bounds()
-      for event in thread.IterEventsInThisContainer(
-          event_type_predicate=lambda t: True,
-          event_predicate=lambda e: True):
-        if event.thread_start != None:
-          self._thread_time_bounds[thread].AddValue(event.thread_start)
-        if event.thread_end != None:
-          self._thread_time_bounds[thread].AddValue(event.thread_end)
+    for process in self._processes.itervalues():
+      self._bounds.AddBounds(process.bounds)
+      for thread in process.threads.itervalues():
+        self._thread_time_bounds[thread] = thread.thread_time_bounds
 
   def GetOrCreateProcess(self, pid):
     if pid not in self._processes:
@@ -255,7 +274,7 @@ class TimelineModel(event_container.TimelineEventContainer):
   def GetRendererThreadFromTabId(self, tab_id):
     return self._tab_ids_to_renderer_threads_map.get(tab_id, None)
 
-  def _CreateImporters(self, trace_data):
+  def _CreateImporters(self, trace_data, exclude_parts=None):
     def FindImporterClassForPart(part):
       for importer_class in _IMPORTERS:
         if importer_class.GetSupportedPart() == part:
@@ -263,6 +282,8 @@ class TimelineModel(event_container.TimelineEventContainer):
 
     importers = []
     for part in trace_data.active_parts:
+      if exclude_parts and part in exclude_parts:
+        continue
       importer_class = FindImporterClassForPart(part)
       if not importer_class:
         raise Exception('No importer found for %s' % repr(part))
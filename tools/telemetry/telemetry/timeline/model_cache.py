@@ -0,0 +1,91 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""An on-disk cache of imported TimelineModels.
+
+Importing a large trace means parsing it and building every slice tree
+again. When the same trace is analyzed repeatedly, TimelineModelCache
+stores the imported model in a binary pickle keyed by the trace contents, so
+later loads skip the importers entirely.
+"""
+
+import cPickle
+import logging
+import os
+import tempfile
+
+from telemetry.timeline import model as model_module
+
+# Bump this whenever the layout of the timeline classes changes, so that
+# models pickled by older code are ignored.
+_CACHE_FORMAT_VERSION = 2
+
+
+class TimelineModelCache(object):
+  """Loads TimelineModels from a cache directory, importing them on a miss."""
+  def __init__(self, cache_dir):
+    self._cache_dir = cache_dir
+
+  def _GetCachePath(self, trace_data, shift_world_to_zero):
+    contents_hash = trace_data.GetContentsHash()
+    if contents_hash is None:
+      return None
+    key = '%s-%d-v%d' % (contents_hash, shift_world_to_zero,
+                         _CACHE_FORMAT_VERSION)
+    return os.path.join(self._cache_dir, key + '.model')
+
+  def GetModel(self, trace_data, shift_world_to_zero=True):
+    """Returns the TimelineModel for trace_data, importing it if needed.
+
+    Trace data that can't be hashed without consuming it, like a trace
+    streamed from a pipe, is imported without the cache.
+    """
+    path = self._GetCachePath(trace_data, shift_world_to_zero)
+    if path is None:
+      return model_module.TimelineModel(
+          trace_data, shift_world_to_zero=shift_world_to_zero)
+    model = self._Load(path)
+    if model is None:
+      model = model_module.TimelineModel(
+          trace_data, shift_world_to_zero=shift_world_to_zero)
+      self._Store(path, model)
+    return model
+
+  @staticmethod
+  def _Load(path):
+    if not os.path.exists(path):
+      return None
+    try:
+      with open(path, 'rb') as f:
+        model, slice_nestings = cPickle.load(f)
+      # pylint: disable=protected-access
+      for thread, parent_indices in slice_nestings:
+        thread._AttachSliceNesting(parent_indices)
+      return model
+    except Exception as e:  # pylint: disable=broad-except
+      logging.warning('Ignoring unreadable timeline model cache %s: %s',
+                      path, e)
+      return None
+
+  def _Store(self, path, model):
+    if not os.path.exists(self._cache_dir):
+      os.makedirs(self._cache_dir)
+    # Write to a temporary file first so that concurrent readers never see a
+    # partially written model.
+    fd, temp_path = tempfile.mkstemp(dir=self._cache_dir, suffix='.tmp')
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        # Nested slices are pickled as flat lists of parent indices, so that
+        # pickling doesn't recurse once per level of nesting.
+        # pylint: disable=protected-access
+        slice_nestings = [(t, t._DetachSliceNesting())
+                          for t in model.GetAllThreads()]
+        try:
+          cPickle.dump((model, slice_nestings), f, cPickle.HIGHEST_PROTOCOL)
+        finally:
+          for thread, parent_indices in slice_nestings:
+            thread._AttachSliceNesting(parent_indices)
+      os.rename(temp_path, path)
+    except:
+      os.remove(temp_path)
+      raise
@@ -0,0 +1,101 @@
+# Copyright 2015 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from telemetry.timeline import model as model_module
+from telemetry.timeline import model_cache
+from telemetry.timeline import trace_data
+
+
+def _MakeTraceData(trace_data_class=trace_data.TraceData):
+  events = [
+    {'name': 'a', 'args': {}, 'pid': 52, 'ts': 520, 'cat': 'foo',
+     'tid': 53, 'ph': 'B'},
+    {'name': 'b', 'args': {}, 'pid': 52, 'ts': 560, 'cat': 'foo',
+     'tid': 53, 'ph': 'X', 'dur': 100},
+    {'name': 'a', 'args': {}, 'pid': 52, 'ts': 800, 'cat': 'foo',
+     'tid': 53, 'ph': 'E'},
+  ]
+  return trace_data_class({'traceEvents': events})
+
+
+class TimelineModelCacheTest(unittest.TestCase):
+  def setUp(self):
+    self._cache_dir = tempfile.mkdtemp()
+    self._real_import_traces = model_module.TimelineModel.ImportTraces
+    self._import_count = 0
+    def CountingImportTraces(model, *args, **kwargs):
+      self._import_count += 1
+      return self._real_import_traces(model, *args, **kwargs)
+    model_module.TimelineModel.ImportTraces = CountingImportTraces
+
+  def tearDown(self):
+    model_module.TimelineModel.ImportTraces = self._real_import_traces
+    shutil.rmtree(self._cache_dir)
+
+  def testSecondLoadSkipsImport(self):
+    cache = model_cache.TimelineModelCache(self._cache_dir)
+    m1 = cache.GetModel(_MakeTraceData())
+    m2 = cache.GetModel(_MakeTraceData())
+    self.assertEqual(1, self._import_count)
+
+    s1 = [(s.name, s.start, s.duration) for s in m1.IterAllSlices()]
+    s2 = [(s.name, s.start, s.duration) for s in m2.IterAllSlices()]
+    self.assertEqual(s1, s2)
+    self.assertEqual(m1.bounds.min, m2.bounds.min)
+    self.assertEqual(m1.bounds.max, m2.bounds.max)
+    a = list(m2.IterAllSlicesOfName('a'))[0]
+    self.assertEqual(['b'], [s.name for s in a.sub_slices])
+    self.assertIs(a, a.sub_slices[0].parent_slice)
+
+  def testDifferentContentsOrShiftMiss(self):
+    cache = model_cache.TimelineModelCache(self._cache_dir)
+    cache.GetModel(_MakeTraceData())
+    cache.GetModel(_MakeTraceData(), shift_world_to_zero=False)
+    cache.GetModel(trace_data.TraceData({'traceEvents': []}))
+    self.assertEqual(3, self._import_count)
+
+  def testDeeplyNestedSlices(self):
+    depth = 600
+    events = [{'name': str(i), 'args': {}, 'pid': 52, 'ts': i, 'cat': 'foo',
+               'tid': 53, 'ph': 'B'} for i in xrange(depth)]
+    events.extend({'name': str(i), 'args': {}, 'pid': 52, 'ts': 2 * depth - i,
+                   'cat': 'foo', 'tid': 53, 'ph': 'E'}
+                  for i in reversed(xrange(depth)))
+    cache = model_cache.TimelineModelCache(self._cache_dir)
+    recursion_limit = sys.getrecursionlimit()
+    m1 = cache.GetModel(trace_data.TraceData({'traceEvents': events}))
+    m2 = cache.GetModel(trace_data.TraceData({'traceEvents': events}))
+    self.assertEqual(1, self._import_count)
+    self.assertEqual(recursion_limit, sys.getrecursionlimit())
+    for m in (m1, m2):
+      s = list(m.IterAllSlicesOfName('1'))[0]
+      self.assertEqual('0', s.parent_slice.name)
+      self.assertEqual(['2'], [c.name for c in s.sub_slices])
+      self.assertEqual(depth, len(list(m.IterAllSlices())))
+
+  def testCorruptCacheFileIsReimported(self):
+    cache = model_cache.TimelineModelCache(self._cache_dir)
+    cache.GetModel(_MakeTraceData())
+    for name in os.listdir(self._cache_dir):
+      with open(os.path.join(self._cache_dir, name), 'wb') as f:
+        f.write('garbage')
+    m = cache.GetModel(_MakeTraceData())
+    self.assertEqual(2, self._import_count)
+    self.assertEqual(2, len(list(m.IterAllSlices())))
+
+  def testUnhashableTraceDataIsNotCached(self):
+    class UnhashableTraceData(trace_data.TraceData):
+      def GetContentsHash(self):
+        return None
+    cache = model_cache.TimelineModelCache(self._cache_dir)
+    cache.GetModel(_MakeTraceData(UnhashableTraceData))
+    cache.GetModel(_MakeTraceData(UnhashableTraceData))
+    self.assertEqual(2, self._import_count)
+    self.assertEqual([], os.listdir(self._cache_dir))
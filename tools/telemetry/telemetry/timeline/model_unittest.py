@@ -4,6 +4,7 @@
 
 import unittest
 
+from telemetry.timeline import bounds
 from telemetry.timeline import model as model_module
 from telemetry.timeline import trace_data
 
@@ -22,3 +23,86 @@ class TimelineModelUnittest(unittest.TestCase):
     ])
     model = model_module.TimelineModel(builder.AsData())
     self.assertEquals(5, model.browser_process.pid)
+
+  def testNameIndexMatchesScan(self):
+    model = model_module.TimelineModel()
+    thread = model.GetOrCreateProcess(1).GetOrCreateThread(2)
+    thread.PushCompleteSlice('cat1', 'a', 10, 30, None, None)
+    thread.PushCompleteSlice('cat2', 'a', 20, 5, None, None)
+    thread.PushCompleteSlice('cat1', 'b', 50, 5, None, None)
+    thread.AddSample('cat1', 'a', 60)
+    other_thread = model.GetOrCreateProcess(3).GetOrCreateThread(4)
+    other_thread.PushCompleteSlice('cat1', 'a', 70, 5, None, None)
+
+    def Names(events):
+      return sorted([(e.category, e.name, e.start) for e in events],
+                    key=lambda n: n[2])
+
+    # Before the model is frozen, lookups scan the containers.
+    self.assertEqual(4, len(list(model.IterAllEventsOfName('a'))))
+    model.FinalizeImport(shift_world_to_zero=False)
+
+    self.assertEqual(
+        [('cat1', 'a', 10), ('cat2', 'a', 20), ('cat1', 'a', 60),
+         ('cat1', 'a', 70)],
+        Names(model.IterAllEventsOfName('a')))
+    self.assertEqual(
+        [('cat1', 'a', 10), ('cat2', 'a', 20), ('cat1', 'a', 70)],
+        Names(model.IterAllSlicesOfName('a')))
+    self.assertEqual(
+        [('cat1', 'a', 10), ('cat1', 'a', 70)],
+        Names(model.IterAllToplevelSlicesOfName('a')))
+    self.assertEqual(
+        [('cat2', 'a', 20)],
+        Names(model.IterAllEventsOfCategoryAndName('cat2', 'a')))
+    self.assertEqual(
+        [('cat1', 'a', 70)],
+        Names(model.GetOrCreateProcess(3).IterAllSlicesOfName('a')))
+    self.assertEqual([], list(model.IterAllAsyncSlicesOfName('a')))
+    self.assertEqual([], list(model.IterAllEventsOfName('missing')))
+    self.assertEqual(
+        Names(thread.IterAllEvents(event_predicate=lambda e: e.name == 'a')),
+        Names(thread.IterAllEventsOfName('a')))
+
+  def testTrackedBoundsMatchAllEvents(self):
+    builder = trace_data.TraceDataBuilder()
+    builder.AddEventsTo(trace_data.CHROME_TRACE_PART, [
+      {'name': 'a', 'args': {}, 'pid': 1, 'ts': 520, 'tts': 10, 'cat': 'foo',
+       'tid': 2, 'ph': 'B'},
+      {'name': 'b', 'args': {}, 'pid': 1, 'ts': 530, 'tts': 15, 'cat': 'foo',
+       'tid': 2, 'ph': 'X', 'dur': 5, 'tdur': 2},
+      {'name': 'a', 'args': {}, 'pid': 1, 'ts': 560, 'tts': 40, 'cat': 'foo',
+       'tid': 2, 'ph': 'E'},
+      {'name': 'c', 'args': {}, 'pid': 1, 'ts': 570, 'tts': 45, 'cat': 'foo',
+       'tid': 2, 'ph': 'B'},
+      {'name': 'async', 'args': {}, 'pid': 1, 'ts': 500, 'tts': 5,
+       'cat': 'foo', 'tid': 2, 'ph': 'S', 'id': 72},
+      {'name': 'async', 'args': {}, 'pid': 1, 'ts': 640, 'tts': 80,
+       'cat': 'foo', 'tid': 2, 'ph': 'F', 'id': 72},
+      {'name': 'sample', 'args': {}, 'pid': 3, 'ts': 600, 'cat': 'foo',
+       'tid': 4, 'ph': 'P'},
+      {'name': 'ctr', 'args': {'value': 1}, 'pid': 3, 'ts': 650, 'cat': 'foo',
+       'tid': 4, 'ph': 'C'},
+      {'name': 'flow', 'args': {}, 'pid': 3, 'ts': 610, 'cat': 'foo',
+       'tid': 4, 'ph': 's', 'id': 7},
+      {'name': 'flow', 'args': {}, 'pid': 3, 'ts': 620, 'cat': 'foo',
+       'tid': 4, 'ph': 'f', 'id': 7},
+    ])
+    model = model_module.TimelineModel(builder.AsData())
+
+    expected_bounds = bounds.Bounds()
+    for event in model.IterAllEvents():
+      expected_bounds.AddValue(event.start)
+      expected_bounds.AddValue(event.end)
+    self.assertAlmostEqual(0, model.bounds.min)
+    self.assertAlmostEqual(expected_bounds.min, model.bounds.min)
+    self.assertAlmostEqual(expected_bounds.max, model.bounds.max)
+    self.assertAlmostEqual(0.15, model.bounds.max)
+
+    thread = model.GetOrCreateProcess(1).GetOrCreateThread(2)
+    # The open slice 'c' was closed at the end of the trace.
+    c = model.GetAllEventsOfName('c')[0]
+    self.assertAlmostEqual(0.15, c.end)
+    self.assertAlmostEqual(0.005, thread.thread_time_bounds.min)
+    self.assertAlmostEqual(0.08, thread.thread_time_bounds.max)
+    self.assertAlmostEqual(0.045, c.thread_end)
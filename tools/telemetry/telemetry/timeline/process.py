@@ -2,6 +2,7 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import telemetry.timeline.bounds as bounds_module
 import telemetry.timeline.counter as tracing_counter
 import telemetry.timeline.event as event_module
 import telemetry.timeline.event_container as event_container
@@ -30,6 +31,17 @@ class Process(event_container.TimelineEventContainer):
   def threads(self):
     return self._threads
 
+  @property
+  def bounds(self):
+    process_bounds = bounds_module.Bounds()
+    for thread in self._threads.itervalues():
+      process_bounds.AddBounds(thread.bounds)
+    for counter in self._counters.itervalues():
+      process_bounds.AddBounds(counter.bounds)
+    if self.trace_buffer_did_overflow:
+      process_bounds.AddEvent(self._trace_buffer_overflow_event)
+    return process_bounds
+
   @property
   def counters(self):
     return self._counters
@@ -80,6 +92,14 @@ class Process(event_container.TimelineEventContainer):
     self._trace_buffer_overflow_event = event_module.TimelineEvent(
         "TraceBufferInfo", "trace_buffer_overflowed", timestamp, 0)
 
+  def ShiftTimestamps(self, delta):
+    for thread in self._threads.itervalues():
+      thread.ShiftTimestamps(delta)
+    for counter in self._counters.itervalues():
+      counter.ShiftTimestamps(delta)
+    if self.trace_buffer_did_overflow:
+      self._trace_buffer_overflow_event.start += delta
+
   def FinalizeImport(self):
     for thread in self._threads.itervalues():
       thread.FinalizeImport()
@@ -14,6 +14,8 @@ class Sample(timeline_event.TimelineEvent):
 
   All time units are stored in milliseconds.
   """
+  __slots__ = ('parent_thread',)
+
   def __init__(self, parent_thread, category, name, timestamp, args=None):
     super(Sample, self).__init__(
         category, name, timestamp, 0, args=args)
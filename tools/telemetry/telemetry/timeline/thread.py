@@ -1,7 +1,11 @@
 # Copyright 2014 The Chromium Authors. All rights reserved.
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
+import bisect
+import itertools
+
 import telemetry.timeline.async_slice as async_slice_module
+import telemetry.timeline.bounds as bounds_module
 import telemetry.timeline.event_container as event_container
 import telemetry.timeline.flow_event as flow_event_module
 import telemetry.timeline.sample as sample_module
@@ -22,6 +26,18 @@ class Thread(event_container.TimelineEventContainer):
     self._samples = []
     self._toplevel_slices = []
     self._all_slices = []
+    # All slices sorted by start time, and their start times. Built once the
+    # slices are finalized so that range queries can bisect.
+    self._slices_by_start = []
+    self._slice_starts = None
+    # Bounds of the slices, samples and flow events, kept up to date as they
+    # are added so that computing the model's bounds doesn't visit every
+    # event. Async slices are few and are folded in when bounds are queried.
+    self._event_bounds = bounds_module.Bounds()
+    self._event_thread_time_bounds = bounds_module.Bounds()
+    # True while _all_slices holds a slice tree built by another process
+    # during a parallel import, and this thread hasn't been finalized yet.
+    self._has_adopted_slice_tree = False
 
     # State only valid during import.
     self._open_slices = []
@@ -47,6 +63,55 @@ class Thread(event_container.TimelineEventContainer):
   def open_slice_count(self):
     return len(self._open_slices)
 
+  @property
+  def bounds(self):
+    """Bounds of the start and end times of all events on this thread."""
+    thread_bounds = bounds_module.Bounds()
+    thread_bounds.AddBounds(self._event_bounds)
+    for event in self._IterAsyncSlicesAndSubSlices():
+      thread_bounds.AddValue(event.start)
+      thread_bounds.AddValue(event.end)
+    return thread_bounds
+
+  @property
+  def thread_time_bounds(self):
+    """Bounds of the thread clock times of all events on this thread."""
+    thread_time_bounds = bounds_module.Bounds()
+    thread_time_bounds.AddBounds(self._event_thread_time_bounds)
+    for event in self._IterAsyncSlicesAndSubSlices():
+      if event.thread_start != None:
+        thread_time_bounds.AddValue(event.thread_start)
+      if event.thread_end != None:
+        thread_time_bounds.AddValue(event.thread_end)
+    return thread_time_bounds
+
+  def _IterAsyncSlicesAndSubSlices(self):
+    for async_slice in self._async_slices:
+      yield async_slice
+      for sub_slice in async_slice.IterEventsInThisContainerRecrusively():
+        yield sub_slice
+
+  def _AddEventToBounds(self, event):
+    self._event_bounds.AddValue(event.start)
+    self._event_bounds.AddValue(event.end)
+    if event.thread_start != None:
+      self._event_thread_time_bounds.AddValue(event.thread_start)
+    thread_end = event.thread_end
+    if thread_end != None:
+      self._event_thread_time_bounds.AddValue(thread_end)
+
+  def ShiftTimestamps(self, delta):
+    """Adds delta to the start time of every event on this thread."""
+    self._event_bounds.Reset()
+    for event in itertools.chain(self._newly_added_slices, self._all_slices,
+                                 self._flow_events, self._samples):
+      event.start += delta
+      self._event_bounds.AddValue(event.start)
+      self._event_bounds.AddValue(event.end)
+    for event in self._IterAsyncSlicesAndSubSlices():
+      event.start += delta
+    self._slice_starts = None
+
   def IterChildContainers(self):
     return
     yield # pylint: disable=W0101
@@ -78,6 +143,23 @@ class Thread(event_container.TimelineEventContainer):
         if event_predicate(sample):
           yield sample
 
+  def IterSlicesInThisContainerInRange(self, start, end):
+    if self._newly_added_slices:
+      return super(Thread, self).IterSlicesInThisContainerInRange(start, end)
+    return self._IterSortedSlicesInRange(start, end)
+
+  def _IterSortedSlicesInRange(self, start, end):
+    # Slice start times can still be shifted after FinalizeImport, so the
+    # start array is only captured once the model is queried.
+    if self._slice_starts is None:
+      self._slice_starts = [s.start for s in self._slices_by_start]
+    first = bisect.bisect_left(self._slice_starts, start)
+    last = bisect.bisect_right(self._slice_starts, end)
+    for i in xrange(first, last):
+      s = self._slices_by_start[i]
+      if s.end <= end:
+        yield s
+
   def AddSample(self, category, name, timestamp, args=None):
     if len(self._samples) and timestamp < self._samples[-1].start:
       raise ValueError(
@@ -85,12 +167,14 @@ class Thread(event_container.TimelineEventContainer):
     sample = sample_module.Sample(self,
         category, name, timestamp, args=args)
     self._samples.append(sample)
+    self._AddEventToBounds(sample)
 
   def AddAsyncSlice(self, async_slice):
     self._async_slices.append(async_slice)
 
   def AddFlowEvent(self, flow_event):
     self._flow_events.append(flow_event)
+    self._AddEventToBounds(flow_event)
 
   def BeginSlice(self, category, name, timestamp, thread_timestamp=None,
                  args=None):
@@ -144,6 +228,7 @@ class Thread(event_container.TimelineEventContainer):
       curr_slice.thread_duration = (end_thread_timestamp -
                                     curr_slice.thread_start)
     curr_slice.did_not_finish = False
+    self._AddEventToBounds(curr_slice)
     return curr_slice
 
   def PushCompleteSlice(self, category, name, timestamp, duration,
@@ -161,16 +246,23 @@ class Thread(event_container.TimelineEventContainer):
 
   def PushSlice(self, new_slice):
     self._newly_added_slices.append(new_slice)
+    self._AddEventToBounds(new_slice)
     return new_slice
 
   def AutoCloseOpenSlices(self, max_timestamp, max_thread_timestamp):
-    for s in self._newly_added_slices:
+    slices = self._newly_added_slices
+    if self._has_adopted_slice_tree:
+      # Adopted slices were only closed against the trace events seen by the
+      # importer; close them again against the bounds of the whole model.
+      slices = itertools.chain(self._all_slices, slices)
+    for s in slices:
       if s.did_not_finish:
         s.duration = max_timestamp - s.start
         assert s.duration >= 0
         if s.thread_start != None:
           s.thread_duration = max_thread_timestamp - s.thread_start
           assert s.thread_duration >= 0
+        self._AddEventToBounds(s)
     self._open_slices = []
 
   def IsTimestampValidForBeginOrEnd(self, timestamp):
@@ -181,6 +273,59 @@ class Thread(event_container.TimelineEventContainer):
   def FinalizeImport(self):
     self._BuildSliceSubRows()
 
+  def _ExportSliceTree(self):
+    """Detaches this thread's finalized slices so they can be pickled.
+
+    Returns the slice tree in the form accepted by _AdoptSliceTree.
+    """
+    for s in self._all_slices:
+      s.parent_thread = None
+    return (self._all_slices, self._toplevel_slices, self._slices_by_start)
+
+  def _AdoptSliceTree(self, slice_tree, event_bounds, thread_time_bounds):
+    """Takes over a slice tree exported by _ExportSliceTree.
+
+    Used by parallel imports, where the slices of each thread are created
+    and nested in a separate process.
+    """
+    assert not self._all_slices
+    all_slices, toplevel_slices, slices_by_start = slice_tree
+    for s in all_slices:
+      s.parent_thread = self
+    self._all_slices = all_slices
+    self._toplevel_slices = toplevel_slices
+    self._slices_by_start = slices_by_start
+    self._slice_starts = None
+    self._event_bounds.AddBounds(event_bounds)
+    self._event_thread_time_bounds.AddBounds(thread_time_bounds)
+    self._has_adopted_slice_tree = True
+
+  def _DetachSliceNesting(self):
+    """Unlinks this thread's finalized slices from their parents and children.
+
+    Pickling nested slices recurses once per level of nesting, so the
+    nesting is returned as flat data instead, in the form accepted by
+    _AttachSliceNesting.
+    """
+    indices = dict((id(s), i) for i, s in enumerate(self._all_slices))
+    parent_indices = [
+        indices[id(s.parent_slice)] if s.parent_slice is not None else -1
+        for s in self._all_slices]
+    for s in self._all_slices:
+      s.parent_slice = None
+      s.sub_slices = []
+    return parent_indices
+
+  def _AttachSliceNesting(self, parent_indices):
+    """Restores the nesting of slices removed by _DetachSliceNesting."""
+    for s, parent_index in zip(self._all_slices, parent_indices):
+      if parent_index >= 0:
+        s.parent_slice = self._all_slices[parent_index]
+    # Sub slices are ordered by start, just like _BuildSliceSubRows adds them.
+    for s in self._slices_by_start:
+      if s.parent_slice is not None:
+        s.parent_slice.sub_slices.append(s)
+
   def _BuildSliceSubRows(self):
     """This function works by walking through slices by start time.
 
@@ -219,6 +364,19 @@ class Thread(event_container.TimelineEventContainer):
         return cmp(s2.end, s1.end)
       return cmp(s1.start, s2.start)
 
+    if self._has_adopted_slice_tree:
+      self._has_adopted_slice_tree = False
+      if not len(self._newly_added_slices):
+        return
+      # Other importers added slices to this thread too, so nest all of its
+      # slices together.
+      for s in self._all_slices:
+        s.parent_slice = None
+        del s.sub_slices[:]
+      self._newly_added_slices = self._all_slices + self._newly_added_slices
+      self._all_slices = []
+      self._toplevel_slices = []
+
     assert len(self._toplevel_slices) == 0
     assert len(self._all_slices) == 0
     if not len(self._newly_added_slices):
@@ -227,6 +385,8 @@ class Thread(event_container.TimelineEventContainer):
     self._all_slices.extend(self._newly_added_slices)
 
     sorted_slices = sorted(self._newly_added_slices, cmp=CompareSlices)
+    self._slices_by_start = sorted_slices
+    self._slice_starts = None
     root_slice = sorted_slices[0]
     self._toplevel_slices.append(root_slice)
     for s in sorted_slices[1:]:
@@ -30,3 +30,29 @@ class ThreadUnittest(unittest.TestCase):
     slice_names = set(s.name for s in
                       renderer_main.IterAllSlicesInRange(start=12, end=65))
     self.assertEqual(slice_names, {'Z', 'Y', 'T'})
+
+  def testIterAllSlicesInRangeAfterWorldShift(self):
+    model = model_module.TimelineModel()
+    renderer_main = model.GetOrCreateProcess(1).GetOrCreateThread(2)
+    renderer_main.PushCompleteSlice('cat1', 'A', 100, 10, None, None)
+    renderer_main.PushCompleteSlice('cat1', 'B', 120, 5, None, None)
+    renderer_main.PushCompleteSlice('cat1', 'C', 110, 20, None, None)
+    renderer_main.PushCompleteSlice('cat1', 'D', 130, 0, None, None)
+
+    model.FinalizeImport(shift_world_to_zero=True)
+    # Boundaries are inclusive on both ends.
+    self.assertEqual(['A', 'C', 'B', 'D'], [s.name for s in
+                     model.IterAllSlicesInRange(start=0, end=30)])
+    self.assertEqual(['C', 'B', 'D'], [s.name for s in
+                     model.IterAllSlicesInRange(start=10, end=30)])
+    self.assertEqual(['B'], [s.name for s in
+                     model.IterAllSlicesInRange(start=10, end=29)])
+    self.assertEqual([], list(model.IterAllSlicesInRange(start=31, end=40)))
+
+  def testIterAllSlicesInRangeBeforeFinalize(self):
+    model = model_module.TimelineModel()
+    renderer_main = model.GetOrCreateProcess(1).GetOrCreateThread(2)
+    renderer_main.PushCompleteSlice('cat1', 'A', 10, 10, None, None)
+    renderer_main.PushCompleteSlice('cat1', 'B', 30, 10, None, None)
+    self.assertEqual(['B'], [s.name for s in
+                     renderer_main.IterAllSlicesInRange(start=25, end=40)])
@@ -2,8 +2,12 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import contextlib
+import hashlib
 import json
+import marshal
 import numbers
+import re
 
 class NonSerializableTraceData(Exception):
   """Raised when raw trace data cannot be serialized to TraceData."""
@@ -19,6 +23,15 @@ def _ValidateRawData(raw):
     raise NonSerializableTraceData('TraceData is not serilizable: %s' % e)
 
 
+def _DumpRawData(raw, f):
+  try:
+    json.dump(raw, f)
+  except TypeError as e:
+    raise NonSerializableTraceData('TraceData is not serilizable: %s' % e)
+  except ValueError as e:
+    raise NonSerializableTraceData('TraceData is not serilizable: %s' % e)
+
+
 class TraceDataPart(object):
   """TraceData can have a variety of events.
 
@@ -67,15 +80,26 @@ class TraceData(object):
   3. A json-parseable array missing the final ']': assumed to be chrome trace
      data.
   """
-  def __init__(self, raw_data=None):
-    """Creates TraceData from the given data."""
+  def __init__(self, raw_data=None, validate=True):
+    """Creates TraceData from the given data.
+
+    A string is validated by parsing it, which only ever produces primitive
+    objects. Other raw data is checked by serializing it, unless validate is
+    False. Callers that know their data to be primitive, for instance because
+    they just decoded it from json themselves, can skip that pass; data that
+    turns out not to be serializable then raises from Serialize instead.
+    """
     self._raw_data = {}
     self._events_are_safely_mutable = False
+    self._contents_hash = None
     if not raw_data:
       return
-    _ValidateRawData(raw_data)
 
     if isinstance(raw_data, basestring):
+      # Hashing the text is much cheaper than hashing the parsed data later.
+      self._contents_hash = hashlib.sha1(
+          raw_data.encode('utf-8') if isinstance(raw_data, unicode)
+          else raw_data).hexdigest()
       if raw_data.startswith('[') and not raw_data.endswith(']'):
         if raw_data.endswith(','):
           raw_data = raw_data[:-1]
@@ -85,6 +109,8 @@ class TraceData(object):
       # as safely mutable.
       self._events_are_safely_mutable = True
     else:
+      if validate:
+        _ValidateRawData(raw_data)
       json_data = raw_data
 
     if isinstance(json_data, dict):
@@ -127,7 +153,7 @@ class TraceData(object):
         continue
       yield {
         'name': k,
-        'value': self._raw_data[v]
+        'value': v
       }
 
   def HasEventsFor(self, part):
@@ -145,7 +171,277 @@ class TraceData(object):
     Always writes in the trace container format.
     """
     assert not gzip_result, 'Not implemented'
-    json.dump(self._raw_data, f)
+    _DumpRawData(self._raw_data, f)
+
+  def GetContentsHash(self):
+    """Returns a sha1 hex digest identifying the contents of this trace data.
+
+    Trace data created from a string is identified by the hash of that
+    string. Otherwise the raw data is marshalled, which is several times
+    faster than encoding it as json, but depends on the iteration order of
+    its dicts: equal data built up in different orders may hash differently.
+    """
+    if self._contents_hash is None:
+      try:
+        serialized = marshal.dumps(self._raw_data)
+      except ValueError:
+        # Unvalidated data may hold objects marshal doesn't support.
+        try:
+          serialized = json.dumps(self._raw_data)
+        except (TypeError, ValueError) as e:
+          raise NonSerializableTraceData('TraceData is not serilizable: %s' % e)
+      self._contents_hash = hashlib.sha1(serialized).hexdigest()
+    return self._contents_hash
+
+
+_WHITESPACE_RE = re.compile(r'[ \t\n\r]*')
+
+# Number of bytes read from a trace stream at a time.
+_DEFAULT_READ_SIZE = 1 << 20
+
+
+class _JsonStreamReader(object):
+  """Incrementally tokenizes a json document read from a file-like object.
+
+  Only as much of the underlying stream as is needed to decode the next value
+  is held in memory, so arbitrarily large arrays can be walked element by
+  element.
+  """
+  def __init__(self, f, read_size):
+    self._file = f
+    self._read_size = read_size
+    self._decoder = json.JSONDecoder()
+    self._buffer = ''
+    self._pos = 0
+    self._at_eof = False
+
+  def _ReadMore(self, size=None):
+    """Appends more data to the buffer. Returns False at end of stream."""
+    if self._at_eof:
+      return False
+    data = self._file.read(size or self._read_size)
+    if not data:
+      self._at_eof = True
+      return False
+    if self._pos:
+      self._buffer = self._buffer[self._pos:]
+      self._pos = 0
+    self._buffer += data
+    return True
+
+  def PeekChar(self):
+    """Skips whitespace and returns the next character, or None at EOF."""
+    while True:
+      self._pos = _WHITESPACE_RE.match(self._buffer, self._pos).end()
+      if self._pos < len(self._buffer):
+        return self._buffer[self._pos]
+      if not self._ReadMore():
+        return None
+
+  def ReadChar(self, expected_chars=None):
+    c = self.PeekChar()
+    if expected_chars is not None and (c is None or c not in expected_chars):
+      raise ValueError('Expected one of %s at stream offset %d, found %r' % (
+          repr(expected_chars), self._pos, c))
+    self._pos += 1
+    return c
+
+  def ReadValue(self):
+    """Decodes the next complete json value from the stream."""
+    self.PeekChar()
+    read_size = self._read_size
+    while True:
+      try:
+        value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        # A value running up to the end of the buffer might be a truncated
+        # number, so only trust it once a following character is available.
+        if end < len(self._buffer) or self._at_eof:
+          self._pos = end
+          return value
+      except ValueError:
+        if self._at_eof:
+          raise
+      # Grow the read size so that decoding a huge value stays linear.
+      if not self._ReadMore(read_size):
+        continue
+      read_size *= 2
+
+
+class StreamingTraceData(TraceData):
+  """TraceData whose chrome trace events are decoded lazily from a stream.
+
+  The stream may be a file, a socket's makefile() or any other object with a
+  read() method, and may hold either the trace container format or a bare
+  (possibly unterminated) array of chrome trace events. Events are parsed one
+  at a time as the importer consumes them, so the raw trace text is never
+  materialized in memory. The chrome trace events can only be iterated once.
+
+  Parts that precede 'traceEvents' in a container are available right away;
+  parts that follow it only become active once the events have been consumed.
+
+  If the stream is seekable, it can be read again from where the trace
+  starts, so the data can be serialized and hashed without consuming the
+  events.
+
+  The tracing controller doesn't create it: DevTools delivers chrome trace
+  events in Tracing.dataCollected notifications that are already decoded, so
+  the tracing backends collect them with a TraceDataBuilder. This is for
+  traces read from a file or a pipe.
+  """
+  def __init__(self, f, read_size=_DEFAULT_READ_SIZE):
+    super(StreamingTraceData, self).__init__()
+    # Every event is freshly decoded from the stream.
+    self._events_are_safely_mutable = True
+    self._file = f
+    self._read_size = read_size
+    try:
+      self._start_offset = f.tell()
+    except (AttributeError, IOError):
+      # E.g. a pipe or a socket.
+      self._start_offset = None
+    self._reader = _JsonStreamReader(f, read_size)
+    self._is_container = False
+    self._has_pending_chrome_events = False
+    self._chrome_events_taken = False
+    self._ReadUntilChromeEvents()
+
+  def _ReadUntilChromeEvents(self):
+    c = self._reader.ReadChar()
+    if c is None:
+      return
+    if c == '[':
+      self._StartChromeEvents()
+      return
+    if c != '{':
+      raise Exception('Unrecognized data format.')
+    self._is_container = True
+    if self._reader.PeekChar() == '}':
+      self._reader.ReadChar()
+      return
+    while True:
+      key = self._reader.ReadValue()
+      self._reader.ReadChar(':')
+      if (key == CHROME_TRACE_PART.raw_field_name and
+          self._reader.PeekChar() == '['):
+        self._reader.ReadChar()
+        self._StartChromeEvents()
+        return
+      self._raw_data[key] = self._reader.ReadValue()
+      if self._reader.ReadChar(',}') == '}':
+        return
+
+  def _StartChromeEvents(self):
+    c = self._reader.PeekChar()
+    if c == ']':
+      self._reader.ReadChar()
+      self._FinishChromeEvents()
+    elif c is not None:
+      self._has_pending_chrome_events = True
+
+  def _FinishChromeEvents(self):
+    self._has_pending_chrome_events = False
+    if not self._is_container:
+      return
+    while self._reader.ReadChar(',}') == ',':
+      key = self._reader.ReadValue()
+      self._reader.ReadChar(':')
+      self._raw_data[key] = self._reader.ReadValue()
+
+  def _IterChromeEvents(self):
+    while True:
+      yield self._reader.ReadValue()
+      c = self._reader.ReadChar()
+      if c == ',':
+        # Tolerate a trailing comma on an unterminated array.
+        if not self._is_container and self._reader.PeekChar() is None:
+          break
+        continue
+      # A missing final ']' is allowed, as with string TraceData.
+      if c == ']' or (c is None and not self._is_container):
+        break
+      raise ValueError('Unexpected %r in trace event array' % c)
+    self._FinishChromeEvents()
+
+  @property
+  def active_parts(self):
+    parts = super(StreamingTraceData, self).active_parts
+    if self._has_pending_chrome_events:
+      parts.add(CHROME_TRACE_PART)
+    return parts
+
+  def HasEventsFor(self, part):
+    if part == CHROME_TRACE_PART and self._has_pending_chrome_events:
+      return True
+    return super(StreamingTraceData, self).HasEventsFor(part)
+
+  def GetEventsFor(self, part):
+    if part == CHROME_TRACE_PART and self._chrome_events_taken:
+      raise Exception('Streamed chrome trace events can only be read once.')
+    if part != CHROME_TRACE_PART or not self._has_pending_chrome_events:
+      return super(StreamingTraceData, self).GetEventsFor(part)
+    self._chrome_events_taken = True
+    return self._IterChromeEvents()
+
+  @contextlib.contextmanager
+  def _RewoundStream(self):
+    """Seeks the stream to the start of the trace, and back afterwards."""
+    position = self._file.tell()
+    self._file.seek(self._start_offset)
+    try:
+      yield self._file
+    finally:
+      self._file.seek(position)
+
+  def Serialize(self, f, gzip_result=False):
+    """Serializes the trace to a file-like object, one event at a time.
+
+    Always writes in the trace container format. Unless the stream is
+    seekable, this consumes the chrome trace events.
+    """
+    assert not gzip_result, 'Not implemented'
+    if self._start_offset is None:
+      self._WriteContainer(f)
+      return
+    with self._RewoundStream() as stream:
+      # pylint: disable=W0212
+      StreamingTraceData(stream, self._read_size)._WriteContainer(f)
+
+  def _WriteContainer(self, f):
+    separator = ''
+    f.write('{')
+    if self._has_pending_chrome_events:
+      f.write('"%s": [' % CHROME_TRACE_PART.raw_field_name)
+      for i, event in enumerate(self.GetEventsFor(CHROME_TRACE_PART)):
+        if i:
+          f.write(', ')
+        _DumpRawData(event, f)
+      f.write(']')
+      separator = ', '
+    # The parts that follow the events are only known now.
+    for key, value in self._raw_data.iteritems():
+      f.write(separator)
+      json.dump(key, f)
+      f.write(': ')
+      _DumpRawData(value, f)
+      separator = ', '
+    f.write('}')
+
+  def GetContentsHash(self):
+    """Returns the sha1 hex digest of the stream from the start of the trace.
+
+    This matches the hash of TraceData created from the same string. Returns
+    None if the stream isn't seekable, since hashing it would consume the
+    chrome trace events.
+    """
+    if self._start_offset is None:
+      return None
+    if self._contents_hash is None:
+      digest = hashlib.sha1()
+      with self._RewoundStream() as stream:
+        for data in iter(lambda: stream.read(self._read_size), ''):
+          digest.update(data)
+      self._contents_hash = digest.hexdigest()
+    return self._contents_hash
 
 
 class TraceDataBuilder(object):
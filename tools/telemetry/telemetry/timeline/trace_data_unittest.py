@@ -2,7 +2,9 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import collections
 import cStringIO
+import hashlib
 import json
 import logging
 import unittest
@@ -33,6 +35,42 @@ class TraceDataTest(unittest.TestCase):
     with self.assertRaises(trace_data.NonSerializableTraceData):
       trace_data.TraceData(d)
 
+  def testContentsHash(self):
+    a = trace_data.TraceData({'traceEvents': [{'ph': 'B', 'ts': 1}],
+                              'metadata': {'x': 1}})
+    b = trace_data.TraceData({'traceEvents': [{'ph': 'B', 'ts': 1}],
+                              'metadata': {'x': 1}})
+    c = trace_data.TraceData({'traceEvents': [{'ph': 'E', 'ts': 1}]})
+    self.assertEqual(a.GetContentsHash(), b.GetContentsHash())
+    self.assertNotEqual(a.GetContentsHash(), c.GetContentsHash())
+
+  def testContentsHashOfString(self):
+    raw = '[{"ph": "B", "ts": 1}]'
+    a = trace_data.TraceData(raw)
+    self.assertEqual(hashlib.sha1(raw).hexdigest(), a.GetContentsHash())
+    self.assertEqual(a.GetContentsHash(),
+                     trace_data.TraceData(unicode(raw)).GetContentsHash())
+    self.assertNotEqual(
+        a.GetContentsHash(),
+        trace_data.TraceData('[{"ph": "E", "ts": 1}]').GetContentsHash())
+
+  def testContentsHashOfUnmarshallableData(self):
+    d = trace_data.TraceData(
+        {'traceEvents': [collections.OrderedDict([('ph', 'B')])]})
+    self.assertEqual(40, len(d.GetContentsHash()))
+    d = trace_data.TraceData({'hello': TraceDataTest}, validate=False)
+    with self.assertRaises(trace_data.NonSerializableTraceData):
+      d.GetContentsHash()
+
+  def testUnvalidatedNonPrimativeRaisesOnSerialize(self):
+    d = trace_data.TraceData({'hello': TraceDataTest}, validate=False)
+    with self.assertRaises(trace_data.NonSerializableTraceData):
+      d.Serialize(cStringIO.StringIO())
+
+  def testInvalidStringRaises(self):
+    with self.assertRaises(ValueError):
+      trace_data.TraceData('{"traceEvents": [')
+
   def testEmptyArrayValue(self):
     # We can import empty lists and empty string.
     d = trace_data.TraceData([])
@@ -67,6 +105,120 @@ class TraceDataTest(unittest.TestCase):
       {"ph": "B"},""")
     self.assertTrue(d.HasEventsFor(trace_data.CHROME_TRACE_PART))
 
+
+class StreamingTraceDataTest(unittest.TestCase):
+  def testArrayForm(self):
+    f = cStringIO.StringIO('[{"ph": "B"}, {"ph": "E", "args": {"x": 12}}]')
+    d = trace_data.StreamingTraceData(f, read_size=3)
+    self.assertTrue(d.HasEventsFor(trace_data.CHROME_TRACE_PART))
+    self.assertEquals(
+        [{'ph': 'B'}, {'ph': 'E', 'args': {'x': 12}}],
+        list(d.GetEventsFor(trace_data.CHROME_TRACE_PART)))
+
+  def testTopLevelNumbersAreNotTruncated(self):
+    f = cStringIO.StringIO('[12345, 678]')
+    d = trace_data.StreamingTraceData(f, read_size=2)
+    self.assertEquals(
+        [12345, 678], list(d.GetEventsFor(trace_data.CHROME_TRACE_PART)))
+
+  def testEmptyStream(self):
+    d = trace_data.StreamingTraceData(cStringIO.StringIO(''))
+    self.assertFalse(d.HasEventsFor(trace_data.CHROME_TRACE_PART))
+    d = trace_data.StreamingTraceData(cStringIO.StringIO('[ ]'))
+    self.assertFalse(d.HasEventsFor(trace_data.CHROME_TRACE_PART))
+
+  def testCorrectlyMalformedStream(self):
+    for raw in ('[{"ph": "B"}', '[{"ph": "B"},\n'):
+      d = trace_data.StreamingTraceData(cStringIO.StringIO(raw), read_size=4)
+      self.assertEquals(
+          [{'ph': 'B'}], list(d.GetEventsFor(trace_data.CHROME_TRACE_PART)))
+
+  def testContainerForm(self):
+    f = cStringIO.StringIO(json.dumps(collections.OrderedDict([
+        ('inspectorTimelineEvents', [1]),
+        ('traceEvents', [{'ph': 'B'}, {'ph': 'E'}]),
+        ('tabIds', ['tab-7']),
+        ('metadata', {'foo': 'bar'})])))
+    d = trace_data.StreamingTraceData(f, read_size=5)
+    self.assertTrue(d.HasEventsFor(trace_data.INSPECTOR_TRACE_PART))
+    self.assertFalse(d.HasEventsFor(trace_data.TAB_ID_PART))
+    self.assertEquals(
+        {trace_data.CHROME_TRACE_PART, trace_data.INSPECTOR_TRACE_PART},
+        d.active_parts)
+
+    events = d.GetEventsFor(trace_data.CHROME_TRACE_PART)
+    self.assertEquals(2, len(list(events)))
+    self.assertRaises(
+        Exception, d.GetEventsFor, trace_data.CHROME_TRACE_PART)
+    self.assertEquals(['tab-7'], d.GetEventsFor(trace_data.TAB_ID_PART))
+    self.assertEquals([{'name': 'metadata', 'value': {'foo': 'bar'}}],
+                      list(d.metadata_records))
+
+  def testMalformedStreamRaises(self):
+    d = trace_data.StreamingTraceData(
+        cStringIO.StringIO('{"traceEvents": [{"ph": "B"} {"ph": "E"}]}'))
+    with self.assertRaises(ValueError):
+      list(d.GetEventsFor(trace_data.CHROME_TRACE_PART))
+
+  def testSerializeArrayForm(self):
+    d = trace_data.StreamingTraceData(
+        cStringIO.StringIO('[{"ph": "B"}, {"ph": "E"}]'), read_size=3)
+    f = cStringIO.StringIO()
+    d.Serialize(f)
+    self.assertEquals({'traceEvents': [{'ph': 'B'}, {'ph': 'E'}]},
+                      json.loads(f.getvalue()))
+    # The events are reread from the start of the stream.
+    self.assertEquals(
+        [{'ph': 'B'}, {'ph': 'E'}],
+        list(d.GetEventsFor(trace_data.CHROME_TRACE_PART)))
+
+  def testSerializeContainerForm(self):
+    raw = {'traceEvents': [{'ph': 'B'}], 'tabIds': ['tab-7'],
+           'metadata': {'foo': 'bar'}}
+    d = trace_data.StreamingTraceData(
+        cStringIO.StringIO(json.dumps(raw)), read_size=5)
+    f = cStringIO.StringIO()
+    d.Serialize(f)
+    self.assertEquals(raw, json.loads(f.getvalue()))
+
+  def testSerializeNonSeekableStreamConsumesEvents(self):
+    stream = cStringIO.StringIO('{"tabIds": [1], "traceEvents": [{"a": 1}]}')
+    d = trace_data.StreamingTraceData(_ReadOnlyStream(stream))
+    f = cStringIO.StringIO()
+    d.Serialize(f)
+    self.assertEquals({'tabIds': [1], 'traceEvents': [{'a': 1}]},
+                      json.loads(f.getvalue()))
+    self.assertRaises(
+        Exception, d.GetEventsFor, trace_data.CHROME_TRACE_PART)
+
+  def testContentsHashMatchesTraceData(self):
+    raw = '[{"ph": "B"}, {"ph": "E"}]'
+    stream = cStringIO.StringIO('garbage' + raw)
+    stream.seek(len('garbage'))
+    d = trace_data.StreamingTraceData(stream, read_size=4)
+    self.assertEquals(trace_data.TraceData(raw).GetContentsHash(),
+                      d.GetContentsHash())
+    self.assertEquals(
+        [{'ph': 'B'}, {'ph': 'E'}],
+        list(d.GetEventsFor(trace_data.CHROME_TRACE_PART)))
+
+  def testNonSeekableStreamHasNoContentsHash(self):
+    d = trace_data.StreamingTraceData(
+        _ReadOnlyStream(cStringIO.StringIO('[{"ph": "B"}]')))
+    self.assertIsNone(d.GetContentsHash())
+    self.assertEquals(
+        [{'ph': 'B'}], list(d.GetEventsFor(trace_data.CHROME_TRACE_PART)))
+
+
+class _ReadOnlyStream(object):
+  """Hides everything but read(), like a pipe."""
+  def __init__(self, f):
+    self._f = f
+
+  def read(self, size):
+    return self._f.read(size)
+
+
 class TraceDataBuilderTest(unittest.TestCase):
   def testBasicChrome(self):
     builder = trace_data.TraceDataBuilder()
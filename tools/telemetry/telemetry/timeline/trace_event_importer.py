@@ -9,13 +9,47 @@ https://code.google.com/p/trace-viewer/
 
 import copy
 import json
+import multiprocessing
 import re
 
 import telemetry.timeline.async_slice as tracing_async_slice
 import telemetry.timeline.flow_event as tracing_flow_event
+from telemetry.timeline import bounds
 from telemetry.timeline import importer
 from telemetry.timeline import trace_data as trace_data_module
 
+# Phases of events that only affect the slices of their own thread. During a
+# parallel import these are imported in worker processes, one task per thread.
+_THREAD_LOCAL_PHASES = frozenset(['B', 'E', 'X', 'I', 'i'])
+
+
+def _ImportThreadLocalEvents(task):
+  """Creates and nests the slices of a single thread in a worker process.
+
+  Open slices are closed at max_timestamp, the latest timestamp seen among
+  the thread local events of the whole trace. TimelineModel closes them again
+  once the bounds of the whole model are known.
+
+  Returns the thread's exported slice tree, its bounds before open slices
+  were closed, and any import errors.
+  """
+  # Imported here because the model module imports this one.
+  from telemetry.timeline import model as model_module
+  # pylint: disable=protected-access
+  max_timestamp, events = task
+  model = model_module.TimelineModel()
+  event_importer = TraceEventTimelineImporter(
+      model, trace_data_module.TraceData())
+  for event in events:
+    event_importer._ProcessEvent(event)
+  thread = model.GetAllThreads()[0]
+  event_bounds = copy.copy(thread._event_bounds)
+  thread_time_bounds = thread.thread_time_bounds
+  thread.AutoCloseOpenSlices(max_timestamp, thread_time_bounds.max)
+  thread.FinalizeImport()
+  return (thread._ExportSliceTree(), event_bounds, thread_time_bounds,
+          model.import_errors)
+
 
 class TraceEventTimelineImporter(importer.TimelineImporter):
   def __init__(self, model, trace_data):
@@ -27,6 +61,13 @@ class TraceEventTimelineImporter(importer.TimelineImporter):
     self._all_async_events = []
     self._all_object_events = []
     self._all_flow_events = []
+    # Category and name strings recur across millions of events, so every
+    # event created by this importer shares a single copy of each.
+    self._interned_strings = {}
+
+    # Thread local events by (pid, tid), deferred for a parallel import.
+    self._thread_local_events = {}
+    self._thread_local_bounds = bounds.Bounds()
 
     self._events = trace_data.GetEventsFor(trace_data_module.CHROME_TRACE_PART)
 
@@ -37,6 +78,9 @@ class TraceEventTimelineImporter(importer.TimelineImporter):
   def _GetOrCreateProcess(self, pid):
     return self._model.GetOrCreateProcess(pid)
 
+  def _Intern(self, s):
+    return self._interned_strings.setdefault(s, s)
+
   def _DeepCopyIfNeeded(self, obj):
     if self._trace_data.events_are_safely_mutable:
       return obj
@@ -99,8 +143,8 @@ class TraceEventTimelineImporter(importer.TimelineImporter):
       return
 
     if event['ph'] == 'B':
-      thread.BeginSlice(event['cat'],
-                        event['name'],
+      thread.BeginSlice(self._Intern(event['cat']),
+                        self._Intern(event['name']),
                         event['ts'] / 1000.0,
                         event['tts'] / 1000.0 if 'tts' in event else None,
                         event['args'])
@@ -131,8 +175,8 @@ class TraceEventTimelineImporter(importer.TimelineImporter):
     thread = (self._GetOrCreateProcess(event['pid'])
         .GetOrCreateThread(event['tid']))
     thread.PushCompleteSlice(
-        event['cat'],
-        event['name'],
+        self._Intern(event['cat']),
+        self._Intern(event['name']),
         event['ts'] / 1000.0,
         event['dur'] / 1000.0 if 'dur' in event else None,
         event['tts'] / 1000.0 if 'tts' in event else None,
@@ -159,8 +203,8 @@ class TraceEventTimelineImporter(importer.TimelineImporter):
     # SliceTrack's redraw() knows how to handle this.
     thread = (self._GetOrCreateProcess(event['pid'])
       .GetOrCreateThread(event['tid']))
-    thread.BeginSlice(event['cat'],
-                      event['name'],
+    thread.BeginSlice(self._Intern(event['cat']),
+                      self._Intern(event['name']),
                       event['ts'] / 1000.0,
                       args=event.get('args'))
     thread.EndSlice(event['ts'] / 1000.0)
@@ -168,8 +212,8 @@ class TraceEventTimelineImporter(importer.TimelineImporter):
   def _ProcessSampleEvent(self, event):
     thread = (self._GetOrCreateProcess(event['pid'])
         .GetOrCreateThread(event['tid']))
-    thread.AddSample(event['cat'],
-                     event['name'],
+    thread.AddSample(self._Intern(event['cat']),
+                     self._Intern(event['name']),
                      event['ts'] / 1000.0,
                      event.get('args'))
 
@@ -180,45 +224,88 @@ class TraceEventTimelineImporter(importer.TimelineImporter):
         'event': event,
         'thread': thread})
 
+  def _ProcessEvent(self, event):
+    phase = event.get('ph', None)
+    if phase == 'B' or phase == 'E':
+      self._ProcessDurationEvent(event)
+    elif phase == 'X':
+      self._ProcessCompleteEvent(event)
+    elif phase == 'S' or phase == 'F' or phase == 'T':
+      self._ProcessAsyncEvent(event)
+    # Note, I is historic. The instant event marker got changed, but we
+    # want to support loading old trace files so we have both I and i.
+    elif phase == 'I' or phase == 'i':
+      self._ProcessInstantEvent(event)
+    elif phase == 'P':
+      self._ProcessSampleEvent(event)
+    elif phase == 'C':
+      self._ProcessCounterEvent(event)
+    elif phase == 'M':
+      self._ProcessMetadataEvent(event)
+    elif phase == 'N' or phase == 'D' or phase == 'O':
+      self._ProcessObjectEvent(event)
+    elif phase == 's' or phase == 't' or phase == 'f':
+      self._ProcessFlowEvent(event)
+    else:
+      self._model.import_errors.append('Unrecognized event phase: ' +
+          phase + '(' + event['name'] + ')')
+
+  def _DeferThreadLocalEvent(self, event):
+    key = (event['pid'], event['tid'])
+    thread_events = self._thread_local_events.get(key)
+    if thread_events is None:
+      # Create the thread right away so that the model's processes and
+      # threads are the same as those of a serial import.
+      self._GetOrCreateProcess(event['pid']).GetOrCreateThread(event['tid'])
+      thread_events = self._thread_local_events[key] = []
+    thread_events.append(event)
+    timestamp = event['ts'] / 1000.0
+    self._thread_local_bounds.AddValue(timestamp)
+    if 'dur' in event:
+      self._thread_local_bounds.AddValue(timestamp + event['dur'] / 1000.0)
+
+  def _ImportThreadLocalEventsInParallel(self):
+    """Builds the slice trees of all deferred threads in a process pool."""
+    # Hand out the busiest threads first so they don't finish last.
+    keys = sorted(self._thread_local_events,
+                  key=lambda k: len(self._thread_local_events[k]),
+                  reverse=True)
+    max_timestamp = self._thread_local_bounds.max
+    tasks = [(max_timestamp, self._thread_local_events[k]) for k in keys]
+    self._thread_local_events = {}
+
+    pool = multiprocessing.Pool(self._model.parallel_import_processes)
+    try:
+      results = pool.map(_ImportThreadLocalEvents, tasks, chunksize=1)
+    finally:
+      pool.close()
+      pool.join()
+
+    for key, result in sorted(zip(keys, results)):
+      slice_tree, event_bounds, thread_time_bounds, import_errors = result
+      thread = self._GetOrCreateProcess(key[0]).GetOrCreateThread(key[1])
+      thread._AdoptSliceTree(  # pylint: disable=protected-access
+          slice_tree, event_bounds, thread_time_bounds)
+      self._model.import_errors.extend(import_errors)
+
   def ImportEvents(self):
     """Walks through the events_ list and outputs the structures discovered to
     model_.
     """
+    parallel = self._model.parallel_import_processes > 1
     for event in self._events:
-      phase = event.get('ph', None)
-      if phase == 'B' or phase == 'E':
-        self._ProcessDurationEvent(event)
-      elif phase == 'X':
-        self._ProcessCompleteEvent(event)
-      elif phase == 'S' or phase == 'F' or phase == 'T':
-        self._ProcessAsyncEvent(event)
-      # Note, I is historic. The instant event marker got changed, but we
-      # want to support loading old trace files so we have both I and i.
-      elif phase == 'I' or phase == 'i':
-        self._ProcessInstantEvent(event)
-      elif phase == 'P':
-        self._ProcessSampleEvent(event)
-      elif phase == 'C':
-        self._ProcessCounterEvent(event)
-      elif phase == 'M':
-        self._ProcessMetadataEvent(event)
-      elif phase == 'N' or phase == 'D' or phase == 'O':
-        self._ProcessObjectEvent(event)
-      elif phase == 's' or phase == 't' or phase == 'f':
-        self._ProcessFlowEvent(event)
+      if parallel and event.get('ph', None) in _THREAD_LOCAL_PHASES:
+        self._DeferThreadLocalEvent(event)
       else:
-        self._model.import_errors.append('Unrecognized event phase: ' +
-            phase + '(' + event['name'] + ')')
+        self._ProcessEvent(event)
 
+    if self._thread_local_events:
+      self._ImportThreadLocalEventsInParallel()
     return self._model
 
   def FinalizeImport(self):
     """Called by the Model after all other importers have imported their
     events."""
-    self._model.UpdateBounds()
-
-    # We need to reupdate the bounds in case the minimum start time changes
-    self._model.UpdateBounds()
     self._CreateAsyncSlices()
     self._CreateFlowSlices()
     self._SetBrowserProcess()
@@ -279,8 +366,8 @@ class TraceEventTimelineImporter(importer.TimelineImporter):
         if event['ph'] == 'F':
           # Create a slice from start to end.
           async_slice = tracing_async_slice.AsyncSlice(
-              events[0]['event']['cat'],
-              name,
+              self._Intern(events[0]['event']['cat']),
+              self._Intern(name),
               events[0]['event']['ts'] / 1000.0)
 
           async_slice.duration = ((event['ts'] / 1000.0)
@@ -302,8 +389,8 @@ class TraceEventTimelineImporter(importer.TimelineImporter):
             if events[j - 1]['event']['ph'] == 'T':
               sub_name = name + ':' + events[j - 1]['event']['args']['step']
             sub_slice = tracing_async_slice.AsyncSlice(
-                events[0]['event']['cat'],
-                sub_name,
+                self._Intern(events[0]['event']['cat']),
+                self._Intern(sub_name),
                 events[j - 1]['event']['ts'] / 1000.0)
             sub_slice.parent_slice = async_slice
 
@@ -361,9 +448,9 @@ class TraceEventTimelineImporter(importer.TimelineImporter):
         continue
 
       flow_event = tracing_flow_event.FlowEvent(
-          event['cat'],
+          self._Intern(event['cat']),
           event['id'],
-          event['name'],
+          self._Intern(event['name']),
           event['ts'] / 1000.0,
           event['args'])
       thread.AddFlowEvent(flow_event)
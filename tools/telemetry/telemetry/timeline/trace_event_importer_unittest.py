@@ -2,6 +2,7 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import cStringIO
 import json
 import unittest
 
@@ -1019,3 +1020,92 @@ class TraceEventTimelineImporterTest(unittest.TestCase):
     trace_data = trace_data_module.TraceData(events)
     m = timeline_model.TimelineModel(trace_data)
     self.assertEqual(0, len(m.flow_events))
+
+  def testCategoryAndNameStringsAreShared(self):
+    trace_data = trace_data_module.TraceData(
+        '[{"name": "a", "args": {}, "pid": 52, "ts": 520, "cat": "foo",'
+        '  "tid": 53, "ph": "X", "dur": 10},'
+        ' {"name": "a", "args": {}, "pid": 52, "ts": 540, "cat": "foo",'
+        '  "tid": 54, "ph": "X", "dur": 10}]')
+    m = timeline_model.TimelineModel(trace_data)
+    slices = list(m.IterAllSlicesOfName('a'))
+    self.assertEqual(2, len(slices))
+    self.assertIs(slices[0].name, slices[1].name)
+    self.assertIs(slices[0].category, slices[1].category)
+
+  def testImportStreamingTraceData(self):
+    events = [
+      {'name': 'a', 'args': {}, 'pid': 52, 'ts': 520, 'cat': 'foo',
+       'tid': 53, 'ph': 'B'},
+      {'name': 'tab-7', 'args': {}, 'pid': 52, 'ts': 530, 'cat': 'foo',
+       'tid': 53, 'ph': 'S', 'id': 72},
+      {'name': 'tab-7', 'args': {}, 'pid': 52, 'ts': 540, 'cat': 'foo',
+       'tid': 53, 'ph': 'F', 'id': 72},
+      {'name': 'a', 'args': {}, 'pid': 52, 'ts': 560, 'cat': 'foo',
+       'tid': 53, 'ph': 'E'},
+    ]
+    # tabIds follows traceEvents, so it is only found once the events have
+    # been streamed into the model.
+    raw = ('{"traceEvents": %s, "tabIds": ["tab-7"]}' % json.dumps(events))
+    trace_data = trace_data_module.StreamingTraceData(
+        cStringIO.StringIO(raw), read_size=16)
+    m = timeline_model.TimelineModel(trace_data)
+
+    t = m.GetAllProcesses()[0].threads[53]
+    self.assertEqual(1, len(t.all_slices))
+    self.assertAlmostEqual(0, t.all_slices[0].start)
+    self.assertAlmostEqual(0.04, t.all_slices[0].duration)
+    self.assertEqual(t, m.GetRendererThreadFromTabId('tab-7'))
+
+  def testParallelImportMatchesSerialImport(self):
+    events = [
+      {'name': 'a', 'args': {'x': 1}, 'pid': 52, 'ts': 520, 'tts': 10,
+       'cat': 'foo', 'tid': 53, 'ph': 'B'},
+      {'name': 'b', 'args': {}, 'pid': 52, 'ts': 530, 'tts': 15, 'cat': 'foo',
+       'tid': 53, 'ph': 'X', 'dur': 10, 'tdur': 4},
+      {'name': 'i', 'args': {}, 'pid': 52, 'ts': 535, 'cat': 'foo',
+       'tid': 53, 'ph': 'i'},
+      {'name': 'a', 'args': {'y': 2}, 'pid': 52, 'ts': 560, 'tts': 40,
+       'cat': 'foo', 'tid': 53, 'ph': 'E'},
+      {'name': 'open', 'args': {}, 'pid': 52, 'ts': 570, 'tts': 45,
+       'cat': 'foo', 'tid': 53, 'ph': 'B'},
+      {'name': 'c', 'args': {}, 'pid': 52, 'ts': 580, 'cat': 'bar',
+       'tid': 54, 'ph': 'B'},
+      {'name': 'c', 'args': {}, 'pid': 52, 'ts': 590, 'cat': 'bar',
+       'tid': 54, 'ph': 'E'},
+      {'name': 'c', 'args': {}, 'pid': 52, 'ts': 595, 'cat': 'bar',
+       'tid': 54, 'ph': 'E'},
+      {'name': 'd', 'args': {}, 'pid': 60, 'ts': 500, 'cat': 'baz',
+       'tid': 61, 'ph': 'X', 'dur': 200},
+      {'name': 'ctr', 'args': {'value': 1}, 'pid': 60, 'ts': 750,
+       'cat': 'baz', 'tid': 61, 'ph': 'C'},
+      {'name': 'async', 'args': {}, 'pid': 52, 'ts': 510, 'cat': 'foo',
+       'tid': 54, 'ph': 'S', 'id': 72},
+      {'name': 'async', 'args': {}, 'pid': 52, 'ts': 600, 'cat': 'foo',
+       'tid': 54, 'ph': 'F', 'id': 72},
+    ]
+
+    def Describe(model):
+      def DescribeSlice(s):
+        return (s.name, s.category, round(s.start, 6), round(s.duration, 6),
+                s.thread_start, s.thread_duration, s.args, s.did_not_finish,
+                [DescribeSlice(c) for c in s.sub_slices])
+      threads = {}
+      for thread in model.GetAllThreads():
+        for s in thread.all_slices:
+          self.assertIs(thread, s.parent_thread)
+        threads[(thread.parent.pid, thread.tid)] = (
+            [DescribeSlice(s) for s in thread.toplevel_slices],
+            len(thread.all_slices), len(thread.async_slices))
+      return (threads, (model.bounds.min, model.bounds.max),
+              sorted(model.import_errors))
+
+    serial = timeline_model.TimelineModel(
+        trace_data_module.TraceData(json.dumps(events)))
+    parallel = timeline_model.TimelineModel(
+        trace_data_module.TraceData(json.dumps(events)),
+        parallel_import_processes=2)
+    self.assertEqual(Describe(serial), Describe(parallel))
+    self.assertEqual(1, len(parallel.import_errors))
+    open_slice = parallel.GetAllEventsOfName('open')[0]
+    self.assertAlmostEqual(parallel.bounds.max, open_slice.end)
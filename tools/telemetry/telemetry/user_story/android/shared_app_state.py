@@ -33,6 +33,7 @@ class SharedAppState(shared_user_story_state.SharedUserStoryState):
             'SharedAppState only accepts TimelineBasedMeasurement tests'
             ' (not %s).' % test.__class__)
     self._test = test
+    self._test.StartBackgroundMetricProcesses()
     self._finder_options = finder_options
     self._android_app = None
     self._current_user_story = None
@@ -72,8 +73,5 @@ class SharedAppState(shared_user_story_state.SharedUserStoryState):
     return 'pass', None
 
   def TearDownState(self, results):
-    """Tear down anything created in the __init__ method that is not needed.
-
-    Currently, there is no clean-up needed from SharedAppState.__init__.
-    """
-    pass
+    """Tear down anything created in the __init__ method that is not needed."""
+    self._test.StopBackgroundMetricProcesses()
@@ -2,12 +2,16 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import cPickle
+import cStringIO
 import logging
+import multiprocessing
 import optparse
 import os
 import random
 import sys
 import time
+import traceback
 
 from telemetry.core import exceptions
 from telemetry.core import wpr_modes
@@ -15,6 +19,7 @@ from telemetry.internal.actions import page_action
 from telemetry import page as page_module
 from telemetry.page import page_set as page_set_module
 from telemetry.page import page_test
+from telemetry.results import page_test_results
 from telemetry.results import results_options
 from telemetry.user_story import user_story_filter
 from telemetry.user_story import user_story_set as user_story_set_module
@@ -45,6 +50,19 @@ def AddCommandLineArgs(parser):
                    'PageTest.')
   parser.add_option_group(group)
 
+  group = optparse.OptionGroup(parser, 'Sharding options')
+  group.add_option('--shards', default=1, type='int',
+                   help='Number of processes that run user story groups and '
+                   'page set repeats in parallel, each with its own shared '
+                   'state and device. Results are merged in the order of a '
+                   'serial run. Each shard enforces --max-failures on its '
+                   'own. Requires --shard-devices.')
+  group.add_option('--shard-devices', default=None,
+                   help='Comma separated list of device IDs, one for each '
+                   'shard. Each shard uses the device at its index as '
+                   '--device.')
+  parser.add_option_group(group)
+
   # WPR options
   group = optparse.OptionGroup(parser, 'Web Page Replay options')
   group.add_option('--use-live-sites',
@@ -67,6 +85,20 @@ def ProcessCommandLineArgs(parser, args):
   if args.pageset_repeat < 1:
     parser.error('--pageset-repeat must be a positive integer.')
 
+  # Sharding options
+  if args.shards < 1:
+    parser.error('--shards must be a positive integer.')
+  if args.shards > 1 and not hasattr(os, 'fork'):
+    parser.error('--shards requires a platform that supports fork.')
+  if args.shards > 1 and not args.shard_devices:
+    # Shards running on the same device or browser would skew each other's
+    # measurements.
+    parser.error('--shards requires --shard-devices.')
+  if (args.shard_devices and
+      len(set(args.shard_devices.split(','))) < args.shards):
+    parser.error('--shard-devices must list a different device for each '
+                 'shard.')
+
 
 def _RunUserStoryAndProcessErrorIfNeeded(expectations, user_story, results,
                                          state):
@@ -205,58 +237,218 @@ def Run(test, user_story_set, expectations, finder_options, results,
       user_stories,
       user_story_set.allow_mixed_story_states)
 
+  if finder_options.shards > 1:
+    _RunShardedUserStoryGroups(
+        test, user_story_set, user_story_groups, expectations, finder_options,
+        results, effective_max_failures)
+    return
+
   for group in user_story_groups:
-    state = None
-    try:
-      for _ in xrange(finder_options.pageset_repeat):
-        for user_story in group.user_stories:
-          for _ in xrange(finder_options.page_repeat):
-            if not state:
-              state = group.shared_user_story_state_class(
-                  test, finder_options, user_story_set)
-            results.WillRunPage(user_story)
+    if not _RunUserStoryGroup(
+        test, user_story_set, group, expectations, finder_options, results,
+        finder_options.pageset_repeat, effective_max_failures):
+      break
+  # Values computed in the background, e.g. by TimelineBasedMeasurement,
+  # may include failures, which callers count once Run returns.
+  results.WaitForDeferredValues()
+
+
+def _HasTooManyFailures(results, max_failures):
+  """Returns whether results have more than max_failures failures.
+
+  Deferred values may still add failures, so they are waited for once they
+  could exceed max_failures.
+  """
+  if max_failures is None:
+    return False
+  results.AddReadyDeferredValues()
+  if len(results.failures) + results.num_deferred_values > max_failures:
+    results.WaitForDeferredValues()
+  return len(results.failures) > max_failures
+
+
+def _RunUserStoryGroup(test, user_story_set, group, expectations,
+                       finder_options, results, pageset_repeat, max_failures):
+  """Runs the user stories of a group pageset_repeat times with one state.
+
+  Returns False if the run was aborted because of too many failures.
+  """
+  state = None
+  try:
+    for _ in xrange(pageset_repeat):
+      for user_story in group.user_stories:
+        for _ in xrange(finder_options.page_repeat):
+          if not state:
+            state = group.shared_user_story_state_class(
+                test, finder_options, user_story_set)
+          results.WillRunPage(user_story)
+          try:
+            _WaitForThermalThrottlingIfNeeded(state.platform)
+            _RunUserStoryAndProcessErrorIfNeeded(
+                expectations, user_story, results, state)
+          except exceptions.Error:
+            # Catch all Telemetry errors to give the story a chance to retry.
+            # The retry is enabled by tearing down the state and creating
+            # a new state instance in the next iteration.
             try:
-              _WaitForThermalThrottlingIfNeeded(state.platform)
-              _RunUserStoryAndProcessErrorIfNeeded(
-                  expectations, user_story, results, state)
-            except exceptions.Error:
-              # Catch all Telemetry errors to give the story a chance to retry.
-              # The retry is enabled by tearing down the state and creating
-              # a new state instance in the next iteration.
-              try:
-                # If TearDownState raises, do not catch the exception.
-                # (The Error was saved as a failure value.)
-                state.TearDownState(results)
-              finally:
-                # Later finally-blocks use state, so ensure it is cleared.
-                state = None
+              # If TearDownState raises, do not catch the exception.
+              # (The Error was saved as a failure value.)
+              state.TearDownState(results)
             finally:
-              has_existing_exception = sys.exc_info() is not None
-              try:
-                if state:
-                  _CheckThermalThrottling(state.platform)
-                results.DidRunPage(user_story)
-              except Exception:
-                if not has_existing_exception:
-                  raise
-                # Print current exception and propagate existing exception.
-                exception_formatter.PrintFormattedException(
-                    msg='Exception from result processing:')
-          if (effective_max_failures is not None and
-              len(results.failures) > effective_max_failures):
-            logging.error('Too many failures. Aborting.')
-            return
-    finally:
-      if state:
-        has_existing_exception = sys.exc_info() is not None
-        try:
-          state.TearDownState(results)
-        except Exception:
-          if not has_existing_exception:
-            raise
-          # Print current exception and propagate existing exception.
-          exception_formatter.PrintFormattedException(
-              msg='Exception from TearDownState:')
+              # Later finally-blocks use state, so ensure it is cleared.
+              state = None
+          finally:
+            has_existing_exception = sys.exc_info() is not None
+            try:
+              if state:
+                _CheckThermalThrottling(state.platform)
+              results.DidRunPage(user_story)
+            except Exception:
+              if not has_existing_exception:
+                raise
+              # Print current exception and propagate existing exception.
+              exception_formatter.PrintFormattedException(
+                  msg='Exception from result processing:')
+        if _HasTooManyFailures(results, max_failures):
+          logging.error('Too many failures. Aborting.')
+          return False
+  finally:
+    if state:
+      has_existing_exception = sys.exc_info() is not None
+      try:
+        state.TearDownState(results)
+      except Exception:
+        if not has_existing_exception:
+          raise
+        # Print current exception and propagate existing exception.
+        exception_formatter.PrintFormattedException(
+            msg='Exception from TearDownState:')
+  return True
+
+
+def _PickleWithUserStoryIds(obj, user_story_set):
+  """Pickles obj, referring to the user stories of user_story_set by index."""
+  user_story_indices = dict(
+      (id(user_story), i) for i, user_story in enumerate(user_story_set))
+  f = cStringIO.StringIO()
+  pickler = cPickle.Pickler(f, cPickle.HIGHEST_PROTOCOL)
+  pickler.persistent_id = lambda o: user_story_indices.get(id(o))
+  pickler.dump(obj)
+  return f.getvalue()
+
+
+def _UnpickleWithUserStoryIds(data, user_story_set):
+  unpickler = cPickle.Unpickler(cStringIO.StringIO(data))
+  unpickler.persistent_load = lambda i: user_story_set[i]
+  return unpickler.load()
+
+
+def _RunShard(test, user_story_set, groups, expectations, finder_options,
+              max_failures, connection):
+  """Runs each of groups once in a shard process.
+
+  Sends the (user story, values) pairs of the runs of each group that was
+  started back through connection, along with the formatted exception if the
+  shard failed. The failing group is the last one.
+  """
+  runs_by_group = []
+  error = None
+  try:
+    shard_results = page_test_results.PageTestResults()
+    for group in groups:
+      run_count = len(shard_results.all_page_runs)
+      try:
+        keep_going = _RunUserStoryGroup(
+            test, user_story_set, group, expectations, finder_options,
+            shard_results, 1, max_failures)
+        shard_results.WaitForDeferredValues()
+      finally:
+        runs_by_group.append([
+            (run.user_story, run.values)
+            for run in shard_results.all_page_runs[run_count:]])
+      if not keep_going:
+        break
+  except Exception:
+    error = traceback.format_exc()
+  connection.send_bytes(
+      _PickleWithUserStoryIds((runs_by_group, error), user_story_set))
+  connection.close()
+
+
+def _RunShardedUserStoryGroups(test, user_story_set, user_story_groups,
+                               expectations, finder_options, results,
+                               max_failures):
+  """Runs every page set repeat of every group in a pool of shard processes.
+
+  The shards are forked, so they share the test and options of this process
+  without serializing them, but each creates its own shared states and uses
+  its own device. The runs of each shard are added to results in the order of
+  a serial run once all shards are done.
+
+  Each shard stops on its own once it has more than max_failures failures,
+  and the merged runs stop once they do. If a shard fails, the runs it
+  finished are kept, and its exception is added as a failure of the group it
+  was running.
+  """
+  # Each unit of work is one page set repeat of one group, in serial order.
+  units = [group for group in user_story_groups
+           for _ in xrange(finder_options.pageset_repeat)]
+  shard_count = min(finder_options.shards, len(units))
+  devices = finder_options.shard_devices.split(',')
+
+  shards = []
+  for shard_index in xrange(shard_count):
+    shard_options = finder_options.Copy()
+    shard_options.device = devices[shard_index]
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(
+        target=_RunShard,
+        args=(test, user_story_set, units[shard_index::shard_count],
+              expectations, shard_options, max_failures, sender))
+    process.start()
+    sender.close()
+    shards.append((process, receiver))
+
+  runs_by_shard = []
+  errors_by_shard = []
+  for shard_index, (process, receiver) in enumerate(shards):
+    try:
+      runs_by_group, error = _UnpickleWithUserStoryIds(
+          receiver.recv_bytes(), user_story_set)
+    except EOFError:
+      runs_by_group, error = [], 'Shard exited without sending results.'
+    process.join()
+    if error:
+      logging.error('Shard %d failed:\n%s', shard_index, error)
+      # The error is added to the last group, even if none was started.
+      runs_by_group = runs_by_group or [[]]
+    runs_by_shard.append(runs_by_group)
+    errors_by_shard.append(error)
+
+  for unit_index, group in enumerate(units):
+    shard_index = unit_index % shard_count
+    shard_runs = runs_by_shard[shard_index]
+    error = errors_by_shard[shard_index]
+    group_index = unit_index // shard_count
+    if group_index >= len(shard_runs):
+      # The shard aborted because of too many failures or an exception.
+      continue
+    runs = shard_runs[group_index]
+    for user_story, values in runs:
+      results.WillRunPage(user_story)
+      for value in values:
+        results.AddValue(value)
+      results.DidRunPage(user_story)
+    if error and group_index == len(shard_runs) - 1:
+      # Blame the user story that ran last, or else the group's first one.
+      user_story = runs[-1][0] if runs else group.user_stories[0]
+      results.WillRunPage(user_story)
+      results.AddValue(failure.FailureValue.FromMessage(
+          user_story, 'Shard %d failed:\n%s' % (shard_index, error)))
+      results.DidRunPage(user_story)
+    if max_failures is not None and len(results.failures) > max_failures:
+      logging.error('Too many failures. Aborting.')
+      return
 
 
 def _UpdateAndCheckArchives(archive_data_file, wpr_archive_info,
@@ -2,6 +2,7 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import os
 import StringIO
 import sys
 import unittest
@@ -20,6 +21,7 @@ from telemetry.user_story import user_story_runner
 from telemetry.user_story import user_story_set
 from telemetry.util import cloud_storage
 from telemetry.util import exception_formatter as exception_formatter_module
+from telemetry.value import failure
 from telemetry.value import scalar
 from telemetry.value import string
 from telemetry.web_perf import timeline_based_measurement
@@ -218,6 +220,80 @@ class UserStoryRunnerTest(unittest.TestCase):
     self.assertRaises(ValueError, user_story_runner.Run, test, us,
                       self.expectations, self.options, self.results)
 
+  def testShardedRunMatchesSerialRun(self):
+    class ProcessIdTest(DummyTest):
+      def RunPage(self, page, _, results):
+        results.AddValue(scalar.ScalarValue(page, 'pid', 'count', os.getpid()))
+        if page.name == 'fail':
+          raise page_test.Failure('Failing %s' % page.name)
+
+    us = MixedStateStorySet()
+    for name, state_class in [('a', FooUserStoryState),
+                              ('fail', FooUserStoryState),
+                              ('b', BarUserStoryState),
+                              ('c', FooUserStoryState)]:
+      us.AddUserStory(DummyLocalUserStory(state_class, name=name))
+    self.options.pageset_repeat = 2
+
+    user_story_runner.Run(
+        ProcessIdTest(), us, self.expectations, self.options, self.results)
+    self.options.shards = 3
+    self.options.shard_devices = 'device0,device1,device2'
+    sharded_results = results_options.CreateResults(
+        EmptyMetadataForTest(), self.options)
+    user_story_runner.Run(
+        ProcessIdTest(), us, self.expectations, self.options, sharded_results)
+
+    def RunSummary(results):
+      return [(run.user_story.name, [v.name for v in run.values])
+              for run in results.all_page_runs]
+    self.assertEquals(RunSummary(self.results), RunSummary(sharded_results))
+    self.assertEquals(2, len(sharded_results.failures))
+    self.assertIn('Failing fail', str(sharded_results.failures[0].exc_info[1]))
+    pids = set(v.value for v in
+               sharded_results.FindAllPageSpecificValuesNamed('pid'))
+    self.assertEquals(3, len(pids))
+    self.assertNotIn(os.getpid(), pids)
+
+  def testFailingShardKeepsOtherShardsResults(self):
+    self.SuppressExceptionFormatting()
+    class CrashingTest(DummyTest):
+      def RunPage(self, page, _, results):
+        results.AddValue(string.StringValue(page, 'name', 'name', page.name))
+        if page.name == 'crash':
+          raise Exception('Crashing %s' % page.name)
+
+    us = MixedStateStorySet()
+    for name, state_class in [('a', FooUserStoryState),
+                              ('crash', BarUserStoryState),
+                              ('b', FooUserStoryState)]:
+      us.AddUserStory(DummyLocalUserStory(state_class, name=name))
+    self.options.shards = 3
+    self.options.shard_devices = 'device0,device1,device2'
+    user_story_runner.Run(
+        CrashingTest(), us, self.expectations, self.options, self.results)
+
+    self.assertEquals(
+        ['a', 'crash', 'crash', 'b'],
+        [run.user_story.name for run in self.results.all_page_runs])
+    self.assertEquals(['a', 'b'], [
+        v.value for v in self.results.FindAllPageSpecificValuesNamed('name')
+        if v.page.name != 'crash'])
+    # The page's own failure, and the one of the shard.
+    self.assertEquals(2, len(self.results.failures))
+    self.assertIn('Shard 1 failed', str(self.results.failures[1].exc_info[1]))
+
+  def testShardsRequireADeviceEach(self):
+    parser = self.options.CreateParser()
+    user_story_runner.AddCommandLineArgs(parser)
+    self.options.shards = 2
+    for shard_devices in (None, 'device0', 'device0,device0'):
+      self.options.shard_devices = shard_devices
+      self.assertRaises(SystemExit, user_story_runner.ProcessCommandLineArgs,
+                        parser, self.options)
+    self.options.shard_devices = 'device0,device1'
+    user_story_runner.ProcessCommandLineArgs(parser, self.options)
+
   def testSuccessfulTimelineBasedMeasurementTest(self):
     """Check that PageTest is not required for user_story_runner.Run.
 
@@ -491,7 +567,7 @@ class UserStoryRunnerTest(unittest.TestCase):
 
   def _testMaxFailuresOptionIsRespectedAndOverridable(
       self, num_failing_user_stories, runner_max_failures, options_max_failures,
-      expected_num_failures):
+      expected_num_failures, defer_failures=False):
     class SimpleSharedUserStoryState(
         shared_user_story_state.SharedUserStoryState):
       _fake_platform = FakePlatform()
@@ -505,7 +581,16 @@ class UserStoryRunnerTest(unittest.TestCase):
         self._current_user_story = story
 
       def RunUserStory(self, results):
-        self._current_user_story.Run()
+        if defer_failures:
+          story = self._current_user_story
+          story.was_run = True
+          # The failure is computed in the background and never ready on its
+          # own.
+          results.AddDeferredValues(
+              lambda: [failure.FailureValue.FromMessage(story, 'Failure')],
+              lambda: False)
+        else:
+          self._current_user_story.Run()
 
       def DidRunUserStory(self, results):
         pass
@@ -568,3 +653,9 @@ class UserStoryRunnerTest(unittest.TestCase):
     self._testMaxFailuresOptionIsRespectedAndOverridable(
         num_failing_user_stories=5, runner_max_failures=3,
         options_max_failures=1, expected_num_failures=2)
+
+  def testMaxFailuresCountsDeferredFailures(self):
+    self._testMaxFailuresOptionIsRespectedAndOverridable(
+        num_failing_user_stories=5, runner_max_failures=3,
+        options_max_failures=None, expected_num_failures=4,
+        defer_failures=True)
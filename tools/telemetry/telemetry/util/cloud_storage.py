@@ -8,11 +8,15 @@ import collections
 import contextlib
 import cStringIO
 import hashlib
+import json
 import logging
+from multiprocessing import pool
 import os
 import subprocess
 import sys
 import tarfile
+import tempfile
+import threading
 import urllib2
 
 from telemetry.core import util
@@ -39,6 +43,11 @@ _DOWNLOAD_PATH = os.path.join(path.GetTelemetryDir(), 'third_party', 'gsutil')
 # TODO(tbarzic): A workaround for http://crbug.com/386416 and
 #     http://crbug.com/359293. See |_RunCommand|.
 _CROS_GSUTIL_HOME_WAR = '/home/chromeos-test/'
+# Where hashes of local files are kept between runs. See |CalculateHash|.
+_HASH_CACHE_PATH = os.path.join(
+    path.GetCacheDir(), 'cloud_storage_hashes.json')
+# The number of files GetFilesInDirectoryIfChanged checks at the same time.
+_GET_IF_CHANGED_THREADS = 8
 
 
 class CloudStorageError(Exception):
@@ -273,16 +282,115 @@ def GetFilesInDirectoryIfChanged(directory, bucket):
   # Don't allow the root directory to be a serving_dir.
   if directory == os.path.abspath(os.sep):
     raise ValueError('Trying to serve root directory from HTTP server.')
+  path_names = []
   for dirpath, _, filenames in os.walk(directory):
     for filename in filenames:
       path_name, extension = os.path.splitext(
           os.path.join(dirpath, filename))
       if extension != '.sha1':
         continue
-      GetIfChanged(path_name, bucket)
+      path_names.append(path_name)
+  with _file_hash_cache.Batch():
+    if len(path_names) <= 1:
+      for path_name in path_names:
+        GetIfChanged(path_name, bucket)
+      return
+    # Hashing and downloading are spent outside of the interpreter, so threads
+    # are enough to check files concurrently.
+    thread_pool = pool.ThreadPool(
+        min(len(path_names), _GET_IF_CHANGED_THREADS))
+    try:
+      thread_pool.map(lambda path_name: GetIfChanged(path_name, bucket),
+                      path_names)
+    finally:
+      thread_pool.close()
+      thread_pool.join()
+
+
+class _FileHashCache(object):
+  """Hashes of local files, persisted as JSON at cache_path.
+
+  A hash is only returned while the size, mtime and inode of its file are
+  unchanged. New hashes are written to the file right away, or once at the
+  end of a batch.
+  """
+  def __init__(self, cache_path):
+    self._cache_path = cache_path
+    self._lock = threading.Lock()
+    # {path: [size, mtime, inode, hash]}, loaded on first use.
+    self._entries = None
+    self._batch_depth = 0
+    self._is_dirty = False
+
+  def _LoadIfNeeded(self):
+    if self._entries is not None:
+      return
+    try:
+      with open(self._cache_path, 'r') as f:
+        self._entries = json.load(f)
+    except (IOError, ValueError):
+      self._entries = {}
+
+  def Get(self, file_path, stat):
+    with self._lock:
+      self._LoadIfNeeded()
+      entry = self._entries.get(file_path)
+    if entry and entry[:3] == [stat.st_size, stat.st_mtime, stat.st_ino]:
+      return entry[3]
+    return None
+
+  def Set(self, file_path, stat, file_hash):
+    with self._lock:
+      self._LoadIfNeeded()
+      self._entries[file_path] = [
+          stat.st_size, stat.st_mtime, stat.st_ino, file_hash]
+      self._is_dirty = True
+      if not self._batch_depth:
+        self._Save()
+
+  @contextlib.contextmanager
+  def Batch(self):
+    """Defers writing new hashes until the outermost batch ends."""
+    with self._lock:
+      self._batch_depth += 1
+    try:
+      yield
+    finally:
+      with self._lock:
+        self._batch_depth -= 1
+        if not self._batch_depth and self._is_dirty:
+          self._Save()
+
+  def _Save(self):
+    self._is_dirty = False
+    cache_dir = os.path.dirname(self._cache_path)
+    try:
+      if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+      fd, temp_path = tempfile.mkstemp(dir=cache_dir)
+      with os.fdopen(fd, 'w') as f:
+        json.dump(self._entries, f)
+      os.rename(temp_path, self._cache_path)
+    except (IOError, OSError) as e:
+      logging.warning('Could not write hash cache %s: %s',
+                      self._cache_path, e)
+
+
+_file_hash_cache = _FileHashCache(_HASH_CACHE_PATH)
+
 
 def CalculateHash(file_path):
-  """Calculates and returns the hash of the file at file_path."""
+  """Calculates and returns the hash of the file at file_path.
+
+  The hashes of files that haven't changed since they were last hashed, in
+  this or an earlier run, are not calculated again.
+  """
+  file_path = os.path.abspath(file_path)
+  stat = os.stat(file_path)
+  file_hash = _file_hash_cache.Get(file_path, stat)
+  if file_hash:
+    return file_hash
+
   sha1 = hashlib.sha1()
   with open(file_path, 'rb') as f:
     while True:
@@ -291,7 +399,9 @@ def CalculateHash(file_path):
       if not chunk:
         break
       sha1.update(chunk)
-  return sha1.hexdigest()
+  file_hash = sha1.hexdigest()
+  _file_hash_cache.Set(file_path, stat, file_hash)
+  return file_hash
 
 
 def ReadHash(hash_path):
@@ -2,7 +2,11 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import hashlib
+import json
 import os
+import shutil
+import tempfile
 import unittest
 
 from telemetry import decorators
@@ -154,6 +158,66 @@ class CloudStorageUnitTest(unittest.TestCase):
       cloud_storage.GetIfChanged = orig_get_if_changed
       stubs.Restore()
 
+  def testCalculateHashSkipsUnchangedFiles(self):
+    temp_dir = tempfile.mkdtemp()
+    file_path = os.path.join(temp_dir, 'archive.wpr')
+    cache_path = os.path.join(temp_dir, 'hashes.json')
+    orig_hashlib = cloud_storage.hashlib
+    orig_file_hash_cache = cloud_storage._file_hash_cache
+    class CountingHashlib(object):
+      sha1_count = 0
+      def sha1(self):
+        CountingHashlib.sha1_count += 1
+        return hashlib.sha1()
+    cloud_storage.hashlib = CountingHashlib()
+    try:
+      with open(file_path, 'w') as f:
+        f.write('foo')
+      cloud_storage._file_hash_cache = cloud_storage._FileHashCache(
+          cache_path)
+      self.assertEqual(hashlib.sha1('foo').hexdigest(),
+                       cloud_storage.CalculateHash(file_path))
+      self.assertEqual(hashlib.sha1('foo').hexdigest(),
+                       cloud_storage.CalculateHash(file_path))
+      self.assertEqual(1, CountingHashlib.sha1_count)
+
+      # The hashes are kept between runs.
+      cloud_storage._file_hash_cache = cloud_storage._FileHashCache(
+          cache_path)
+      self.assertEqual(hashlib.sha1('foo').hexdigest(),
+                       cloud_storage.CalculateHash(file_path))
+      self.assertEqual(1, CountingHashlib.sha1_count)
+
+      with open(file_path, 'a') as f:
+        f.write('bar')
+      self.assertEqual(hashlib.sha1('foobar').hexdigest(),
+                       cloud_storage.CalculateHash(file_path))
+      self.assertEqual(2, CountingHashlib.sha1_count)
+    finally:
+      cloud_storage.hashlib = orig_hashlib
+      cloud_storage._file_hash_cache = orig_file_hash_cache
+      shutil.rmtree(temp_dir)
+
+  def testHashesAreWrittenOnceAtTheEndOfABatch(self):
+    temp_dir = tempfile.mkdtemp()
+    cache_path = os.path.join(temp_dir, 'cache', 'hashes.json')
+    orig_file_hash_cache = cloud_storage._file_hash_cache
+    try:
+      for file_name in ('a', 'b'):
+        with open(os.path.join(temp_dir, file_name), 'w') as f:
+          f.write(file_name)
+      cloud_storage._file_hash_cache = cloud_storage._FileHashCache(
+          cache_path)
+      with cloud_storage._file_hash_cache.Batch():
+        cloud_storage.CalculateHash(os.path.join(temp_dir, 'a'))
+        cloud_storage.CalculateHash(os.path.join(temp_dir, 'b'))
+        self.assertFalse(os.path.exists(cache_path))
+      with open(cache_path) as f:
+        self.assertEqual(2, len(json.load(f)))
+    finally:
+      cloud_storage._file_hash_cache = orig_file_hash_cache
+      shutil.rmtree(temp_dir)
+
   def testCopy(self):
     orig_run_command = cloud_storage._RunCommand
     def AssertCorrectRunCommandArgs(args):
@@ -31,6 +31,14 @@ class FileHandle(object):
     self._id = _next_file_id
     _next_file_id += 1
 
+  def __getstate__(self):
+    # Temporary file objects can't be pickled, but their path can.
+    return {'_absolute_path': self.GetAbsPath()}
+
+  def __setstate__(self, state):
+    # Ids are only unique within a process, so a new one is assigned.
+    self.__init__(absolute_path=state['_absolute_path'])
+
   @property
   def id(self):
     return self._id
@@ -16,6 +16,15 @@ AddDirToPythonPath = util.AddDirToPythonPath
 GetBuildDirectories = util.GetBuildDirectories
 
 
+def GetCacheDir():
+  """Returns the directory for data that is cached between runs.
+
+  It is in the checkout rather than the shared temp dir, so that other users
+  can't plant entries in it, and other checkouts don't use them.
+  """
+  return os.path.join(GetTelemetryDir(), '.cache')
+
+
 def IsExecutable(path):
   return os.path.isfile(path) and os.access(path, os.X_OK)
 
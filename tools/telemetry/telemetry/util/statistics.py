@@ -4,8 +4,13 @@
 
 """A collection of statistical utility functions to be used by metrics."""
 
+import bisect
 import math
 
+from telemetry.util import external_modules
+
+np = external_modules.ImportOptionalModule('numpy')
+
 
 def Clamp(value, low=0.0, high=1.0):
   """Clamp a value between some low and high value."""
@@ -39,20 +44,12 @@ def NormalizeSamples(samples):
   return samples, scale
 
 
-def Discrepancy(samples, location_count=None):
-  """Computes the discrepancy of a set of 1D samples from the interval [0,1].
-
-  The samples must be sorted. We define the discrepancy of an empty set
-  of samples to be zero.
+def _DiscrepancyLocations(samples, location_count):
+  """Returns the locations at which the discrepancy of samples is measured.
 
-  http://en.wikipedia.org/wiki/Low-discrepancy_sequence
-  http://mathworld.wolfram.com/Discrepancy.html
+  Along with each location, returns the number of samples less than it and the
+  number of samples less than or equal to it.
   """
-  if not samples:
-    return 0.0
-
-  max_local_discrepancy = 0
-  inv_sample_count = 1.0 / len(samples)
   locations = []
   # For each location, stores the number of samples less than that location.
   count_less = []
@@ -86,8 +83,16 @@ def Discrepancy(samples, location_count=None):
       locations.append(1.0)
       count_less.append(len(samples))
       count_less_equal.append(len(samples))
+  return locations, count_less, count_less_equal
+
 
-  # Iterate over the intervals defined by any pair of locations.
+def _PairwiseMaxLocalDiscrepancy(locations, count_less, count_less_equal,
+                                 inv_sample_count):
+  """Reference implementation, trying the interval between every two locations.
+
+  This is O(n^2) in the number of locations.
+  """
+  max_local_discrepancy = 0
   for i in xrange(0, len(locations)):
     for j in xrange(i+1, len(locations)):
       # Length of interval
@@ -106,10 +111,77 @@ def Discrepancy(samples, location_count=None):
                                    inv_sample_count - length)
       max_local_discrepancy = max(local_discrepancy_open,
                                   max_local_discrepancy)
+  return max_local_discrepancy
 
+
+def _LinearMaxLocalDiscrepancy(locations, count_less, count_less_equal,
+                               inv_sample_count):
+  """Computes the same value as _PairwiseMaxLocalDiscrepancy in O(n).
+
+  With le[k] = count_less_equal[k] / n - locations[k] and
+  lt[k] = count_less[k] / n - locations[k], the local discrepancy of the
+  closed interval [i, j] is |le[j] - lt[i]| and that of the open interval is
+  |lt[j] - le[i]|. So for each j, only the extremes of le and lt over the
+  locations before it need to be considered.
+  """
+  le = [float(c) * inv_sample_count - l
+        for c, l in zip(count_less_equal, locations)]
+  lt = [float(c) * inv_sample_count - l
+        for c, l in zip(count_less, locations)]
+  max_local_discrepancy = 0
+  min_le = max_le = le[0]
+  min_lt = max_lt = lt[0]
+  for j in xrange(1, len(locations)):
+    max_local_discrepancy = max(max_local_discrepancy,
+                                le[j] - min_lt, max_lt - le[j],
+                                lt[j] - min_le, max_le - lt[j])
+    min_le = min(min_le, le[j])
+    max_le = max(max_le, le[j])
+    min_lt = min(min_lt, lt[j])
+    max_lt = max(max_lt, lt[j])
   return max_local_discrepancy
 
 
+def _NumpyMaxLocalDiscrepancy(locations, count_less, count_less_equal,
+                              inv_sample_count):
+  """Vectorized version of _LinearMaxLocalDiscrepancy."""
+  if len(locations) < 2:
+    return 0
+  locations = np.array(locations, dtype=float)
+  le = np.array(count_less_equal, dtype=float) * inv_sample_count - locations
+  lt = np.array(count_less, dtype=float) * inv_sample_count - locations
+  # The extremes over all locations strictly before each j.
+  min_le = np.minimum.accumulate(le)[:-1]
+  max_le = np.maximum.accumulate(le)[:-1]
+  min_lt = np.minimum.accumulate(lt)[:-1]
+  max_lt = np.maximum.accumulate(lt)[:-1]
+  return float(max(0,
+                   np.max(le[1:] - min_lt), np.max(max_lt - le[1:]),
+                   np.max(lt[1:] - min_le), np.max(max_le - lt[1:])))
+
+
+def Discrepancy(samples, location_count=None):
+  """Computes the discrepancy of a set of 1D samples from the interval [0,1].
+
+  The samples must be sorted. We define the discrepancy of an empty set
+  of samples to be zero.
+
+  http://en.wikipedia.org/wiki/Low-discrepancy_sequence
+  http://mathworld.wolfram.com/Discrepancy.html
+  """
+  if not samples:
+    return 0.0
+
+  locations, count_less, count_less_equal = _DiscrepancyLocations(
+      samples, location_count)
+  if np is None:
+    max_local_discrepancy = _LinearMaxLocalDiscrepancy
+  else:
+    max_local_discrepancy = _NumpyMaxLocalDiscrepancy
+  return max_local_discrepancy(locations, count_less, count_less_equal,
+                               1.0 / len(samples))
+
+
 def TimestampsDiscrepancy(timestamps, absolute=True,
                           location_count=None):
   """A discrepancy based metric for measuring timestamp jank.
@@ -297,8 +369,29 @@ def Percentile(values, percentile):
   """
   if not values:
     return 0.0
+  return _PercentileOfSorted(sorted(values), percentile)
+
+
+def Percentiles(values, percentiles):
+  """Like Percentile, for several percentiles of the same values.
+
+  The values are only sorted once.
+
+  Args:
+    values: A list of numerical values.
+    percentiles: A list of numbers between 0 and 100.
+
+  Returns:
+    A list with the value of each of the given percentiles.
+  """
+  if not values:
+    return [0.0] * len(percentiles)
   sorted_values = sorted(values)
-  n = len(values)
+  return [_PercentileOfSorted(sorted_values, p) for p in percentiles]
+
+
+def _PercentileOfSorted(sorted_values, percentile):
+  n = len(sorted_values)
   percentile /= 100.0
   if percentile <= 0.5 / n:
     return sorted_values[0]
@@ -329,3 +422,191 @@ def GeometricMean(values):
   mean = math.pow(math.e, (log_sum / len(new_values)))
   # Return the rounded mean.
   return int(round(mean))
+
+
+class RunningStatistics(object):
+  """Accumulates the count, mean and variance of samples one at a time.
+
+  Uses Welford's algorithm, so no samples are kept in memory. Accumulators of
+  disjoint sets of samples can be merged.
+  """
+  def __init__(self, values=None):
+    self._count = 0
+    self._mean = 0.0
+    # Sum of the squared differences from the current mean.
+    self._m2 = 0.0
+    self._min = None
+    self._max = None
+    for value in values or []:
+      self.Add(value)
+
+  def Add(self, value):
+    value = float(value)
+    self._count += 1
+    delta = value - self._mean
+    self._mean += delta / self._count
+    self._m2 += delta * (value - self._mean)
+    if self._min is None or value < self._min:
+      self._min = value
+    if self._max is None or value > self._max:
+      self._max = value
+
+  def Merge(self, other):
+    """Adds all samples accumulated by other to this accumulator."""
+    if not other.count:
+      return
+    if not self._count:
+      self._count = other.count
+      self._mean = other._mean
+      self._m2 = other._m2
+      self._min = other.min
+      self._max = other.max
+      return
+    count = self._count + other.count
+    delta = other._mean - self._mean
+    self._mean += delta * other.count / count
+    self._m2 += other._m2 + delta * delta * self._count * other.count / count
+    self._count = count
+    self._min = min(self._min, other.min)
+    self._max = max(self._max, other.max)
+
+  @property
+  def count(self):
+    return self._count
+
+  @property
+  def mean(self):
+    """The arithmetic mean, or 0 if there are no samples."""
+    return self._mean
+
+  @property
+  def total(self):
+    return self._mean * self._count
+
+  @property
+  def min(self):
+    return self._min
+
+  @property
+  def max(self):
+    return self._max
+
+  @property
+  def variance(self):
+    """The population variance, or 0 if there are no samples."""
+    return self._m2 / self._count if self._count else 0.0
+
+  @property
+  def standard_deviation(self):
+    """The population standard deviation, as StandardDeviation computes."""
+    return math.sqrt(self.variance)
+
+
+class QuantileSketch(object):
+  """Estimates percentiles of a stream of samples in bounded memory.
+
+  This is a merging t-digest: samples are summarized by a sorted list of
+  centroids, each the mean of a run of adjacent samples. Centroids near the
+  extremes are kept small, so tail percentiles stay accurate, and the number
+  of centroids grows with |compression| rather than with the sample count.
+  Sketches of disjoint sets of samples can be merged.
+
+  While fewer than 2 * |compression| samples have been added, no two samples
+  can share a centroid, so the percentiles are exactly those computed by
+  Percentile. With more samples, they are estimates.
+
+  http://github.com/tdunning/t-digest
+  """
+  def __init__(self, compression=100, values=None):
+    self._compression = compression
+    # Sorted lists of [mean, weight] pairs.
+    self._centroids = []
+    self._buffer = []
+    self._buffer_size = 5 * compression
+    self._count = 0
+    self._min = None
+    self._max = None
+    for value in values or []:
+      self.Add(value)
+
+  def Add(self, value):
+    self._AddWeighted(float(value), 1)
+
+  def _AddWeighted(self, mean, weight):
+    self._buffer.append([mean, weight])
+    self._count += weight
+    if self._min is None or mean < self._min:
+      self._min = mean
+    if self._max is None or mean > self._max:
+      self._max = mean
+    if len(self._buffer) >= self._buffer_size:
+      self._Compress()
+
+  def Merge(self, other):
+    """Adds all samples summarized by other to this sketch."""
+    other._Compress()
+    for mean, weight in other._centroids:
+      self._AddWeighted(mean, weight)
+    if other.count:
+      self._min = min(self._min, other.min)
+      self._max = max(self._max, other.max)
+
+  def _Compress(self):
+    if not self._buffer:
+      return
+    items = sorted(self._centroids + self._buffer)
+    self._buffer = []
+    total = float(self._count)
+    centroids = [list(items[0])]
+    # Weight of all centroids before the last one.
+    cumulative = 0.0
+    for mean, weight in items[1:]:
+      last = centroids[-1]
+      merged_weight = last[1] + weight
+      q = (cumulative + merged_weight / 2.0) / total
+      if merged_weight <= 4 * total * q * (1 - q) / self._compression:
+        last[0] += (mean - last[0]) * weight / merged_weight
+        last[1] = merged_weight
+      else:
+        cumulative += last[1]
+        centroids.append([mean, weight])
+    self._centroids = centroids
+
+  @property
+  def count(self):
+    return self._count
+
+  @property
+  def min(self):
+    return self._min
+
+  @property
+  def max(self):
+    return self._max
+
+  def Percentile(self, percentile):
+    """Estimates the given percentile, as Percentile would compute it."""
+    self._Compress()
+    if not self._centroids:
+      return 0.0
+    # The centroid means are interpolated between their centers of mass,
+    # anchored at the extreme samples.
+    ranks = [0.0]
+    values = [self._min]
+    cumulative = 0.0
+    for mean, weight in self._centroids:
+      ranks.append(cumulative + weight / 2.0)
+      values.append(mean)
+      cumulative += weight
+    ranks.append(cumulative)
+    values.append(self._max)
+
+    rank = Clamp(self._count * percentile / 100.0, 0.0, cumulative)
+    index = max(bisect.bisect_right(ranks, rank) - 1, 0)
+    if index >= len(ranks) - 1:
+      return values[-1]
+    alpha = (rank - ranks[index]) / (ranks[index + 1] - ranks[index])
+    return values[index] + alpha * (values[index + 1] - values[index])
+
+  def Median(self):
+    return self.Percentile(50)
@@ -2,6 +2,7 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import bisect
 import math
 import random
 import unittest
@@ -115,6 +116,27 @@ class StatisticsUnitTest(unittest.TestCase):
     d = statistics.Discrepancy(samples)
     self.assertEquals(d, 0.25)
 
+  def testDiscrepancyMatchesPairwiseReference(self):
+    random.seed(1234567)
+    implementations = [statistics._LinearMaxLocalDiscrepancy]
+    if statistics.np is not None:
+      implementations.append(statistics._NumpyMaxLocalDiscrepancy)
+    for _ in xrange(0, 100):
+      samples = statistics.NormalizeSamples(
+          CreateRandomSamples(random.randint(1, 40)))[0]
+      # Repeated samples exercise the difference between open and closed
+      # intervals.
+      samples = sorted(samples + random.sample(samples, len(samples) / 3))
+      for location_count in [None, 10]:
+        locations, count_less, count_less_equal = (
+            statistics._DiscrepancyLocations(samples, location_count))
+        inv_sample_count = 1.0 / len(samples)
+        expected = statistics._PairwiseMaxLocalDiscrepancy(
+            locations, count_less, count_less_equal, inv_sample_count)
+        for implementation in implementations:
+          self.assertAlmostEquals(expected, implementation(
+              locations, count_less, count_less_equal, inv_sample_count))
+
   def testTimestampsDiscrepancy(self):
     time_stamps = []
     d_abs = statistics.TimestampsDiscrepancy(time_stamps, True)
@@ -217,3 +239,64 @@ class StatisticsUnitTest(unittest.TestCase):
     self.assertEquals(3, statistics.TrapezoidalRule([-1, 2, 3], 1))
     self.assertEquals(0, statistics.TrapezoidalRule([1], 1))
     self.assertEquals(0, statistics.TrapezoidalRule([0], 1))
+
+  def testPercentiles(self):
+    values = [5, 1, 4, 2, 3]
+    percentiles = [0, 25, 50, 90, 100]
+    self.assertEquals([statistics.Percentile(values, p) for p in percentiles],
+                      statistics.Percentiles(values, percentiles))
+    self.assertEquals([0.0, 0.0], statistics.Percentiles([], [50, 90]))
+
+  def testRunningStatistics(self):
+    random.seed(1234567)
+    values = [random.uniform(-10, 100) for _ in xrange(0, 1000)]
+    running = statistics.RunningStatistics(values)
+    self.assertEquals(1000, running.count)
+    self.assertAlmostEquals(statistics.ArithmeticMean(values), running.mean)
+    self.assertAlmostEquals(statistics.StandardDeviation(values),
+                            running.standard_deviation)
+    self.assertAlmostEquals(sum(values), running.total)
+    self.assertEquals(min(values), running.min)
+    self.assertEquals(max(values), running.max)
+
+    merged = statistics.RunningStatistics()
+    merged.Merge(statistics.RunningStatistics(values[:300]))
+    merged.Merge(statistics.RunningStatistics())
+    merged.Merge(statistics.RunningStatistics(values[300:]))
+    self.assertEquals(1000, merged.count)
+    self.assertAlmostEquals(running.mean, merged.mean)
+    self.assertAlmostEquals(running.variance, merged.variance)
+    self.assertEquals(running.min, merged.min)
+    self.assertEquals(running.max, merged.max)
+
+  def testQuantileSketchIsExactForFewSamples(self):
+    random.seed(1234567)
+    # The most samples that are never merged with the default compression.
+    values = [random.random() for _ in xrange(0, 199)]
+    sketch = statistics.QuantileSketch(values=values)
+    for percentile in [0, 0.1, 1, 10, 25, 50, 75, 90, 99, 99.9, 100]:
+      self.assertAlmostEquals(statistics.Percentile(values, percentile),
+                              sketch.Percentile(percentile))
+    self.assertEquals(0.0, statistics.QuantileSketch().Percentile(50))
+
+  def testQuantileSketchError(self):
+    random.seed(1234567)
+    values = [random.expovariate(1.0) for _ in xrange(0, 20000)]
+    sketch = statistics.QuantileSketch()
+    merged = statistics.QuantileSketch()
+    for i in xrange(0, 4):
+      part = statistics.QuantileSketch(values=values[i::4])
+      merged.Merge(part)
+    for value in values:
+      sketch.Add(value)
+    self.assertEquals(20000, sketch.count)
+    self.assertEquals(20000, merged.count)
+    self.assertTrue(len(sketch._centroids) < 1000)
+    sorted_values = sorted(values)
+    for percentile in [1, 10, 50, 90, 99, 99.9]:
+      for s in [sketch, merged]:
+        # The estimate must be within a small rank distance of the truth.
+        rank = bisect.bisect_left(sorted_values, s.Percentile(percentile))
+        self.assertTrue(abs(rank / 200.0 - percentile) < 0.5)
+    self.assertEquals(min(values), merged.Percentile(0))
+    self.assertEquals(max(values), merged.Percentile(100))
@@ -41,6 +41,17 @@ class FailureValue(value_module.Value):
     except Exception:
       return sys.exc_info()
 
+  def __getstate__(self):
+    # Tracebacks can't be pickled, so only their formatted text is kept, as
+    # when deserializing with FromDict.
+    state = self.__dict__.copy()
+    state['_exc_info'] = GetStringFromExcInfo(self._exc_info)
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._exc_info = self._GetExcInfoFromMessage(self._exc_info)
+
   def __repr__(self):
     if self.page:
       page_name = self.page.url
@@ -5,7 +5,6 @@
 from collections import defaultdict
 
 from telemetry.timeline import bounds
-from telemetry.timeline import slice as slice_module
 
 
 class MissingData(Exception):
@@ -64,13 +63,13 @@ def GetFrameEventsInsideRange(renderer_process, timeline_range):
   #    1: [begin_main_frame, send_begin_frame],
   #    2: [send_begin_frame, begin_main_frame]}
   begin_frame_events_by_id = defaultdict(list)
-  for event in renderer_process.IterAllEvents(
-      event_type_predicate=lambda t: t == slice_module.Slice,
-      event_predicate=RenderingFrame.IsEventUseful):
-    begin_frame_id = event.args.get('begin_frame_id', None)
-    if begin_frame_id is None:
-      raise NoBeginFrameIdException('Event is missing a begin_frame_id.')
-    begin_frame_events_by_id[begin_frame_id].append(event)
+  for event_name in (RenderingFrame.send_begin_frame_event,
+                     RenderingFrame.begin_main_frame_event):
+    for event in renderer_process.IterAllSlicesOfName(event_name):
+      begin_frame_id = event.args.get('begin_frame_id', None)
+      if begin_frame_id is None:
+        raise NoBeginFrameIdException('Event is missing a begin_frame_id.')
+      begin_frame_events_by_id[begin_frame_id].append(event)
 
   # Now, create RenderingFrames for events wherever possible.
   frames = []
@@ -1,6 +1,7 @@
 # Copyright 2014 The Chromium Authors. All rights reserved.
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
+import bisect
 from operator import attrgetter
 
 from telemetry.web_perf.metrics import rendering_frame
@@ -149,6 +150,11 @@ class RenderingStats(object):
     # in attempting to generate that list.
     self.errors = {}
 
+    # A lookup from (event name, process) to that process's events of that
+    # name sorted by start time, and their start times. Lets every timeline
+    # range bisect the same events instead of rescanning the process.
+    self._sorted_events = {}
+
     self.frame_timestamps = []
     self.frame_times = []
     self.approximated_pixel_percentages = []
@@ -206,15 +212,21 @@ class RenderingStats(object):
         latency for name, latency in input_event_latencies
         if name == GESTURE_SCROLL_UPDATE_EVENT_NAME]
 
+  def _GetSortedEvents(self, event_name, process):
+    key = (event_name, process)
+    if key not in self._sorted_events:
+      events = [event for event in process.IterAllSlicesOfName(event_name)
+                if 'data' in event.args]
+      events.sort(key=attrgetter('start'))
+      self._sorted_events[key] = (events, [event.start for event in events])
+    return self._sorted_events[key]
+
   def _GatherEvents(self, event_name, process, timeline_range):
-    events = []
-    for event in process.IterAllSlicesOfName(event_name):
-      if event.start >= timeline_range.min and event.end <= timeline_range.max:
-        if 'data' not in event.args:
-          continue
-        events.append(event)
-    events.sort(key=attrgetter('start'))
-    return events
+    events, starts = self._GetSortedEvents(event_name, process)
+    first = bisect.bisect_left(starts, timeline_range.min)
+    last = bisect.bisect_right(starts, timeline_range.max)
+    return [event for event in events[first:last]
+            if event.end <= timeline_range.max]
 
   def _AddFrameTimestamp(self, event):
     frame_count = event.args['data']['frame_count']
@@ -3,10 +3,15 @@
 # found in the LICENSE file.
 
 from collections import defaultdict
+import logging
+import multiprocessing
+import traceback
 
 from telemetry.core.platform import tracing_category_filter
 from telemetry.core.platform import tracing_options
 from telemetry.timeline import model as model_module
+from telemetry.timeline import model_cache
+from telemetry.value import failure
 from telemetry.value import trace
 from telemetry.web_perf.metrics import layout
 from telemetry.web_perf.metrics import responsiveness_metric
@@ -108,6 +113,54 @@ class _TimelineBasedMetrics(object):
                         interactions, wrapped_results)
 
 
+def _AddTimelineBasedResults(trace_data, results, model_cache_dir=None):
+  """Imports trace_data and adds the values of all metrics to results.
+
+  If model_cache_dir is given, the model is loaded from a TimelineModelCache
+  in that directory.
+  """
+  if model_cache_dir:
+    model = model_cache.TimelineModelCache(model_cache_dir).GetModel(
+        trace_data)
+  else:
+    model = model_module.TimelineModel(trace_data)
+  threads_to_records_map = _GetRendererThreadsToInteractionRecordsMap(model)
+  for renderer_thread, interaction_records in (
+      threads_to_records_map.iteritems()):
+    meta_metrics = _TimelineBasedMetrics(
+        model, renderer_thread, interaction_records)
+    meta_metrics.AddResults(results)
+
+
+class _ValueCollector(object):
+  """Stands in for the results while metrics run in a background process.
+
+  The values are created without a page, since pages stay in the process
+  running the user stories; they are given the page when merged back.
+  """
+  current_page = None
+
+  def __init__(self):
+    self.values = []
+
+  def AddValue(self, value):
+    self.values.append(value)
+
+
+def _ComputeTimelineBasedResults(trace_data, model_cache_dir=None):
+  """Runs in a background process. Returns a (values, error) pair.
+
+  error is the formatted exception if the metrics raised, in which case values
+  holds the values added before that.
+  """
+  collector = _ValueCollector()
+  try:
+    _AddTimelineBasedResults(trace_data, collector, model_cache_dir)
+  except Exception:
+    return collector.values, traceback.format_exc()
+  return collector.values, None
+
+
 class Options(object):
   """A class to be used to configure TimelineBasedMeasurement.
 
@@ -115,7 +168,8 @@ class Options(object):
   Benchmark.CreateTimelineBasedMeasurementOptions.
   """
 
-  def __init__(self, overhead_level=NO_OVERHEAD_LEVEL):
+  def __init__(self, overhead_level=NO_OVERHEAD_LEVEL,
+               background_metric_processes=0, timeline_model_cache_dir=None):
     """As the amount of instrumentation increases, so does the overhead.
     The user of the measurement chooses the overhead level that is appropriate,
     and the tracing is filtered accordingly.
@@ -123,6 +177,14 @@ class Options(object):
     overhead_level: Can either be a custom TracingCategoryFilter object or
         one of NO_OVERHEAD_LEVEL, MINIMAL_OVERHEAD_LEVEL or
         DEBUG_OVERHEAD_LEVEL.
+    background_metric_processes: If non-zero, the traces are imported and the
+        metrics computed in a pool of this many processes while the next
+        user stories run. The values are added to the results when the
+        results wait for their deferred values, before the summary is
+        printed. Can be overridden with --background-metric-processes.
+    timeline_model_cache_dir: If given, the imported timeline models are
+        cached in this directory, so that analyzing the same trace again
+        skips the import. Can be overridden with --timeline-model-cache-dir.
     """
     if (not isinstance(overhead_level,
                        tracing_category_filter.TracingCategoryFilter) and
@@ -132,6 +194,8 @@ class Options(object):
                       " Given overhead level: %s" % overhead_level)
 
     self._overhead_level = overhead_level
+    self._background_metric_processes = background_metric_processes
+    self._timeline_model_cache_dir = timeline_model_cache_dir
     self._extra_category_filters = []
 
   def ExtendTraceCategoryFilters(self, filters):
@@ -145,6 +209,22 @@ class Options(object):
   def overhead_level(self):
     return self._overhead_level
 
+  @property
+  def background_metric_processes(self):
+    return self._background_metric_processes
+
+  @background_metric_processes.setter
+  def background_metric_processes(self, count):
+    self._background_metric_processes = count
+
+  @property
+  def timeline_model_cache_dir(self):
+    return self._timeline_model_cache_dir
+
+  @timeline_model_cache_dir.setter
+  def timeline_model_cache_dir(self, cache_dir):
+    self._timeline_model_cache_dir = cache_dir
+
 
 class TimelineBasedMeasurement(object):
   """Collects multiple metrics based on their interaction records.
@@ -170,6 +250,7 @@ class TimelineBasedMeasurement(object):
   """
   def __init__(self, options):
     self._tbm_options = options
+    self._metric_pool = None
 
   def WillRunUserStory(self, tracing_controller,
                        synthetic_delay_categories=None):
@@ -214,13 +295,50 @@ class TimelineBasedMeasurement(object):
     """Collect all possible metrics and added them to results."""
     trace_result = tracing_controller.Stop()
     results.AddValue(trace.TraceValue(results.current_page, trace_result))
-    model = model_module.TimelineModel(trace_result)
-    threads_to_records_map = _GetRendererThreadsToInteractionRecordsMap(model)
-    for renderer_thread, interaction_records in (
-        threads_to_records_map.iteritems()):
-      meta_metrics = _TimelineBasedMetrics(
-          model, renderer_thread, interaction_records)
-      meta_metrics.AddResults(results)
+    if self._tbm_options.background_metric_processes:
+      self._AddResultsInBackground(trace_result, results)
+    else:
+      _AddTimelineBasedResults(trace_result, results,
+                               self._tbm_options.timeline_model_cache_dir)
+
+  def StartBackgroundMetricProcesses(self):
+    """Forks the pool that computes the metrics, if the options ask for one.
+
+    The shared states call this before they launch a browser or an app, so
+    that the processes don't inherit their file descriptors.
+    """
+    if self._tbm_options.background_metric_processes and not self._metric_pool:
+      self._metric_pool = multiprocessing.Pool(
+          self._tbm_options.background_metric_processes)
+
+  def StopBackgroundMetricProcesses(self):
+    """Waits for the metrics still being computed and ends the processes.
+
+    The values of the user stories measured so far can still be collected
+    afterwards.
+    """
+    if self._metric_pool:
+      self._metric_pool.close()
+      self._metric_pool.join()
+      self._metric_pool = None
+
+  def _AddResultsInBackground(self, trace_result, results):
+    self.StartBackgroundMetricProcesses()
+    async_result = self._metric_pool.apply_async(
+        _ComputeTimelineBasedResults,
+        (trace_result, self._tbm_options.timeline_model_cache_dir))
+    page = results.current_page
+
+    def GetValues():
+      values, error = async_result.get()
+      for value in values:
+        value.page = page
+      if error:
+        logging.error('Computing the metrics of %s failed:\n%s',
+                      page.display_name, error)
+        values.append(failure.FailureValue.FromMessage(page, error))
+      return values
+    results.AddDeferredValues(GetValues, async_result.ready)
 
   def DidRunUserStory(self, tracing_controller):
     if tracing_controller.is_tracing_running:
@@ -2,7 +2,10 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import multiprocessing
 import os
+import shutil
+import tempfile
 import unittest
 
 from telemetry.core import platform
@@ -11,6 +14,7 @@ from telemetry.page import page_set
 from telemetry.results import page_test_results
 from telemetry.timeline import async_slice
 from telemetry.timeline import model as model_module
+from telemetry.timeline import trace_data as trace_data_module
 from telemetry.value import scalar
 from telemetry.web_perf.metrics import timeline_based_metric
 from telemetry.web_perf import timeline_based_measurement as tbm_module
@@ -174,6 +178,76 @@ class TimelineBasedMetricsTests(unittest.TestCase):
     d.FinalizeImport()
     self.assertRaises(tbm_module.InvalidInteractions, d.AddResults)
 
+  def _CreateInteractionTraceData(self, *labels):
+    events = []
+    for i, label in enumerate(labels):
+      for ph, ts in (('S', 10 * i), ('F', 10 * i + 5)):
+        events.append({'name': 'Interaction.%s' % label, 'args': {},
+                       'pid': 1, 'tid': 2, 'ts': ts, 'tts': ts, 'cat': 'foo',
+                       'ph': ph, 'id': i})
+    return trace_data_module.TraceData({'traceEvents': events})
+
+  def testComputeTimelineBasedResultsInBackground(self):
+    pool = multiprocessing.Pool(1)
+    try:
+      values, error = pool.apply(
+          tbm_module._ComputeTimelineBasedResults,  # pylint: disable=W0212
+          (self._CreateInteractionTraceData('LogicalName1', 'LogicalName2'),))
+      _, duplicate_error = pool.apply(
+          tbm_module._ComputeTimelineBasedResults,  # pylint: disable=W0212
+          (self._CreateInteractionTraceData('LogicalName1', 'LogicalName1'),))
+    finally:
+      pool.close()
+      pool.join()
+    self.assertIsNone(error)
+    self.assertEquals(
+        ['LogicalName1-FakeSmoothMetric', 'LogicalName1-SmoothMetricRecords',
+         'LogicalName1-FakeLoadingMetric', 'LogicalName1-LoadingMetricRecords',
+         'LogicalName2-FakeSmoothMetric', 'LogicalName2-SmoothMetricRecords',
+         'LogicalName2-FakeLoadingMetric', 'LogicalName2-LoadingMetricRecords'],
+        sorted([v.name for v in values], key=lambda n: n.split('-')[0]))
+    self.assertTrue(all(v.page is None for v in values))
+    self.assertIn('InvalidInteractions', duplicate_error)
+
+  def testComputeTimelineBasedResultsWithModelCache(self):
+    cache_dir = tempfile.mkdtemp()
+    try:
+      trace_data = self._CreateInteractionTraceData('LogicalName1')
+      # pylint: disable=W0212
+      values, error = tbm_module._ComputeTimelineBasedResults(
+          trace_data, cache_dir)
+      self.assertEquals(1, len(os.listdir(cache_dir)))
+      cached_values, cached_error = tbm_module._ComputeTimelineBasedResults(
+          trace_data, cache_dir)
+    finally:
+      shutil.rmtree(cache_dir)
+    self.assertIsNone(error)
+    self.assertIsNone(cached_error)
+    self.assertEquals([v.name for v in values],
+                      [v.name for v in cached_values])
+
+  def testStopBackgroundMetricProcesses(self):
+    measurement = tbm_module.TimelineBasedMeasurement(
+        tbm_module.Options(background_metric_processes=1))
+    measurement.StartBackgroundMetricProcesses()
+    workers = measurement._metric_pool._pool  # pylint: disable=W0212
+    ps = page_set.PageSet(file_path=os.path.dirname(__file__))
+    ps.AddUserStory(page_module.Page(
+        'http://www.bar.com/', ps, ps.base_dir))
+    results = page_test_results.PageTestResults()
+    results.WillRunPage(ps.pages[0])
+    measurement._AddResultsInBackground(  # pylint: disable=W0212
+        self._CreateInteractionTraceData('LogicalName1'), results)
+    results.DidRunPage(ps.pages[0])
+
+    measurement.StopBackgroundMetricProcesses()
+    self.assertIsNone(measurement._metric_pool)  # pylint: disable=W0212
+    self.assertFalse(any(worker.is_alive() for worker in workers))
+    results.WaitForDeferredValues()
+    self.assertEquals(4, len(results.all_page_specific_values))
+    self.assertTrue(all(v.page is ps.pages[0]
+                        for v in results.all_page_specific_values))
+
   def testDuplicateRepeatableInteractions(self):
     d = TimelineBasedMetricTestData()
     d.AddInteraction(d.renderer_thread, ts=10, duration=5,
@@ -27,3 +27,7 @@ class TimelineBasedPageTest(page_test.PageTest):
   def CleanUpAfterPage(self, page, tab):
     tracing_controller = tab.browser.platform.tracing_controller
     self._measurement.DidRunUserStory(tracing_controller)
+
+  def DidRunTest(self, browser, results):
+    super(TimelineBasedPageTest, self).DidRunTest(browser, results)
+    self._measurement.StopBackgroundMetricProcesses()